@@ -2,7 +2,7 @@ import streamlit as st
 import sqlite3
 import os
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 import plotly.express as px
 import pandas as pd
 import uuid
@@ -10,6 +10,35 @@ import google.generativeai as genai
 from typing import Dict, List, Optional
 import time
 import hashlib
+import html
+import string
+from booking_slots import (
+    TIME_SLOTS, SLOT_MINUTES, init_slot_db, get_booking_dates, get_slot_availability,
+    get_slot_span, slot_fits, format_time_slot, format_minutes, get_booking_minutes,
+    create_booking, update_booking_status, update_booking_statuses,
+    show_availability_calendar, get_waitlist, generate_booking_id, get_idempotency_key,
+    get_booking_items, get_service_item_counts, get_bookings_page, search_bookings,
+    get_latest_booking_events, get_user_bookings_version, BOOKING_STATUSES,
+    ALLOWED_STATUS_TRANSITIONS, STATUS_CHANGE_TARGETS
+)
+from bays import (
+    BAYS, init_bay_db, start_bay_job, stop_bay_job, get_jobs_running_at,
+    get_bay_idle_gaps, get_bay_utilization
+)
+from durations import init_duration_db, refresh_duration_model, get_duration_table
+from notifications import (
+    init_outbox_db, start_notification_sender, queue_due_reminders,
+    get_outbox_summary, get_failed_notifications, retry_failed_notifications
+)
+from roster import init_roster_db, generate_roster, get_forecast_table, get_roster
+from scheduling import (
+    SERVICE_TYPES, init_assignment_db, set_staff_skills, assign_jobs,
+    get_assignments, get_mechanic_schedule
+)
+from vehicles import (
+    init_vehicle_db, get_vehicle, get_user_vehicles, normalize_plate, search_vehicles,
+    refresh_due_list, get_vehicles_due
+)
 
 # Load environment variables
 load_dotenv('api.env')
@@ -250,7 +279,81 @@ def init_db():
                   last_service_date DATE,
                   last_service_km INTEGER,
                   service_items TEXT,
-                  additional_notes TEXT)''')
+                  additional_notes TEXT,
+                  user_id TEXT REFERENCES users(user_id),
+                  vehicle_id INTEGER REFERENCES vehicles(vehicle_id),
+                  plate_number TEXT,
+                  slot_minutes INTEGER,
+                  idempotency_key TEXT)''')
+    
+    # Link bookings to the customer account that made them
+    if add_column_if_missing(c, 'bookings', 'user_id', 'TEXT REFERENCES users(user_id)'):
+        # Bookings made before accounts were linked match on the username
+        c.execute("""
+            UPDATE bookings SET user_id = (
+                SELECT u.user_id FROM users u
+                WHERE u.username = bookings.customer_name COLLATE NOCASE
+                  AND u.role = 'customer'
+            )
+        """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bookings_user ON bookings(user_id, booking_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bookings_date ON bookings(booking_date, booking_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status, booking_date, booking_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bookings_customer ON bookings(customer_name COLLATE NOCASE)")
+    
+    # Store each booking's service items as rows (replaces comma-joined service_items)
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'booking_items'")
+    migrate_booking_items = c.fetchone() is None
+    c.execute('''CREATE TABLE IF NOT EXISTS booking_items
+                 (booking_id TEXT NOT NULL REFERENCES bookings(booking_id),
+                  item TEXT NOT NULL,
+                  PRIMARY KEY (booking_id, item))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_booking_items_item ON booking_items(item, booking_id)")
+    if migrate_booking_items:
+        c.execute("SELECT booking_id, service_items FROM bookings WHERE service_items IS NOT NULL")
+        c.executemany(
+            "INSERT OR IGNORE INTO booking_items (booking_id, item) VALUES (?, ?)",
+            [(booking_id, item.strip())
+             for booking_id, service_items in c.fetchall()
+             for item in service_items.split(',') if item.strip()]
+        )
+    
+    # Create the vehicle registry and its service timelines
+    add_column_if_missing(c, 'bookings', 'vehicle_id', 'INTEGER REFERENCES vehicles(vehicle_id)')
+    init_vehicle_db(c)
+    
+    # Canonical plate number for indexed lookups of free-text vehicle numbers
+    if add_column_if_missing(c, 'bookings', 'plate_number', 'TEXT'):
+        c.execute("SELECT booking_id, vehicle_number FROM bookings")
+        c.executemany("UPDATE bookings SET plate_number = ? WHERE booking_id = ?",
+                      [(normalize_plate(vehicle_number), booking_id)
+                       for booking_id, vehicle_number in c.fetchall()])
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bookings_plate ON bookings(plate_number, booking_date)")
+    
+    # Bay minutes each booking reserves in its slot (older bookings took a whole bay)
+    if add_column_if_missing(c, 'bookings', 'slot_minutes', 'INTEGER'):
+        c.execute("UPDATE bookings SET slot_minutes = ?", (SLOT_MINUTES,))
+    
+    # Form submission keys, so a repeated submit cannot book twice
+    add_column_if_missing(c, 'bookings', 'idempotency_key', 'TEXT')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_bookings_idempotency_key
+                 ON bookings (idempotency_key) WHERE idempotency_key IS NOT NULL''')
+    
+    # Create per-slot capacity counters and the job duration model
+    init_slot_db(c)
+    init_duration_db(c)
+    
+    # Create bay job tracking and utilization rollups
+    init_bay_db(c)
+    
+    # Create the staff shift roster
+    init_roster_db(c)
+    
+    # Create mechanic skills and job assignments
+    init_assignment_db(c)
+    
+    # Create the customer email outbox
+    init_outbox_db(c)
     
     conn.commit()
     conn.close()
@@ -258,6 +361,23 @@ def init_db():
     # Separate database for inventory
     init_inventory_db()
 
+def add_column_if_missing(c, table, column, definition):
+    """Add a column to an existing table (simple schema migration), returning True if added"""
+    c.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in c.fetchall()]:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+    return False
+
+# Stock ledger configuration
+STOCK_MOVEMENT_TYPES = ["RECEIPT", "CONSUMPTION", "ADJUSTMENT", "DELETE", "TRANSFER"]
+STOCK_SNAPSHOT_INTERVAL = 50  # Movements per item between stock snapshots
+STOCK_LOCATIONS = ["Back Store", "Bay 1", "Bay 2", "Bay 3"]
+DEFAULT_STOCK_LOCATION = "Back Store"
+LOT_TRACKED_CATEGORIES = ["Fluids"]  # Categories received in lots with expiry dates
+NEAR_EXPIRY_DAYS = 30
+SCAN_BATCH_SIZE = 25  # Scans buffered before they are committed together
+
 def init_inventory_db():
     """Initialize the inventory database"""
     conn = sqlite3.connect('inventory.db')
@@ -273,7 +393,19 @@ def init_inventory_db():
                   min_stock INTEGER DEFAULT 0, 
                   description TEXT DEFAULT '', 
                   status TEXT DEFAULT 'In Stock',
-                  last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+                  last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  sku TEXT,
+                  idempotency_key TEXT)''')
+    
+    # SKU/barcode lookups for the scan-in path
+    add_column_if_missing(c, 'inventory', 'sku', 'TEXT')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_sku
+                 ON inventory (sku)''')
+    
+    # Form submission keys, so a repeated "Add Item" cannot insert twice
+    add_column_if_missing(c, 'inventory', 'idempotency_key', 'TEXT')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_idempotency_key
+                 ON inventory (idempotency_key) WHERE idempotency_key IS NOT NULL''')
     
     # Create inventory history table
     c.execute('''CREATE TABLE IF NOT EXISTS inventory_history
@@ -287,9 +419,614 @@ def init_inventory_db():
                   timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                   FOREIGN KEY (inventory_id) REFERENCES inventory(id))''')
     
+    # Create append-only stock ledger; inventory.quantity is a cache of it
+    c.execute('''CREATE TABLE IF NOT EXISTS stock_movements
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  inventory_id INTEGER NOT NULL,
+                  movement_type TEXT NOT NULL,
+                  quantity_delta INTEGER NOT NULL,
+                  reference TEXT,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  location TEXT NOT NULL DEFAULT 'Back Store',
+                  FOREIGN KEY (inventory_id) REFERENCES inventory(id))''')
+    add_column_if_missing(c, 'stock_movements', 'location', "TEXT NOT NULL DEFAULT 'Back Store'")
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_stock_movements_item
+                 ON stock_movements (inventory_id, id)''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS stock_movements_no_update
+                 BEFORE UPDATE ON stock_movements
+                 BEGIN SELECT RAISE(ABORT, 'stock_movements is append-only'); END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS stock_movements_no_delete
+                 BEFORE DELETE ON stock_movements
+                 BEGIN SELECT RAISE(ABORT, 'stock_movements is append-only'); END''')
+    
+    # Create per-item stock snapshots taken every STOCK_SNAPSHOT_INTERVAL movements
+    c.execute('''CREATE TABLE IF NOT EXISTS stock_snapshots
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  inventory_id INTEGER NOT NULL,
+                  quantity INTEGER NOT NULL,
+                  last_movement_id INTEGER NOT NULL,
+                  created_at TIMESTAMP NOT NULL,
+                  FOREIGN KEY (inventory_id) REFERENCES inventory(id))''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_stock_snapshots_item
+                 ON stock_snapshots (inventory_id, last_movement_id)''')
+    
+    # Record opening balances for items that predate the ledger
+    c.execute("""
+        INSERT INTO stock_movements (
+            inventory_id, movement_type, quantity_delta, reference, created_at
+        )
+        SELECT id, 'RECEIPT', quantity, 'Opening balance',
+               COALESCE(last_updated, CURRENT_TIMESTAMP)
+        FROM inventory
+        WHERE quantity != 0
+          AND id NOT IN (SELECT inventory_id FROM stock_movements)
+    """)
+    
+    # Create per-location stock; inventory.quantity holds the running total
+    c.execute('''CREATE TABLE IF NOT EXISTS stock_locations
+                 (inventory_id INTEGER NOT NULL,
+                  location TEXT NOT NULL,
+                  quantity INTEGER NOT NULL DEFAULT 0,
+                  min_stock INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (inventory_id, location),
+                  FOREIGN KEY (inventory_id) REFERENCES inventory(id))''')
+    
+    # Create lots with expiry dates; partial indexes only cover lots with stock left
+    c.execute('''CREATE TABLE IF NOT EXISTS stock_lots
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  inventory_id INTEGER NOT NULL,
+                  lot_number TEXT NOT NULL,
+                  location TEXT NOT NULL,
+                  quantity INTEGER NOT NULL,
+                  expiry_date DATE NOT NULL,
+                  received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (inventory_id) REFERENCES inventory(id))''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_stock_lots_expiry
+                 ON stock_lots (expiry_date) WHERE quantity > 0''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_stock_lots_pick
+                 ON stock_lots (inventory_id, location, expiry_date) WHERE quantity > 0''')
+    
+    # Create service kits (bill of materials) mapping service items to parts
+    c.execute('''CREATE TABLE IF NOT EXISTS service_kit_parts
+                 (service_item TEXT NOT NULL,
+                  inventory_id INTEGER NOT NULL,
+                  quantity INTEGER NOT NULL CHECK (quantity > 0),
+                  PRIMARY KEY (service_item, inventory_id),
+                  FOREIGN KEY (inventory_id) REFERENCES inventory(id))''')
+    
+    # Version counter bumped by every kit change, used as a cache key
+    c.execute('''CREATE TABLE IF NOT EXISTS data_versions
+                 (name TEXT PRIMARY KEY,
+                  version INTEGER NOT NULL DEFAULT 0)''')
+    c.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('service_kits', 0)")
+    
+    # Place stock that predates locations in the default location
+    c.execute("""
+        INSERT INTO stock_locations (inventory_id, location, quantity)
+        SELECT id, ?, quantity FROM inventory
+        WHERE id NOT IN (SELECT inventory_id FROM stock_locations)
+    """, (DEFAULT_STOCK_LOCATION,))
+    
     conn.commit()
     conn.close()
 
+def record_stock_movements(c, movements):
+    """
+    Append movements to the stock ledger and apply them to the cached
+    per-location quantities and the inventory.quantity totals.
+    
+    The caller owns the transaction, so the ledger rows and the cached
+    quantities are committed (or rolled back) together. Outgoing movements
+    (other than transfers, which move their lots explicitly) draw down the
+    item's lots at that location first-expiring-first-out.
+    
+    Args:
+        c: Cursor on inventory.db
+        movements (List[tuple]): (inventory_id, movement_type, quantity_delta,
+            reference, location)
+        
+    Returns:
+        List[tuple]: Lots drawn down as (inventory_id, location, lot_number,
+            expiry_date, quantity)
+    """
+    for _, movement_type, _, _, location in movements:
+        if movement_type not in STOCK_MOVEMENT_TYPES:
+            raise ValueError(f"Unknown stock movement type: {movement_type}")
+        if location not in STOCK_LOCATIONS:
+            raise ValueError(f"Unknown stock location: {location}")
+    
+    c.executemany("""
+        INSERT INTO stock_movements (
+            inventory_id, movement_type, quantity_delta, reference, location
+        ) VALUES (?, ?, ?, ?, ?)
+    """, movements)
+    
+    # Apply the net change per (item, location) and per item to the caches
+    location_deltas = {}
+    net_deltas = {}
+    for item_id, _, delta, _, location in movements:
+        location_deltas[(item_id, location)] = location_deltas.get((item_id, location), 0) + delta
+        net_deltas[item_id] = net_deltas.get(item_id, 0) + delta
+    c.executemany("""
+        INSERT INTO stock_locations (inventory_id, location, quantity)
+        VALUES (?, ?, ?)
+        ON CONFLICT (inventory_id, location)
+        DO UPDATE SET quantity = quantity + excluded.quantity
+    """, [(item_id, location, delta) for (item_id, location), delta in location_deltas.items()])
+    c.executemany("""
+        UPDATE inventory
+        SET quantity = quantity + ?,
+            status = CASE
+                WHEN quantity + ? <= 0 THEN 'Out of Stock'
+                WHEN status = 'Out of Stock' THEN 'In Stock'
+                ELSE status
+            END,
+            last_updated = CURRENT_TIMESTAMP
+        WHERE id = ?
+    """, [(delta, delta, item_id) for item_id, delta in net_deltas.items()])
+    
+    for item_id in net_deltas:
+        take_stock_snapshot(c, item_id)
+    
+    picked_lots = []
+    for item_id, movement_type, delta, _, location in movements:
+        if delta < 0 and movement_type != "TRANSFER":
+            for lot_number, expiry_date, quantity in pick_stock_lots(c, item_id, -delta, location):
+                picked_lots.append((item_id, location, lot_number, expiry_date, quantity))
+    return picked_lots
+
+def record_stock_movement(c, item_id, movement_type, quantity_delta, reference=None,
+                          location=DEFAULT_STOCK_LOCATION):
+    """Append a single movement to the stock ledger"""
+    return record_stock_movements(c, [(item_id, movement_type, quantity_delta, reference, location)])
+
+def pick_stock_lots(c, item_id, quantity, location):
+    """
+    Draw quantity down from an item's lots at a location, earliest expiry first.
+    
+    Stock that predates lot tracking is not in any lot, so fewer units than
+    requested may be picked.
+    
+    Returns:
+        List[tuple]: (lot_number, expiry_date, quantity) per lot drawn down
+    """
+    c.execute("""
+        SELECT id, lot_number, expiry_date, quantity FROM stock_lots
+        WHERE inventory_id = ? AND location = ? AND quantity > 0
+        ORDER BY expiry_date, id
+    """, (item_id, location))
+    
+    picks = []
+    for lot_id, lot_number, expiry_date, lot_quantity in c.fetchall():
+        if quantity <= 0:
+            break
+        take = min(quantity, lot_quantity)
+        c.execute("UPDATE stock_lots SET quantity = quantity - ? WHERE id = ?", (take, lot_id))
+        picks.append((lot_number, expiry_date, take))
+        quantity -= take
+    return picks
+
+def receive_stock_lot(item_id, lot_number, quantity, expiry_date, location=DEFAULT_STOCK_LOCATION):
+    """Receive a lot with an expiry date and record the receipt in the ledger"""
+    if quantity <= 0:
+        return False, "Lot quantity must be positive"
+    if not lot_number:
+        return False, "Lot number is required"
+    
+    try:
+        conn = sqlite3.connect('inventory.db')
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO stock_lots (inventory_id, lot_number, location, quantity, expiry_date)
+            VALUES (?, ?, ?, ?, ?)
+        """, (item_id, lot_number, location, quantity, expiry_date.isoformat()))
+        record_stock_movement(c, item_id, "RECEIPT", quantity, f"Lot {lot_number}", location)
+        conn.commit()
+        conn.close()
+        return True, f"Lot {lot_number} received"
+    except Exception as e:
+        return False, str(e)
+
+def consume_stock(item_id, quantity, location=DEFAULT_STOCK_LOCATION, reference=None):
+    """Consume stock at a location, picking lots first-expiring-first-out"""
+    try:
+        conn = sqlite3.connect('inventory.db')
+        c = conn.cursor()
+        
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("""
+            SELECT COALESCE(SUM(quantity), 0) FROM stock_locations
+            WHERE inventory_id = ? AND location = ?
+        """, (item_id, location))
+        available = c.fetchone()[0]
+        if available < quantity:
+            conn.rollback()
+            return False, f"Only {available} available at {location}"
+        
+        picked_lots = record_stock_movement(c, item_id, "CONSUMPTION", -quantity, reference, location)
+        conn.commit()
+        return True, picked_lots
+    except Exception as e:
+        return False, str(e)
+    finally:
+        conn.close()
+
+def get_near_expiry_lots(days=NEAR_EXPIRY_DAYS):
+    """Get lots with stock left that expire within the given number of days (served by the expiry index)"""
+    cutoff = (datetime.now().date() + timedelta(days=days)).isoformat()
+    conn = sqlite3.connect('inventory.db')
+    lots_df = pd.read_sql_query("""
+        SELECT l.expiry_date, i.name, l.lot_number, l.location, l.quantity
+        FROM stock_lots l
+        JOIN inventory i ON i.id = l.inventory_id
+        WHERE l.quantity > 0 AND l.expiry_date <= ?
+        ORDER BY l.expiry_date
+    """, conn, params=(cutoff,))
+    conn.close()
+    return lots_df
+
+def transfer_stock(item_id, from_location, to_location, quantity):
+    """Move stock between locations in one transaction; the item total is unchanged"""
+    if from_location == to_location:
+        return False, "Source and destination must be different locations"
+    if quantity <= 0:
+        return False, "Transfer quantity must be positive"
+    
+    try:
+        conn = sqlite3.connect('inventory.db')
+        c = conn.cursor()
+        
+        # Lock the database so the availability check and the transfer are atomic
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("""
+            SELECT quantity FROM stock_locations
+            WHERE inventory_id = ? AND location = ?
+        """, (item_id, from_location))
+        row = c.fetchone()
+        available = row[0] if row else 0
+        if available < quantity:
+            conn.rollback()
+            return False, f"Only {available} available at {from_location}"
+        
+        reference = f"Transfer {from_location} → {to_location}"
+        record_stock_movements(c, [
+            (item_id, "TRANSFER", -quantity, reference, from_location),
+            (item_id, "TRANSFER", quantity, reference, to_location)
+        ])
+        
+        # Lots travel with the stock, earliest expiry first
+        c.executemany("""
+            INSERT INTO stock_lots (inventory_id, lot_number, location, quantity, expiry_date)
+            VALUES (?, ?, ?, ?, ?)
+        """, [
+            (item_id, lot_number, to_location, lot_quantity, expiry_date)
+            for lot_number, expiry_date, lot_quantity in pick_stock_lots(c, item_id, quantity, from_location)
+        ])
+        conn.commit()
+        return True, f"Moved {quantity} from {from_location} to {to_location}"
+    except Exception as e:
+        return False, str(e)
+    finally:
+        conn.close()
+
+def get_location_stock(item_id):
+    """Get an item's stock per location"""
+    conn = sqlite3.connect('inventory.db')
+    location_df = pd.read_sql_query("""
+        SELECT location, quantity, min_stock FROM stock_locations
+        WHERE inventory_id = ?
+        ORDER BY location
+    """, conn, params=(item_id,))
+    conn.close()
+    return location_df
+
+def update_location_min_stock(item_id, min_stock_by_location):
+    """Set per-location minimum stock levels for an item"""
+    try:
+        conn = sqlite3.connect('inventory.db')
+        c = conn.cursor()
+        c.executemany("""
+            INSERT INTO stock_locations (inventory_id, location, min_stock)
+            VALUES (?, ?, ?)
+            ON CONFLICT (inventory_id, location)
+            DO UPDATE SET min_stock = excluded.min_stock
+        """, [(item_id, location, int(min_stock)) for location, min_stock in min_stock_by_location.items()])
+        conn.commit()
+        conn.close()
+        return True, "Minimum stock levels updated"
+    except Exception as e:
+        return False, str(e)
+
+def get_location_stock_alerts():
+    """Get (item, location) pairs at or below their per-location minimum stock"""
+    conn = sqlite3.connect('inventory.db')
+    alerts_df = pd.read_sql_query("""
+        SELECT i.name, i.category, l.location, l.quantity, l.min_stock
+        FROM stock_locations l
+        JOIN inventory i ON i.id = l.inventory_id
+        WHERE l.min_stock > 0 AND l.quantity <= l.min_stock
+        ORDER BY l.location, i.name
+    """, conn)
+    conn.close()
+    return alerts_df
+
+def take_stock_snapshot(c, item_id, force=False):
+    """Snapshot an item's stock once enough movements have accumulated since the last one"""
+    c.execute("""
+        SELECT quantity, last_movement_id FROM stock_snapshots
+        WHERE inventory_id = ?
+        ORDER BY last_movement_id DESC LIMIT 1
+    """, (item_id,))
+    snapshot = c.fetchone()
+    base_quantity, last_movement_id = snapshot if snapshot else (0, 0)
+    
+    c.execute("""
+        SELECT COUNT(*), COALESCE(SUM(quantity_delta), 0), MAX(id), MAX(created_at)
+        FROM stock_movements
+        WHERE inventory_id = ? AND id > ?
+    """, (item_id, last_movement_id))
+    count, delta, max_id, max_created_at = c.fetchone()
+    
+    if count and (force or count >= STOCK_SNAPSHOT_INTERVAL):
+        c.execute("""
+            INSERT INTO stock_snapshots (
+                inventory_id, quantity, last_movement_id, created_at
+            ) VALUES (?, ?, ?, ?)
+        """, (item_id, base_quantity + delta, max_id, max_created_at))
+
+def get_stock_level(c, item_id):
+    """Get an item's current stock from its latest snapshot plus the movements since"""
+    c.execute("""
+        SELECT
+            COALESCE(s.quantity, 0) + COALESCE((
+                SELECT SUM(m.quantity_delta) FROM stock_movements m
+                WHERE m.inventory_id = ? AND m.id > COALESCE(s.last_movement_id, 0)
+            ), 0)
+        FROM (SELECT 1) LEFT JOIN (
+            SELECT quantity, last_movement_id FROM stock_snapshots
+            WHERE inventory_id = ?
+            ORDER BY last_movement_id DESC LIMIT 1
+        ) s
+    """, (item_id, item_id))
+    return c.fetchone()[0]
+
+def get_stock_levels_as_of(as_of):
+    """
+    Get the stock level of every item that has ledger entries as of a point in time.
+    
+    Each item starts from its latest snapshot taken at or before as_of and
+    adds only the (at most STOCK_SNAPSHOT_INTERVAL) movements recorded after it.
+    
+    Args:
+        as_of (datetime | date): Local point in time; a date means the end of that day
+        
+    Returns:
+        pd.DataFrame: inventory_id, name, category, quantity
+    """
+    if not isinstance(as_of, datetime):
+        as_of = datetime.combine(as_of, datetime.max.time())
+    # Ledger timestamps come from CURRENT_TIMESTAMP, which is UTC
+    as_of = as_of.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    
+    conn = sqlite3.connect('inventory.db')
+    levels_df = pd.read_sql_query("""
+        SELECT
+            items.inventory_id,
+            COALESCE(i.name, 'Deleted item #' || items.inventory_id) AS name,
+            i.category,
+            COALESCE(s.quantity, 0) + COALESCE((
+                SELECT SUM(m.quantity_delta) FROM stock_movements m
+                WHERE m.inventory_id = items.inventory_id
+                  AND m.id > COALESCE(s.last_movement_id, 0)
+                  AND m.created_at <= :as_of
+            ), 0) AS quantity
+        FROM (SELECT DISTINCT inventory_id FROM stock_movements) items
+        LEFT JOIN stock_snapshots s ON s.id = (
+            SELECT s2.id FROM stock_snapshots s2
+            WHERE s2.inventory_id = items.inventory_id AND s2.created_at <= :as_of
+            ORDER BY s2.last_movement_id DESC LIMIT 1
+        )
+        LEFT JOIN inventory i ON i.id = items.inventory_id
+        ORDER BY name
+    """, conn, params={"as_of": as_of})
+    conn.close()
+    return levels_df
+
+def normalize_sku(sku):
+    """Normalize a typed or scanned SKU/barcode; blank values become None"""
+    if sku is None or pd.isna(sku):
+        return None
+    sku = str(sku).strip().upper()
+    return sku or None
+
+def apply_stock_scans(scans, location=DEFAULT_STOCK_LOCATION):
+    """
+    Apply a batch of barcode scans to stock as one group commit.
+    
+    Scans of the same SKU are folded together, all SKUs are resolved with a
+    single lookup on the unique SKU index, and the resulting movements are
+    written to the ledger in one transaction.
+    
+    Args:
+        scans (List[tuple]): (sku, quantity_delta) per scan; positive deltas are
+            receipts, negative deltas are consumption
+        location (str): Stock location the scans apply to
+        
+    Returns:
+        tuple: (success, result) where result holds applied/unknown/rejected SKUs
+    """
+    net_deltas = {}
+    for sku, delta in scans:
+        sku = normalize_sku(sku)
+        if sku:
+            net_deltas[sku] = net_deltas.get(sku, 0) + delta
+    
+    result = {"applied": {}, "unknown": [], "rejected": []}
+    if not net_deltas:
+        return True, result
+    
+    try:
+        conn = sqlite3.connect('inventory.db')
+        c = conn.cursor()
+        
+        placeholders = ", ".join("?" * len(net_deltas))
+        c.execute(f"""
+            SELECT i.sku, i.id, COALESCE(l.quantity, 0)
+            FROM inventory i
+            LEFT JOIN stock_locations l ON l.inventory_id = i.id AND l.location = ?
+            WHERE i.sku IN ({placeholders})
+        """, [location] + list(net_deltas))
+        items = {sku: (item_id, quantity) for sku, item_id, quantity in c.fetchall()}
+        
+        movements = []
+        for sku, delta in net_deltas.items():
+            if sku not in items:
+                result["unknown"].append(sku)
+            elif delta == 0:
+                continue
+            elif items[sku][1] + delta < 0:
+                result["rejected"].append(sku)
+            else:
+                movement_type = "RECEIPT" if delta > 0 else "CONSUMPTION"
+                movements.append((items[sku][0], movement_type, delta, "Barcode scan", location))
+                result["applied"][sku] = delta
+        
+        record_stock_movements(c, movements)
+        conn.commit()
+        conn.close()
+        return True, result
+    except Exception as e:
+        return False, str(e)
+
+def queue_stock_scan():
+    """Buffer a scanned SKU and flush the buffer once it reaches SCAN_BATCH_SIZE"""
+    sku = normalize_sku(st.session_state.get('scan_input'))
+    st.session_state.scan_input = ""
+    if not sku:
+        return
+    
+    # Each scan keeps the mode and location it was made with
+    delta = 1 if st.session_state.get('scan_mode', 'Receive') == 'Receive' else -1
+    location = st.session_state.get('scan_location', DEFAULT_STOCK_LOCATION)
+    if 'scan_buffer' not in st.session_state:
+        st.session_state.scan_buffer = []
+    st.session_state.scan_buffer.append((sku, delta, location))
+    
+    if len(st.session_state.scan_buffer) >= SCAN_BATCH_SIZE:
+        flush_stock_scans()
+
+def flush_stock_scans():
+    """Commit all buffered scans in one transaction"""
+    buffer = st.session_state.get('scan_buffer', [])
+    if not buffer:
+        return
+    
+    scans_by_location = {}
+    for sku, delta, location in buffer:
+        scans_by_location.setdefault(location, []).append((sku, delta))
+    
+    combined = {"applied": {}, "unknown": [], "rejected": []}
+    for location, scans in scans_by_location.items():
+        success, result = apply_stock_scans(scans, location)
+        if not success:
+            st.session_state.scan_result = (False, result)
+            return
+        for sku, delta in result["applied"].items():
+            combined["applied"][sku] = combined["applied"].get(sku, 0) + delta
+        combined["unknown"].extend(result["unknown"])
+        combined["rejected"].extend(result["rejected"])
+        st.session_state.scan_buffer = [scan for scan in st.session_state.scan_buffer if scan[2] != location]
+    st.session_state.scan_result = (True, combined)
+
+def get_service_kit(service_item):
+    """Get the parts and quantities needed for one service item"""
+    conn = sqlite3.connect('inventory.db')
+    kit_df = pd.read_sql_query("""
+        SELECT k.inventory_id, i.name, k.quantity
+        FROM service_kit_parts k
+        LEFT JOIN inventory i ON i.id = k.inventory_id
+        WHERE k.service_item = ?
+        ORDER BY i.name
+    """, conn, params=(service_item,))
+    conn.close()
+    return kit_df
+
+def save_service_kit(service_item, parts):
+    """Replace the kit for a service item with the given {inventory_id: quantity} parts"""
+    try:
+        conn = sqlite3.connect('inventory.db')
+        c = conn.cursor()
+        c.execute("DELETE FROM service_kit_parts WHERE service_item = ?", (service_item,))
+        c.executemany("""
+            INSERT INTO service_kit_parts (service_item, inventory_id, quantity)
+            VALUES (?, ?, ?)
+        """, [(service_item, item_id, int(quantity)) for item_id, quantity in parts.items() if quantity > 0])
+        c.execute("UPDATE data_versions SET version = version + 1 WHERE name = 'service_kits'")
+        conn.commit()
+        conn.close()
+        return True, f"Kit for '{service_item}' saved"
+    except Exception as e:
+        return False, str(e)
+
+def get_inventory_version():
+    """
+    Get a version stamp that changes whenever stock or any service kit changes.
+    
+    Every stock change appends to the ledger, so the newest movement id covers
+    quantities; every kit save bumps the service_kits version counter.
+    """
+    conn = sqlite3.connect('inventory.db')
+    c = conn.cursor()
+    c.execute("""
+        SELECT
+            (SELECT COALESCE(MAX(id), 0) FROM stock_movements),
+            (SELECT COALESCE(MAX(version), 0) FROM data_versions WHERE name = 'service_kits')
+    """)
+    version = c.fetchone()
+    conn.close()
+    return version
+
+@st.cache_data(max_entries=8)
+def load_kit_availability(inventory_version):
+    """Compute how many times every kit can be fulfilled, cached per inventory version"""
+    conn = sqlite3.connect('inventory.db')
+    c = conn.cursor()
+    # Minimum over each kit's components of (stock on hand // quantity per kit)
+    c.execute("""
+        SELECT k.service_item, MIN(MAX(COALESCE(i.quantity, 0), 0) / k.quantity)
+        FROM service_kit_parts k
+        LEFT JOIN inventory i ON i.id = k.inventory_id
+        GROUP BY k.service_item
+    """)
+    availability = dict(c.fetchall())
+    conn.close()
+    return availability
+
+def get_kit_availability():
+    """Get {service_item: kits available} for every service item that has a kit"""
+    try:
+        return load_kit_availability(get_inventory_version())
+    except Exception:
+        return {}
+
+def get_booked_parts_demand(start_date, end_date):
+    """Get the parts that bookings between two dates will consume, against stock on hand"""
+    conn = sqlite3.connect('inventory.db')
+    conn.execute("ATTACH DATABASE 'vehicle_service.db' AS svc")
+    demand_df = pd.read_sql_query("""
+        SELECT i.name, SUM(k.quantity) AS required, i.quantity AS on_hand
+        FROM svc.booking_items bi
+        JOIN svc.bookings b ON b.booking_id = bi.booking_id
+        JOIN service_kit_parts k ON k.service_item = bi.item
+        JOIN inventory i ON i.id = k.inventory_id
+        WHERE b.booking_date BETWEEN ? AND ?
+          AND b.status IN ('Pending', 'In Progress')
+        GROUP BY i.id
+        ORDER BY required - on_hand DESC
+    """, conn, params=(str(start_date), str(end_date)))
+    conn.close()
+    return demand_df
+
 def delete_inventory_item(item_id):
     """Delete an inventory item and add to history"""
     try:
@@ -301,6 +1038,17 @@ def delete_inventory_item(item_id):
         item = c.fetchone()
         
         if item:
+            # Write the remaining stock off in the ledger, location by location
+            c.execute("""
+                SELECT location, quantity FROM stock_locations
+                WHERE inventory_id = ? AND quantity != 0
+            """, (item_id,))
+            record_stock_movements(c, [
+                (item_id, "DELETE", -quantity, "Item deleted", location)
+                for location, quantity in c.fetchall()
+            ])
+            c.execute("DELETE FROM stock_locations WHERE inventory_id = ?", (item_id,))
+            
             # Add to history
             c.execute("""
                 INSERT INTO inventory_history (
@@ -316,8 +1064,11 @@ def delete_inventory_item(item_id):
                 0
             ))
             
-            # Delete the item
+            # Delete the item and drop it from the service kits using it
             c.execute("DELETE FROM inventory WHERE id = ?", (item_id,))
+            c.execute("DELETE FROM service_kit_parts WHERE inventory_id = ?", (item_id,))
+            if c.rowcount:
+                c.execute("UPDATE data_versions SET version = version + 1 WHERE name = 'service_kits'")
             conn.commit()
             return True, "Item deleted successfully"
         else:
@@ -330,7 +1081,7 @@ def delete_inventory_item(item_id):
 def validate_inventory_csv(df):
     """Validate the CSV data for inventory import"""
     required_columns = ['name', 'category', 'quantity', 'price', 'min_stock']
-    optional_columns = ['description']
+    optional_columns = ['description', 'sku']
     
     # Check required columns
     missing_columns = [col for col in required_columns if col not in df.columns]
@@ -353,6 +1104,12 @@ def validate_inventory_csv(df):
     if df['name'].isnull().any() or df['category'].isnull().any():
         return False, "Empty values found in name or category columns"
     
+    # Validate SKUs are unique within the file
+    if 'sku' in df.columns:
+        skus = df['sku'].map(normalize_sku).dropna()
+        if skus.duplicated().any():
+            return False, f"Duplicate SKUs found: {', '.join(skus[skus.duplicated()].unique())}"
+    
     return True, "CSV validation successful"
 
 def import_inventory_from_csv(df):
@@ -371,21 +1128,25 @@ def import_inventory_from_csv(df):
                 c.execute("""
                     INSERT INTO inventory (
                         name, category, quantity, price, 
-                        min_stock, description, status, last_updated
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                        min_stock, description, status, sku, last_updated
+                    ) VALUES (?, ?, 0, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
                 """, (
                     row['name'],
                     row['category'],
-                    int(row['quantity']),
                     float(row['price']),
                     int(row['min_stock']),
                     row.get('description', ''),
-                    'In Stock' if int(row['quantity']) > 0 else 'Out of Stock'
+                    'In Stock' if int(row['quantity']) > 0 else 'Out of Stock',
+                    normalize_sku(row.get('sku'))
                 ))
                 
                 # Get the inserted item's ID
                 item_id = c.lastrowid
                 
+                # Receive the initial stock through the ledger
+                if int(row['quantity']):
+                    record_stock_movement(c, item_id, "RECEIPT", int(row['quantity']), "CSV import")
+                
                 # Add to history
                 c.execute("""
                     INSERT INTO inventory_history (
@@ -425,7 +1186,7 @@ def show_admin_dashboard():
             st.rerun()
     
     # Create tabs for different admin functions
-    tabs = st.tabs(["Staff Management", "Inventory Management", "Booking Management", "AI Assistant"])
+    tabs = st.tabs(["Staff Management", "Inventory Management", "Booking Management", "Service Bays", "AI Assistant"])
     
     with tabs[0]:  # Staff Management
         st.header("Staff Management")
@@ -436,13 +1197,18 @@ def show_admin_dashboard():
             staff_name = st.text_input("Staff Name")
             staff_duty = st.selectbox("Duty", ["Mechanic", "Helper", "Manager", "Receptionist"])
             staff_salary = st.number_input("Salary", min_value=0.0, step=1000.0)
+            staff_skills = st.multiselect("Skills (Mechanics)", SERVICE_TYPES,
+                                          help="Leave empty for a mechanic who handles every service type")
             submit_staff = st.form_submit_button("Add Staff")
             
             if submit_staff and staff_name and staff_salary > 0:
                 conn = sqlite3.connect('vehicle_service.db')
                 c = conn.cursor()
+                staff_id = str(uuid.uuid4())
                 c.execute("INSERT INTO staff (staff_id, name, duty, salary) VALUES (?, ?, ?, ?)",
-                         (str(uuid.uuid4()), staff_name, staff_duty, staff_salary))
+                         (staff_id, staff_name, staff_duty, staff_salary))
+                if staff_duty == "Mechanic":
+                    set_staff_skills(c, staff_id, staff_skills)
                 conn.commit()
                 conn.close()
                 st.success("Staff member added successfully!")
@@ -455,13 +1221,92 @@ def show_admin_dashboard():
         if not staff_df.empty:
             st.write("Current Staff Members:")
             st.dataframe(staff_df)
+        
+        # Job assignments
+        st.subheader("Job Assignments")
+        assignment_date = st.date_input("Assignment Date", value=datetime.now().date(),
+                                        key="assignment_date")
+        if st.button("Auto-assign Pending Jobs"):
+            success, message = assign_jobs(assignment_date, st.session_state['user']['username'])
+            if success:
+                st.success(message)
+            else:
+                st.error(message)
+        
+        assignments_df = get_assignments(assignment_date)
+        if not assignments_df.empty:
+            st.dataframe(assignments_df, hide_index=True, use_container_width=True)
+            st.write("Assigned minutes per mechanic:")
+            st.bar_chart(assignments_df.groupby('mechanic')['expected_minutes'].sum())
+        else:
+            st.info("No jobs assigned for this date.")
+        
+        mechanics_df = staff_df[staff_df['duty'] == 'Mechanic'] if not staff_df.empty else staff_df
+        if not mechanics_df.empty:
+            mechanic_id = st.selectbox(
+                "Mechanic Schedule (next 7 days)",
+                mechanics_df['staff_id'].tolist(),
+                format_func=lambda x: mechanics_df.set_index('staff_id').at[x, 'name']
+            )
+            schedule_df = get_mechanic_schedule(mechanic_id, assignment_date,
+                                                assignment_date + timedelta(days=7))
+            if not schedule_df.empty:
+                st.dataframe(schedule_df, hide_index=True, use_container_width=True)
+            else:
+                st.info("No jobs assigned to this mechanic.")
+        
+        # Job duration estimates used for slot capacity and assignment
+        with st.expander("Job Duration Estimates"):
+            st.write("Median and 90th percentile minutes per service item, learned from "
+                     "In Progress to Completed times once enough jobs are recorded.")
+            if st.button("Relearn Durations"):
+                learned = refresh_duration_model()
+                st.success(f"Learned durations for {learned} job type(s).")
+            st.dataframe(get_duration_table(), hide_index=True, use_container_width=True)
+        
+        # Shift roster from forecast demand
+        st.subheader("Shift Roster")
+        col1, col2 = st.columns(2)
+        with col1:
+            roster_start = st.date_input("Roster Start", value=datetime.now().date(), key="roster_start")
+        with col2:
+            roster_days = st.slider("Days", min_value=7, max_value=31, value=28, key="roster_days")
+        
+        with st.expander("Forecast Demand (bay minutes per slot)"):
+            forecast_df = get_forecast_table(roster_start)
+            fig = px.imshow(forecast_df, labels=dict(x="Time Slot", y="Weekday", color="Bay Minutes"),
+                            color_continuous_scale="Blues", aspect="auto")
+            st.plotly_chart(fig, use_container_width=True)
+        
+        if st.button("Generate Roster"):
+            success, message, shortfalls_df = generate_roster(roster_start, roster_days)
+            if success:
+                st.success(message)
+                if not shortfalls_df.empty:
+                    st.warning("Unfilled shifts (hire or reassign staff for these):")
+                    st.dataframe(shortfalls_df, hide_index=True, use_container_width=True)
+            else:
+                st.error(message)
+        
+        roster_df = get_roster(roster_start, roster_start + timedelta(days=roster_days - 1))
+        if not roster_df.empty:
+            st.dataframe(
+                roster_df.pivot_table(index=['duty', 'name'], columns='shift_date',
+                                      values='shift', aggfunc='first', fill_value=''),
+                use_container_width=True
+            )
+            st.write("Rostered hours per staff member:")
+            st.dataframe(roster_df.groupby(['duty', 'name'])['hours'].sum().reset_index(),
+                         hide_index=True, use_container_width=True)
+        else:
+            st.info("No roster for these dates yet.")
     
     with tabs[1]:  # Inventory Management
         st.header("Inventory Management")
         st.write("Manage your inventory here")
         
         # Create tabs for different inventory functions
-        inventory_tabs = st.tabs(["Add Items", "View Inventory", "Stock Alerts", "Analytics"])
+        inventory_tabs = st.tabs(["Add Items", "View Inventory", "Stock Alerts", "Analytics", "Scan Stock", "Locations", "Lots & Expiry", "Service Kits"])
         
         with inventory_tabs[0]:  # Add Items
             st.subheader("Add New Inventory Item")
@@ -476,6 +1321,7 @@ def show_admin_dashboard():
             - price (required): Item price
             - min_stock (required): Minimum stock level
             - description (optional): Item description
+            - sku (optional): Unique SKU/barcode
             """)
             
             uploaded_file = st.file_uploader("Upload CSV file", type=['csv'])
@@ -522,6 +1368,8 @@ def show_admin_dashboard():
                         "Body Parts", "Filters", "Fluids", "Tools", "Accessories"
                     ])
                     quantity = st.number_input("Quantity", min_value=0, step=1)
+                    sku = st.text_input("SKU / Barcode", placeholder="Scan or type the SKU (optional)")
+                    location = st.selectbox("Location", STOCK_LOCATIONS)
                 
                 with col2:
                     price = st.number_input("Price (₹)", min_value=0.0, step=0.01)
@@ -531,6 +1379,10 @@ def show_admin_dashboard():
                 description = st.text_area("Description", placeholder="Enter item description")
                 
                 submit_inventory = st.form_submit_button("Add Item")
+                submission_key = get_idempotency_key(
+                    "add_inventory_form", item_name, category, quantity, sku,
+                    location, price, min_stock, status, description
+                )
                 
                 if submit_inventory:
                     try:
@@ -541,33 +1393,46 @@ def show_admin_dashboard():
                         conn = sqlite3.connect('inventory.db')
                         c = conn.cursor()
                         
-                        # Insert into inventory
-                        c.execute("""
-                            INSERT INTO inventory (
-                                name, category, quantity, price, 
-                                min_stock, description, status, last_updated
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                        """, (
-                            item_name, category, quantity, price,
-                            min_stock, description, status
-                        ))
-                        
-                        # Get the inserted item's ID
-                        item_id = c.lastrowid
-                        
-                        # Add to history
-                        c.execute("""
-                            INSERT INTO inventory_history (
-                                inventory_id, action, new_quantity, new_price
-                            ) VALUES (?, ?, ?, ?)
-                        """, (
-                            item_id, "ADD", quantity, price
-                        ))
-                        
-                        conn.commit()
-                        conn.close()
-                        st.success("Item added successfully!")
-                        st.rerun()
+                        # A repeated submit of the same form is a no-op
+                        c.execute("SELECT id, name FROM inventory WHERE idempotency_key = ?", (submission_key,))
+                        original = c.fetchone()
+                        if original:
+                            conn.close()
+                            st.info(f"{original[1]} was already added (item #{original[0]}).")
+                        else:
+                            # Insert into inventory
+                            c.execute("""
+                                INSERT INTO inventory (
+                                    name, category, quantity, price, 
+                                    min_stock, description, status, sku, last_updated, idempotency_key
+                                ) VALUES (?, ?, 0, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?)
+                            """, (
+                                item_name, category, price,
+                                min_stock, description, status, normalize_sku(sku), submission_key
+                            ))
+                            
+                            # Get the inserted item's ID
+                            item_id = c.lastrowid
+                            
+                            # Receive the initial stock through the ledger
+                            if quantity:
+                                record_stock_movement(c, item_id, "RECEIPT", quantity, "Item added", location)
+                            
+                            # Add to history
+                            c.execute("""
+                                INSERT INTO inventory_history (
+                                    inventory_id, action, new_quantity, new_price
+                                ) VALUES (?, ?, ?, ?)
+                            """, (
+                                item_id, "ADD", quantity, price
+                            ))
+                            
+                            conn.commit()
+                            conn.close()
+                            st.success("Item added successfully!")
+                            st.rerun()
+                    except sqlite3.IntegrityError:
+                        st.error("An item with this SKU already exists!")
                     except Exception as e:
                         st.error(f"Error adding item: {str(e)}")
         
@@ -578,7 +1443,7 @@ def show_admin_dashboard():
             col1, col2, col3 = st.columns(3)
             
             with col1:
-                search_query = st.text_input("🔍 Search Items", placeholder="Search by name, category, or description")
+                search_query = st.text_input("🔍 Search Items", placeholder="Search by name, SKU, category, or description")
             
             with col2:
                 category_filter = st.selectbox(
@@ -637,9 +1502,10 @@ def show_admin_dashboard():
                 else:
                     # Display inventory in a table format
                     st.dataframe(
-                        filtered_df[['name', 'category', 'quantity', 'price', 'status', 'last_updated']],
+                        filtered_df[['name', 'sku', 'category', 'quantity', 'price', 'status', 'last_updated']],
                         column_config={
                             "name": "Item Name",
+                            "sku": "SKU",
                             "category": "Category",
                             "quantity": "Quantity",
                             "price": st.column_config.NumberColumn("Price (₹)", format="₹%.2f"),
@@ -662,6 +1528,7 @@ def show_admin_dashboard():
                             st.markdown(f"**Status:** {item['status']}")
                         
                         with col2:
+                            st.markdown(f"**SKU:** {item['sku'] or 'Not set'}")
                             st.markdown(f"**Min Stock:** {item['min_stock']}")
                             st.markdown(f"**Description:** {item.get('description', 'No description available')}")
                             st.markdown(f"**Last Updated:** {item['last_updated']}")
@@ -675,6 +1542,11 @@ def show_admin_dashboard():
                                 value=item['quantity'],
                                 key=f"update_qty_{item['id']}"
                             )
+                            adjust_location = st.selectbox(
+                                "Adjust at Location",
+                                STOCK_LOCATIONS,
+                                key=f"update_location_{item['id']}"
+                            )
                         with col4:
                             new_price = st.number_input(
                                 f"Update Price",
@@ -692,15 +1564,28 @@ def show_admin_dashboard():
                                         conn = sqlite3.connect('inventory.db')
                                         c = conn.cursor()
                                         
+                                        # Adjust stock through the ledger at the chosen location
+                                        current_quantity = get_stock_level(c, item['id'])
+                                        adjustment = int(new_quantity - current_quantity)
+                                        c.execute("""
+                                            SELECT COALESCE(SUM(quantity), 0) FROM stock_locations
+                                            WHERE inventory_id = ? AND location = ?
+                                        """, (item['id'], adjust_location))
+                                        if c.fetchone()[0] + adjustment < 0:
+                                            raise ValueError(f"Not enough stock at {adjust_location} for this adjustment")
+                                        if adjustment:
+                                            record_stock_movement(
+                                                c, item['id'], "ADJUSTMENT",
+                                                adjustment, "Manual update", adjust_location
+                                            )
+                                        
                                         # Update inventory
                                         c.execute("""
                                             UPDATE inventory 
-                                            SET quantity = ?, price = ?, status = ?, last_updated = CURRENT_TIMESTAMP
+                                            SET price = ?, last_updated = CURRENT_TIMESTAMP
                                             WHERE id = ?
                                         """, (
-                                            new_quantity,
                                             new_price,
-                                            "In Stock" if new_quantity > 0 else "Out of Stock",
                                             item['id']
                                         ))
                                         
@@ -752,6 +1637,14 @@ def show_admin_dashboard():
                                         conn,
                                         params=(item['id'],)
                                     )
+                                    movements_df = pd.read_sql_query(
+                                        """
+                                        SELECT created_at, movement_type, location, quantity_delta, reference
+                                        FROM stock_movements WHERE inventory_id = ? ORDER BY id DESC
+                                        """,
+                                        conn,
+                                        params=(item['id'],)
+                                    )
                                     conn.close()
                                     
                                     if not history_df.empty:
@@ -759,6 +1652,10 @@ def show_admin_dashboard():
                                         st.dataframe(history_df)
                                     else:
                                         st.info("No history available for this item.")
+                                    
+                                    if not movements_df.empty:
+                                        st.write("Stock Movements:")
+                                        st.dataframe(movements_df, hide_index=True)
                                 except Exception as e:
                                     st.error(f"Error loading history: {str(e)}")
             else:
@@ -768,7 +1665,7 @@ def show_admin_dashboard():
             st.subheader("Stock Alerts")
             
             try:
-                conn = sqlite3.connect('vehicle_service.db')
+                conn = sqlite3.connect('inventory.db')
                 inventory_df = pd.read_sql_query("SELECT * FROM inventory", conn)
                 conn.close()
                 
@@ -804,7 +1701,23 @@ def show_admin_dashboard():
                               - Last Updated: {item['last_updated']}
                             """)
                     
-                    if low_stock.empty and out_of_stock.empty:
+                    # Per-location alerts against each location's own minimum
+                    location_alerts = get_location_stock_alerts()
+                    if not location_alerts.empty:
+                        st.warning("### 📍 Low Stock by Location")
+                        st.dataframe(
+                            location_alerts,
+                            column_config={
+                                "name": "Item Name",
+                                "category": "Category",
+                                "location": "Location",
+                                "quantity": "Current Stock",
+                                "min_stock": "Minimum Required"
+                            },
+                            hide_index=True
+                        )
+                    
+                    if low_stock.empty and out_of_stock.empty and location_alerts.empty:
                         st.success("All items are well stocked! 🎉")
                 else:
                     st.info("No inventory items found. Add some items to get started!")
@@ -921,45 +1834,534 @@ def show_admin_dashboard():
                                 },
                                 hide_index=True
                             )
-                        else:
-                            st.info("No recent updates found.")
-                    except Exception as e:
-                        st.error(f"Error loading recent updates: {str(e)}")
+                        else:
+                            st.info("No recent updates found.")
+                    except Exception as e:
+                        st.error(f"Error loading recent updates: {str(e)}")
+                    
+                    # Stock audit from the ledger
+                    st.subheader("Stock Audit")
+                    audit_date = st.date_input("Stock as of", value=datetime.now().date(), key="stock_audit_date")
+                    try:
+                        audit_df = get_stock_levels_as_of(audit_date)
+                        if not audit_df.empty:
+                            st.dataframe(
+                                audit_df[['name', 'category', 'quantity']],
+                                column_config={
+                                    "name": "Item Name",
+                                    "category": "Category",
+                                    "quantity": "Quantity"
+                                },
+                                hide_index=True
+                            )
+                        else:
+                            st.info("No stock movements recorded yet.")
+                    except Exception as e:
+                        st.error(f"Error loading stock audit: {str(e)}")
+                else:
+                    st.info("No inventory items found. Add some items to get started!")
+            except Exception as e:
+                st.error(f"Error loading analytics: {str(e)}")
+                st.info("Please try refreshing the page or contact support if the issue persists.")
+    
+        with inventory_tabs[4]:  # Scan Stock
+            st.subheader("Scan Stock")
+            st.write("Scan barcodes to receive or consume stock. "
+                     f"Scans are committed together every {SCAN_BATCH_SIZE} scans or when you press Commit.")
+            
+            scan_col1, scan_col2 = st.columns(2)
+            with scan_col1:
+                st.radio("Scan Mode", ["Receive", "Consume"], horizontal=True, key="scan_mode")
+            with scan_col2:
+                st.selectbox("Location", STOCK_LOCATIONS, key="scan_location")
+            st.text_input("Scan SKU / Barcode", key="scan_input", on_change=queue_stock_scan,
+                          placeholder="Focus here and scan")
+            
+            scan_buffer = st.session_state.get('scan_buffer', [])
+            st.metric("Pending Scans", len(scan_buffer))
+            if scan_buffer:
+                st.dataframe(
+                    pd.DataFrame(scan_buffer, columns=["SKU", "Delta", "Location"])
+                    .groupby(["SKU", "Location"], as_index=False)["Delta"].sum()
+                    .rename(columns={"Delta": "Quantity"}),
+                    hide_index=True
+                )
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.button("✅ Commit Scans", on_click=flush_stock_scans, disabled=not scan_buffer)
+            with col2:
+                if st.button("🗑️ Discard Scans", disabled=not scan_buffer):
+                    st.session_state.scan_buffer = []
+                    st.rerun()
+            
+            if 'scan_result' in st.session_state:
+                success, result = st.session_state.scan_result
+                if success:
+                    if result['applied']:
+                        st.success(f"Updated stock for {len(result['applied'])} SKUs")
+                    if result['unknown']:
+                        st.warning(f"Unknown SKUs: {', '.join(result['unknown'])}")
+                    if result['rejected']:
+                        st.error(f"Not enough stock to consume: {', '.join(result['rejected'])}")
+                else:
+                    st.error(f"Error applying scans: {result}")
+        
+        with inventory_tabs[5]:  # Locations
+            st.subheader("Stock by Location")
+            
+            items_df = get_inventory_data()
+            if not items_df.empty:
+                item_names = dict(zip(items_df['id'], items_df['name']))
+                location_item = st.selectbox(
+                    "Select Item",
+                    list(item_names),
+                    format_func=lambda x: item_names[x],
+                    key="location_item"
+                )
+                
+                location_df = get_location_stock(location_item)
+                location_df = (
+                    pd.DataFrame({'location': STOCK_LOCATIONS})
+                    .merge(location_df, on='location', how='left')
+                    .fillna({'quantity': 0, 'min_stock': 0})
+                    .astype({'quantity': int, 'min_stock': int})
+                )
+                edited_locations = st.data_editor(
+                    location_df,
+                    column_config={
+                        "location": st.column_config.TextColumn("Location", disabled=True),
+                        "quantity": st.column_config.NumberColumn("Quantity", disabled=True),
+                        "min_stock": st.column_config.NumberColumn("Minimum Stock", min_value=0, step=1)
+                    },
+                    hide_index=True,
+                    key=f"location_editor_{location_item}"
+                )
+                if st.button("Save Minimum Levels"):
+                    success, message = update_location_min_stock(
+                        location_item,
+                        dict(zip(edited_locations['location'], edited_locations['min_stock']))
+                    )
+                    if success:
+                        st.success(message)
+                    else:
+                        st.error(message)
+                
+                st.markdown("### Transfer Stock")
+                with st.form("transfer_stock_form"):
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        from_location = st.selectbox("From", STOCK_LOCATIONS)
+                    with col2:
+                        to_location = st.selectbox("To", STOCK_LOCATIONS, index=1)
+                    with col3:
+                        transfer_quantity = st.number_input("Quantity", min_value=1, step=1)
+                    
+                    if st.form_submit_button("Transfer"):
+                        success, message = transfer_stock(location_item, from_location, to_location, transfer_quantity)
+                        if success:
+                            st.success(message)
+                            st.rerun()
+                        else:
+                            st.error(message)
+            else:
+                st.info("No inventory items found. Add some items to get started!")
+        
+        with inventory_tabs[6]:  # Lots & Expiry
+            st.subheader("Lots & Expiry")
+            
+            items_df = get_inventory_data()
+            lot_items_df = items_df[items_df['category'].isin(LOT_TRACKED_CATEGORIES)] if not items_df.empty else items_df
+            if not lot_items_df.empty:
+                lot_item_names = dict(zip(lot_items_df['id'], lot_items_df['name']))
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.markdown("### Receive Lot")
+                    with st.form("receive_lot_form"):
+                        lot_item = st.selectbox("Item", list(lot_item_names), format_func=lambda x: lot_item_names[x])
+                        lot_number = st.text_input("Lot Number")
+                        lot_quantity = st.number_input("Quantity", min_value=1, step=1)
+                        expiry_date = st.date_input("Expiry Date", min_value=datetime.now().date())
+                        lot_location = st.selectbox("Location", STOCK_LOCATIONS)
+                        
+                        if st.form_submit_button("Receive Lot"):
+                            success, message = receive_stock_lot(
+                                lot_item, lot_number.strip(), lot_quantity, expiry_date, lot_location
+                            )
+                            if success:
+                                st.success(message)
+                            else:
+                                st.error(message)
+                
+                with col2:
+                    st.markdown("### Consume (FEFO)")
+                    with st.form("consume_stock_form"):
+                        consume_item = st.selectbox("Item", list(lot_item_names), format_func=lambda x: lot_item_names[x])
+                        consume_quantity = st.number_input("Quantity", min_value=1, step=1)
+                        consume_location = st.selectbox("Location", STOCK_LOCATIONS)
+                        
+                        if st.form_submit_button("Consume"):
+                            success, result = consume_stock(consume_item, consume_quantity, consume_location, "Manual consumption")
+                            if success:
+                                st.success("Stock consumed")
+                                for _, _, lot_number, expiry_date, quantity in result:
+                                    st.write(f"- Lot {lot_number} (expires {expiry_date}): {quantity}")
+                            else:
+                                st.error(result)
+            else:
+                st.info(f"No items in lot-tracked categories ({', '.join(LOT_TRACKED_CATEGORIES)}).")
+            
+            st.markdown("### Near-Expiry Report")
+            expiry_days = st.slider("Expiring within (days)", 0, 180, NEAR_EXPIRY_DAYS)
+            try:
+                near_expiry_df = get_near_expiry_lots(expiry_days)
+                if not near_expiry_df.empty:
+                    st.dataframe(
+                        near_expiry_df,
+                        column_config={
+                            "expiry_date": "Expiry Date",
+                            "name": "Item Name",
+                            "lot_number": "Lot",
+                            "location": "Location",
+                            "quantity": "Quantity"
+                        },
+                        hide_index=True
+                    )
                 else:
-                    st.info("No inventory items found. Add some items to get started!")
+                    st.success("No lots expiring in this window.")
             except Exception as e:
-                st.error(f"Error loading analytics: {str(e)}")
-                st.info("Please try refreshing the page or contact support if the issue persists.")
+                st.error(f"Error loading near-expiry report: {str(e)}")
+        
+        with inventory_tabs[7]:  # Service Kits
+            st.subheader("Service Kits")
+            st.write("Link each service item or repair to the parts it consumes.")
+            
+            items_df = get_inventory_data()
+            if not items_df.empty:
+                part_names = dict(zip(items_df['id'], items_df['name']))
+                kit_item = st.selectbox("Service Item", get_all_service_items(), key="kit_service_item")
+                current_kit = get_service_kit(kit_item)
+                current_parts = dict(zip(current_kit['inventory_id'], current_kit['quantity']))
+                
+                kit_parts = st.multiselect(
+                    "Parts",
+                    list(part_names),
+                    default=[item_id for item_id in current_parts if item_id in part_names],
+                    format_func=lambda x: part_names[x],
+                    key=f"kit_parts_{kit_item}"
+                )
+                kit_quantities = {}
+                for part_id in kit_parts:
+                    kit_quantities[part_id] = st.number_input(
+                        f"Quantity of {part_names[part_id]} per service",
+                        min_value=1,
+                        value=int(current_parts.get(part_id, 1)),
+                        step=1,
+                        key=f"kit_qty_{kit_item}_{part_id}"
+                    )
+                
+                if st.button("Save Kit"):
+                    success, message = save_service_kit(kit_item, kit_quantities)
+                    if success:
+                        st.success(message)
+                    else:
+                        st.error(message)
+                
+                st.markdown("### Kit Availability")
+                kit_availability = get_kit_availability()
+                if kit_availability:
+                    st.dataframe(
+                        pd.DataFrame(
+                            sorted(kit_availability.items()),
+                            columns=["Service Item", "Services Possible"]
+                        ),
+                        hide_index=True
+                    )
+                else:
+                    st.info("No service kits defined yet.")
+            else:
+                st.info("No inventory items found. Add some items to get started!")
     
     with tabs[2]:  # Booking Management
         st.header("Booking Management")
         st.write("Manage service bookings here")
         
-        # Display current bookings
-        conn = sqlite3.connect('vehicle_service.db')
-        bookings_df = pd.read_sql_query("SELECT * FROM bookings", conn)
-        conn.close()
+        # Filters are applied in SQL; pages are fetched by keyset over (booking_date, booking_id)
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            status_filter = st.multiselect("Status", BOOKING_STATUSES, key="booking_status_filter")
+        with col2:
+            date_filter = st.date_input("Booking Date Range", value=(), key="booking_date_filter")
+        with col3:
+            vehicle_type_filter = st.selectbox("Vehicle Type", ["All", "Car", "Motorcycle"],
+                                               key="booking_vehicle_filter")
+        with col4:
+            search_filter = st.text_input("Search", placeholder="Booking ID, plate or name",
+                                          key="booking_search_filter")
+        
+        start_date = date_filter[0] if len(date_filter) > 0 else None
+        end_date = date_filter[1] if len(date_filter) > 1 else None
+        filters = (tuple(status_filter), start_date, end_date, vehicle_type_filter, search_filter)
+        
+        # Start again from the first page whenever the filters change
+        if st.session_state.get('booking_filters') != filters:
+            st.session_state.booking_filters = filters
+            st.session_state.booking_page_cursors = [None]
+        
+        bookings_df, next_cursor = get_bookings_page(
+            statuses=status_filter,
+            start_date=start_date,
+            end_date=end_date,
+            vehicle_type=None if vehicle_type_filter == "All" else vehicle_type_filter,
+            search=search_filter,
+            after=st.session_state.booking_page_cursors[-1]
+        )
         
         if not bookings_df.empty:
-            st.write("Current Bookings:")
-            st.dataframe(bookings_df)
+            st.write(f"Bookings (page {len(st.session_state.booking_page_cursors)}):")
+            st.dataframe(bookings_df, hide_index=True)
             
-            # Update booking status
+            # Bulk status change for bookings on this page, in one transaction
+            with st.form("bulk_status_update"):
+                bulk_ids = st.multiselect(
+                    "Select Bookings",
+                    bookings_df['booking_id'].tolist(),
+                    format_func=lambda x: " | ".join(
+                        str(v) for v in bookings_df.loc[bookings_df['booking_id'] == x,
+                                                        ['booking_id', 'vehicle_number', 'time_slot', 'status']].iloc[0]
+                    )
+                )
+                bulk_status = st.selectbox("Move To", STATUS_CHANGE_TARGETS)
+                if st.form_submit_button("Apply to Selected"):
+                    success, message = update_booking_statuses(bulk_ids, bulk_status,
+                                                                st.session_state['user']['username'])
+                    if success:
+                        st.success(message)
+                    else:
+                        st.error(message)
+        else:
+            st.info("No bookings match the selected filters.")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if len(st.session_state.booking_page_cursors) > 1 and st.button("← Previous Page"):
+                st.session_state.booking_page_cursors.pop()
+                st.rerun()
+        with col2:
+            if next_cursor and st.button("Next Page →"):
+                st.session_state.booking_page_cursors.append(next_cursor)
+                st.rerun()
+        
+        waitlist_df = get_waitlist()
+        if not waitlist_df.empty:
+            st.write("Waitlist:")
+            st.dataframe(waitlist_df, hide_index=True)
+        
+        # Front-desk vehicle search, tolerant of typos in the plate
+        plate_query = st.text_input("Find Vehicle by Plate Number", placeholder="e.g., TS 09 AB 1234")
+        if plate_query:
+            vehicles_found = search_vehicles(plate_query)
+            if not vehicles_found.empty:
+                st.dataframe(vehicles_found.drop(columns=['vehicle_id']), hide_index=True)
+                conn = sqlite3.connect('vehicle_service.db')
+                vehicle_bookings = pd.read_sql_query("""
+                    SELECT booking_id, customer_name, vehicle_number, service_type,
+                           booking_date, time_slot, status
+                    FROM bookings WHERE plate_number = ?
+                    ORDER BY booking_date DESC
+                """, conn, params=(vehicles_found.iloc[0]['plate_number'],))
+                conn.close()
+                st.write(f"Bookings for {vehicles_found.iloc[0]['plate_number']}:")
+                st.dataframe(vehicle_bookings, hide_index=True)
+            else:
+                st.info("No vehicle found with a similar plate number.")
+        
+        # Vehicles due for routine service, from the precomputed due list
+        today = datetime.now().date()
+        st.write("Vehicles Due for Service:")
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            due_window = st.selectbox("Due", ["This week", "Next 30 days", "Overdue"], key="due_window")
+        with col2:
+            if st.button("Recompute Due Dates"):
+                st.success(f"Due dates computed for {refresh_due_list()} vehicle(s).")
+        if due_window == "This week":
+            due_start, due_end = today, today + timedelta(days=6 - today.weekday())
+        elif due_window == "Next 30 days":
+            due_start, due_end = today, today + timedelta(days=30)
+        else:
+            due_start, due_end = date.min, today - timedelta(days=1)
+        due_df = get_vehicles_due(due_start, due_end)
+        if not due_df.empty:
+            st.dataframe(due_df.drop(columns=['vehicle_id']), hide_index=True)
+            if st.button("Send Due Reminders"):
+                st.success(f"Reminders queued for {queue_due_reminders(due_start, due_end)} vehicle(s).")
+        else:
+            st.info("No vehicles due in this window.")
+        
+        # Customer emails waiting in the outbox
+        st.write("Notification Outbox:")
+        outbox = get_outbox_summary()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Pending", outbox.get('pending', 0) + outbox.get('sending', 0))
+        col2.metric("Sent", outbox.get('sent', 0))
+        col3.metric("Failed", outbox.get('failed', 0))
+        if outbox.get('failed'):
+            st.dataframe(get_failed_notifications(), hide_index=True)
+            if st.button("Retry Failed Emails"):
+                st.success(f"{retry_failed_notifications()} email(s) queued again.")
+        
+        # Service item demand and the parts it will consume
+        col1, col2 = st.columns(2)
+        with col1:
+            st.write("Service Items (last 30 days):")
+            item_counts = get_service_item_counts(today - timedelta(days=30), today)
+            if not item_counts.empty:
+                st.dataframe(item_counts, hide_index=True)
+            else:
+                st.info("No service items booked in the last 30 days.")
+        with col2:
+            st.write("Parts Needed (next 7 days):")
+            parts_demand = get_booked_parts_demand(today, today + timedelta(days=7))
+            if not parts_demand.empty:
+                st.dataframe(parts_demand, hide_index=True)
+            else:
+                st.info("No kit parts needed for upcoming bookings.")
+        
+        # Update booking status (picker searches by booking ID or plate as you type)
+        st.subheader("Update Booking Status")
+        picker_query = st.text_input("Find Booking", placeholder="Start typing a booking ID or plate number",
+                                     key="booking_picker_query")
+        picker_matches = search_bookings(picker_query) if picker_query else []
+        if picker_matches:
             with st.form("update_booking_status"):
-                booking_id = st.selectbox("Select Booking ID", bookings_df['booking_id'].tolist())
-                new_status = st.selectbox("New Status", ["Pending", "In Progress", "Completed", "Cancelled"])
+                booking_id = st.selectbox(
+                    "Select Booking",
+                    [match[0] for match in picker_matches],
+                    format_func=lambda x: next(
+                        f"{m[0]} | {m[1]} | {m[2]} | {m[3]}" for m in picker_matches if m[0] == x
+                    )
+                )
+                new_status = st.selectbox("New Status", STATUS_CHANGE_TARGETS)
                 submit_status = st.form_submit_button("Update Status")
                 
                 if submit_status:
-                    conn = sqlite3.connect('vehicle_service.db')
-                    c = conn.cursor()
-                    c.execute("UPDATE bookings SET status = ? WHERE booking_id = ?",
-                             (new_status, booking_id))
-                    conn.commit()
-                    conn.close()
-                    st.success("Booking status updated successfully!")
-    
-    with tabs[3]:  # AI Assistant
+                    success, message = update_booking_status(booking_id, new_status,
+                                                             st.session_state['user']['username'])
+                    if success:
+                        st.success(message)
+                    else:
+                        st.error(message)
+        elif picker_query:
+            st.info("No bookings match that booking ID or plate number.")
+    
+    with tabs[3]:  # Service Bays
+        st.header("Service Bays")
+        
+        # Current job in every bay
+        now = datetime.now()
+        running_df = get_jobs_running_at(now)
+        for col, bay in zip(st.columns(len(BAYS)), BAYS):
+            bay_job = running_df[running_df['bay'] == bay]
+            with col:
+                st.markdown(f"**{bay}**")
+                if bay_job.empty:
+                    st.write("Idle")
+                else:
+                    job = bay_job.iloc[0]
+                    st.write(f"{job['vehicle_number']} ({job['service_type']})")
+                    st.caption(f"Booking {job['booking_id']} since {job['started_at']}")
+        
+        # Start and stop work
+        col1, col2 = st.columns(2)
+        with col1:
+            with st.form("start_bay_job_form"):
+                st.subheader("Start Job")
+                todays_df, _ = get_bookings_page(statuses=["Pending", "In Progress"],
+                                                 start_date=now.date(), end_date=now.date())
+                waiting = [booking_id for booking_id in todays_df['booking_id']
+                           if booking_id not in set(running_df['booking_id'])]
+                idle_bays = [bay for bay in BAYS if bay not in set(running_df['bay'])]
+                start_booking = st.selectbox("Booking", waiting)
+                start_bay = st.selectbox("Bay", idle_bays)
+                if st.form_submit_button("Start"):
+                    if not start_booking or not start_bay:
+                        st.error("Select a booking and an idle bay.")
+                    else:
+                        success, message = start_bay_job(start_booking, start_bay,
+                                                         st.session_state['user']['username'])
+                        if success:
+                            st.success(message)
+                            st.rerun()
+                        else:
+                            st.error(message)
+        with col2:
+            with st.form("stop_bay_job_form"):
+                st.subheader("Stop Job")
+                stop_booking = st.selectbox(
+                    "Running Job",
+                    running_df['booking_id'].tolist(),
+                    format_func=lambda x: f"{x} ({running_df.set_index('booking_id').at[x, 'bay']})"
+                )
+                stop_completed = st.checkbox("Service completed", value=True)
+                if st.form_submit_button("Stop"):
+                    if not stop_booking:
+                        st.error("No job is running.")
+                    else:
+                        success, message = stop_bay_job(stop_booking, st.session_state['user']['username'],
+                                                        stop_completed)
+                        if success:
+                            st.success(message)
+                            st.rerun()
+                        else:
+                            st.error(message)
+        
+        # Point-in-time and idle-gap lookups from the interval index
+        st.subheader("Bay Activity")
+        col1, col2 = st.columns(2)
+        with col1:
+            activity_date = st.date_input("Date", value=now.date(), key="bay_activity_date")
+        with col2:
+            activity_time = st.time_input("Time", value=now.time().replace(second=0, microsecond=0),
+                                          key="bay_activity_time")
+        running_then_df = get_jobs_running_at(datetime.combine(activity_date, activity_time))
+        st.write(f"Running at {activity_time.strftime('%H:%M')}:")
+        if not running_then_df.empty:
+            st.dataframe(running_then_df, hide_index=True, use_container_width=True)
+        else:
+            st.info("No jobs were running at that time.")
+        
+        gaps_df = get_bay_idle_gaps(activity_date)
+        st.write("Idle gaps in working hours:")
+        if not gaps_df.empty:
+            st.dataframe(gaps_df, hide_index=True, use_container_width=True)
+        else:
+            st.info("No idle time recorded for that day.")
+        
+        # Utilization dashboard from the daily rollups
+        st.subheader("Bay Utilization (last 30 days)")
+        usage_df = get_bay_utilization(now.date() - timedelta(days=30), now.date())
+        if not usage_df.empty:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("Average Utilization", f"{usage_df['utilization'].mean():.1f}%")
+            with col2:
+                st.metric("Jobs Completed in Bays", int(usage_df['jobs'].sum()))
+            fig = px.bar(
+                usage_df,
+                x='usage_date',
+                y='utilization',
+                color='bay',
+                barmode='group',
+                labels={'usage_date': 'Date', 'utilization': 'Utilization (%)', 'bay': 'Bay'},
+                title='Daily Bay Utilization'
+            )
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.info("No finished bay jobs recorded yet.")
+    
+    with tabs[4]:  # AI Assistant
         st.header("AI Assistant")
         st.write("Get AI-powered assistance for your tasks")
         
@@ -1110,188 +2512,142 @@ def show_admin_dashboard():
                         st.info("Inventory Optimization Suggestions:")
                         st.write(suggestions)
 
-def show_booking_history(customer_name=None):
-    st.header("Your Booking History")
+# Booking history cards per page in each section
+HISTORY_PAGE_SIZE = 10
+
+# Booking history card, filled once per booking and rendered a page at a time
+BOOKING_CARD_TEMPLATE = string.Template(
+    '<div class="booking-card">'
+    '<div class="booking-header"><div>'
+    '<h3 style="color: #e2e8f0; margin: 0;">Booking #$booking_id</h3>'
+    '<p style="color: #94a3b8; margin: 5px 0;">$booking_date | $time_slot</p>'
+    '</div><span class="status-$status_class">$status</span></div>'
+    '<div class="vehicle-info"><p style="color: #e2e8f0; margin: 0;">'
+    '🚗 $vehicle_type | 📝 $vehicle_number</p></div>'
+    '<div class="booking-details">'
+    '<p><strong>Service Type:</strong> $service_type</p>'
+    '$service_items$description$additional_notes$last_service'
+    '</div></div>'
+)
+
+def count_user_bookings(user_id, statuses):
+    """Count a customer's bookings in the given statuses"""
+    conn = sqlite3.connect('vehicle_service.db')
+    c = conn.cursor()
+    c.execute(f"SELECT COUNT(*) FROM bookings WHERE user_id = ? AND status IN ({','.join('?' * len(statuses))})",
+              (user_id, *statuses))
+    total = c.fetchone()[0]
+    conn.close()
+    return total
+
+def get_user_bookings_page(user_id, statuses, page=1, page_size=HISTORY_PAGE_SIZE):
+    """Get one page of a customer's bookings in the given statuses"""
+    status_placeholders = ','.join('?' * len(statuses))
+    conn = sqlite3.connect('vehicle_service.db')
+    bookings_df = pd.read_sql_query(f"""
+        SELECT * FROM bookings 
+        WHERE user_id = ? AND status IN ({status_placeholders})
+        ORDER BY 
+            CASE 
+                WHEN status = 'In Progress' THEN 1
+                WHEN status = 'Pending' THEN 2
+                ELSE 3
+            END,
+            booking_date DESC
+        LIMIT ? OFFSET ?
+    """, conn, params=(user_id, *statuses, page_size, (page - 1) * page_size))
+    conn.close()
+    return bookings_df
+
+def render_booking_card(booking, service_items):
+    """Fill the booking card template for one booking (values are HTML-escaped)"""
+    def text(value):
+        return html.escape(str(value)) if pd.notna(value) and value != '' else ''
     
-    # Dark theme container for the entire section
-    st.markdown("""
-        <style>
-        .booking-history-container {
-            background-color: #0f172a;
-            padding: 20px;
-            border-radius: 10px;
-            margin: 10px 0;
-        }
-        .booking-card {
-            background-color: #1e293b;
-            padding: 20px;
-            border-radius: 8px;
-            margin: 10px 0;
-            border: 1px solid #334155;
-            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        }
-        .booking-header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 15px;
-            border-bottom: 1px solid #334155;
-            padding-bottom: 10px;
-        }
-        .status-pending {
-            background-color: #854d0e;
-            color: #fef3c7;
-            padding: 4px 8px;
-            border-radius: 4px;
-            font-size: 0.875rem;
-        }
-        .status-in-progress {
-            background-color: #1d4ed8;
-            color: #e0f2fe;
-            padding: 4px 8px;
-            border-radius: 4px;
-            font-size: 0.875rem;
-        }
-        .status-completed {
-            background-color: #15803d;
-            color: #dcfce7;
-            padding: 4px 8px;
-            border-radius: 4px;
-            font-size: 0.875rem;
-        }
-        .status-cancelled {
-            background-color: #991b1b;
-            color: #fee2e2;
-            padding: 4px 8px;
-            border-radius: 4px;
-            font-size: 0.875rem;
-        }
-        .booking-details {
-            color: #94a3b8;
-            font-size: 0.95rem;
-            line-height: 1.5;
-        }
-        .service-tag {
-            background-color: #334155;
-            color: #e2e8f0;
-            padding: 4px 8px;
-            border-radius: 4px;
-            margin: 2px;
-            display: inline-block;
-            font-size: 0.875rem;
-        }
-        .vehicle-info {
-            background-color: #334155;
-            padding: 10px;
-            border-radius: 6px;
-            margin: 10px 0;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    last_service = ""
+    if text(booking["last_service_date"]) and text(booking["last_service_km"]):
+        last_service = (f'<p><strong>Last Service:</strong> {text(booking["last_service_date"])} '
+                        f'({text(booking["last_service_km"])} KM)</p>')
+    
+    return BOOKING_CARD_TEMPLATE.substitute(
+        booking_id=text(booking['booking_id']),
+        booking_date=text(booking['booking_date']),
+        time_slot=text(booking['time_slot']),
+        status_class=booking['status'].lower().replace(' ', '-'),
+        status=text(booking['status']),
+        vehicle_type=text(booking['vehicle_type']),
+        vehicle_number=text(booking['vehicle_number']),
+        service_type=text(booking['service_type']),
+        service_items=(
+            '<div style="margin: 10px 0;"><strong>Service Items:</strong><br/>'
+            + ''.join(f'<span class="service-tag">{html.escape(item)}</span>' for item in service_items)
+            + '</div>'
+        ) if service_items else '',
+        description=(f'<p><strong>Description:</strong><br/>{text(booking["description"])}</p>'
+                     if text(booking["description"]) else ''),
+        additional_notes=(f'<p><strong>Additional Notes:</strong><br/>{text(booking["additional_notes"])}</p>'
+                          if text(booking["additional_notes"]) else ''),
+        last_service=last_service
+    )
 
-    if not customer_name:
-        customer_name = st.text_input("Enter your name to view bookings", 
-                                    placeholder="Enter your full name as used during booking")
+def display_booking_cards(bookings_df, booking_items):
+    """Render a page of booking cards as a single HTML payload"""
+    cards = ''.join(
+        render_booking_card(booking, booking_items.get(booking['booking_id'], []))
+        for booking in bookings_df.to_dict('records')
+    )
+    st.markdown(f'<div class="booking-history-container">{cards}</div>', unsafe_allow_html=True)
+
+def show_booking_history_section(title, user_id, statuses, key):
+    """Show one paginated section of the booking history"""
+    total = count_user_bookings(user_id, statuses)
+    if total == 0:
+        return False
     
-    if customer_name:
-        conn = sqlite3.connect('vehicle_service.db')
-        customer_bookings = pd.read_sql_query(
-            """
-            SELECT * FROM bookings 
-            WHERE customer_name=? 
-            ORDER BY 
-                CASE 
-                    WHEN status = 'In Progress' THEN 1
-                    WHEN status = 'Pending' THEN 2
-                    WHEN status = 'Completed' THEN 3
-                    WHEN status = 'Cancelled' THEN 4
-                END,
-                booking_date DESC
-            """, 
-            conn, 
-            params=(customer_name,)
-        )
-        conn.close()
+    st.subheader(title)
+    pages = -(-total // HISTORY_PAGE_SIZE)
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1,
+                               key=f"history_page_{key}")
+    bookings_df = get_user_bookings_page(user_id, statuses, page)
+    display_booking_cards(bookings_df, get_booking_items(bookings_df['booking_id'].tolist()))
+    return True
+
+def show_booking_history(user_id=None):
+    st.header("Your Booking History")
+    
+    if user_id:
+        # Service timeline per vehicle, precomputed in the vehicle registry
+        vehicles_df = get_user_vehicles(user_id)
+        if not vehicles_df.empty:
+            st.subheader("🚗 Your Vehicles")
+            st.dataframe(
+                vehicles_df,
+                hide_index=True,
+                column_config={
+                    "plate_number": "Plate Number",
+                    "vehicle_type": "Type",
+                    "brand": "Brand",
+                    "model": "Model",
+                    "last_service_date": "Last Service",
+                    "last_service_km": "Last Service KM",
+                    "services_done": "Services Done",
+                    "next_due_date": "Next Service Due"
+                }
+            )
         
-        if not customer_bookings.empty:
-            # Group bookings by status
-            active_bookings = customer_bookings[customer_bookings['status'].isin(['Pending', 'In Progress'])]
-            completed_bookings = customer_bookings[customer_bookings['status'] == 'Completed']
-            cancelled_bookings = customer_bookings[customer_bookings['status'] == 'Cancelled']
-            
-            st.markdown('<div class="booking-history-container">', unsafe_allow_html=True)
-            
-            # Display active bookings first
-            if not active_bookings.empty:
-                st.subheader("🔄 Active Bookings")
-                for _, booking in active_bookings.iterrows():
-                    display_booking_card(booking)
-            
-            # Display completed bookings
-            if not completed_bookings.empty:
-                st.subheader("✅ Completed Services")
-                for _, booking in completed_bookings.iterrows():
-                    display_booking_card(booking)
-            
-            # Display cancelled bookings
-            if not cancelled_bookings.empty:
-                st.subheader("❌ Cancelled Bookings")
-                for _, booking in cancelled_bookings.iterrows():
-                    display_booking_card(booking)
-            
-            st.markdown('</div>', unsafe_allow_html=True)
-        else:
+        # Active bookings first, then paginated completed and cancelled bookings
+        shown = [
+            show_booking_history_section("🔄 Active Bookings", user_id,
+                                         ['In Progress', 'Pending', 'Waitlisted'], 'active'),
+            show_booking_history_section("✅ Completed Services", user_id, ['Completed'], 'completed'),
+            show_booking_history_section("❌ Cancelled Bookings", user_id, ['Cancelled'], 'cancelled')
+        ]
+        if not any(shown):
             st.info("You have no bookings yet. Would you like to [book a service](/book_service)?")
     else:
-        st.info("Please enter your name to view your booking history")
-
-def display_booking_card(booking):
-    # Convert service items from string to list if it exists
-    service_items = booking['service_items'].split(',') if booking['service_items'] else []
-    
-    # Create the last service info string conditionally
-    last_service_info = ""
-    if booking["last_service_date"] and booking["last_service_km"]:
-        last_service_info = f'<p><strong>Last Service:</strong> {booking["last_service_date"]} ({booking["last_service_km"]} KM)</p>'
-    
-    st.markdown(f"""
-        <div class="booking-card">
-            <div class="booking-header">
-                <div>
-                    <h3 style="color: #e2e8f0; margin: 0;">Booking #{booking['booking_id']}</h3>
-                    <p style="color: #94a3b8; margin: 5px 0;">
-                        {booking['booking_date']} | {booking['time_slot']}
-                    </p>
-                </div>
-                <span class="status-{booking['status'].lower().replace(' ', '-')}">
-                    {booking['status']}
-                </span>
-            </div>
-            
-            <div class="vehicle-info">
-                <p style="color: #e2e8f0; margin: 0;">
-                    🚗 {booking['vehicle_type']} | 
-                    📝 {booking['vehicle_number']}
-                </p>
-            </div>
-            
-            <div class="booking-details">
-                <p><strong>Service Type:</strong> {booking['service_type']}</p>
-                
-                {f'<div style="margin: 10px 0;"><strong>Service Items:</strong><br/>' + 
-                ''.join([f'<span class="service-tag">{item.strip()}</span>' for item in service_items]) + 
-                '</div>' if service_items else ''}
-                
-                {f'<p><strong>Description:</strong><br/>{booking["description"]}</p>' 
-                if booking["description"] else ''}
-                
-                {f'<p><strong>Additional Notes:</strong><br/>{booking["additional_notes"]}</p>'
-                if booking["additional_notes"] else ''}
-                
-                {last_service_info}
-            </div>
-        </div>
-    """, unsafe_allow_html=True)
+        st.info("Please log in to view your booking history")
 
 def get_vehicle_data():
     return {
@@ -1590,6 +2946,76 @@ def get_repair_types():
         }
     }
 
+def get_service_items():
+    return {
+        "Car": {
+            "Regular Maintenance": [
+                "Engine Oil Change",
+                "Oil Filter Replacement",
+                "Air Filter Cleaning",
+                "Brake Check",
+                "Wheel Alignment",
+                "Battery Check",
+                "Tire Rotation"
+            ],
+            "Repair": [
+                "Engine Repair",
+                "Transmission Service",
+                "Brake System Repair",
+                "Suspension Work",
+                "Electrical Systems",
+                "AC Service & Repair"
+            ],
+            "Washing": [
+                "Basic Wash",
+                "Premium Wash",
+                "Deep Cleaning"
+            ]
+        },
+        "Motorcycle": {
+            "Regular Maintenance": [
+                "Engine Oil Change",
+                "Oil Filter Replacement",
+                "Air Filter Cleaning",
+                "Chain Cleaning",
+                "Brake Adjustment",
+                "Battery Check",
+                "Tire Pressure Check"
+            ],
+            "Repair": [
+                "Engine Work",
+                "Chain & Sprocket Replacement",
+                "Clutch Repair",
+                "Brake System Service",
+                "Electrical Repairs",
+                "Tire Services"
+            ],
+            "Washing": [
+                "Basic Wash",
+                "Premium Wash",
+                "Deep Cleaning"
+            ]
+        }
+    }
+
+def get_all_service_items():
+    """Get every bookable service item and repair that can have a service kit"""
+    items = set()
+    for service_types in get_service_items().values():
+        for service_items in service_types.values():
+            items.update(service_items)
+    for categories in get_repair_types().values():
+        for repairs in categories.values():
+            items.update(repairs)
+    return sorted(items)
+
+def format_service_item(item, kit_availability):
+    """Label a service item with how many times its kit can be fulfilled from stock"""
+    if item not in kit_availability:
+        return item
+    available = kit_availability[item]
+    return f"{item} ({available} available)" if available > 0 else f"{item} (parts out of stock)"
+
 def show_initial_booking_form():
     st.header("Book a Service")
     with st.form("initial_booking_form"):
@@ -1636,14 +3062,9 @@ def show_car_service_form():
     # Auto-assist feature for service recommendations
     if st.button("Get AI Service Recommendations"):
         with st.spinner("Getting personalized recommendations..."):
-            # Get service history from database
-            conn = sqlite3.connect('vehicle_service.db')
-            service_history = pd.read_sql_query(
-                "SELECT * FROM bookings WHERE vehicle_type='Car' AND vehicle_number=?",
-                conn,
-                params=(booking_details.get('vehicle_number', ''),)
-            ).to_dict('records')
-            conn.close()
+            # Get the vehicle's precomputed service timeline
+            vehicle = get_vehicle(booking_details.get('vehicle_number', ''))
+            service_history = [vehicle] if vehicle else []
             
             recommendations = get_service_recommendations(
                 "Car",
@@ -1655,11 +3076,12 @@ def show_car_service_form():
     
     # Service Items Selection based on service type
     service_items = []
+    kit_availability = get_kit_availability()
     if service_type == "Regular Maintenance":
         service_items = st.multiselect(
             "Select Maintenance Items",
-            ["Engine Oil Change", "Oil Filter Replacement", "Air Filter Cleaning", 
-             "Brake Check", "Wheel Alignment", "Battery Check", "Tire Rotation"]
+            get_service_items()["Car"]["Regular Maintenance"],
+            format_func=lambda x: format_service_item(x, kit_availability)
         )
     elif service_type == "Repair":
         # Add symptoms input for AI diagnosis
@@ -1679,21 +3101,32 @@ def show_car_service_form():
         
         service_items = st.multiselect(
             "Select Repair Items",
-            ["Engine Repair", "Transmission Service", "Brake System Repair",
-             "Suspension Work", "Electrical Systems", "AC Service & Repair"]
+            get_service_items()["Car"]["Repair"],
+            format_func=lambda x: format_service_item(x, kit_availability)
         )
     elif service_type == "Washing":
         service_items = st.multiselect(
             "Select Washing Package",
-            ["Basic Wash", "Premium Wash", "Deep Cleaning"]
+            get_service_items()["Car"]["Washing"],
+            format_func=lambda x: format_service_item(x, kit_availability)
         )
     
-    # Time Slot Selection
-    time_slot = st.selectbox("Preferred Time Slot", 
-                           ["09:00 AM - 11:00 AM", 
-                            "11:00 AM - 01:00 PM",
-                            "02:00 PM - 04:00 PM",
-                            "04:00 PM - 06:00 PM"])
+    # Date and Time Slot Selection
+    with st.expander("View Availability Calendar"):
+        show_availability_calendar()
+    min_date, max_date = get_booking_dates()
+    booking_date = st.date_input("Preferred Date", min_value=min_date, max_value=max_date)
+    slot_availability = get_slot_availability(booking_date)
+    minutes_needed = get_booking_minutes(service_items, service_type)
+    time_slot = st.selectbox("Preferred Time Slot", TIME_SLOTS,
+                             format_func=lambda x: format_time_slot(x, slot_availability, minutes_needed))
+    st.caption(f"Estimated bay time for this service: {format_minutes(minutes_needed)}")
+    join_waitlist = False
+    if get_slot_span(time_slot, minutes_needed) is None:
+        st.warning("This service runs past the end of the day from this slot. Please choose an earlier slot.")
+    elif not slot_fits(time_slot, slot_availability, minutes_needed):
+        st.warning("This slot is fully booked.")
+        join_waitlist = st.checkbox("Join the waitlist for this slot")
     
     additional_notes = st.text_area("Additional Notes (Optional)")
     
@@ -1713,6 +3146,10 @@ def show_car_service_form():
     # Booking form
     with st.form("car_booking_form"):
         submit_booking = st.form_submit_button("Book Service")
+        submission_key = get_idempotency_key(
+            "car_booking_form", booking_details.get('vehicle_number'), vehicle_brand, vehicle_model, service_type,
+            service_items, booking_date, time_slot, join_waitlist, additional_notes
+        )
         
         if submit_booking:
             try:
@@ -1725,38 +3162,33 @@ def show_car_service_form():
                 if additional_notes:
                     service_description += f"Additional Notes: {additional_notes}"
                 
-                conn = sqlite3.connect('vehicle_service.db')
-                c = conn.cursor()
-                
-                # Insert booking into database
-                c.execute("""
-                    INSERT INTO bookings (
-                        booking_id, customer_name, vehicle_type, vehicle_number,
-                        service_type, booking_date, time_slot, status, description,
-                        last_service_date, last_service_km, service_items, additional_notes
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    str(uuid.uuid4()),
-                    booking_details['customer_name'],
-                    'Car',
-                    booking_details['vehicle_number'],
-                    service_type,
-                    datetime.now().date(),
-                    time_slot,
-                    'Pending',
-                    service_description,
-                    booking_details.get('last_service_date'),
-                    booking_details.get('last_service_km'),
-                    ','.join(service_items) if service_items else None,
-                    additional_notes
-                ))
-                
-                conn.commit()
-                conn.close()
+                # Reserve the slot and insert the booking together
+                success, message = create_booking({
+                    'booking_id': generate_booking_id(),
+                    'customer_name': booking_details['customer_name'],
+                    'user_id': st.session_state['user']['user_id'],
+                    'vehicle_type': 'Car',
+                    'vehicle_number': booking_details['vehicle_number'],
+                    'service_type': service_type,
+                    'booking_date': booking_date,
+                    'time_slot': time_slot,
+                    'status': 'Pending',
+                    'description': service_description,
+                    'last_service_date': booking_details.get('last_service_date'),
+                    'last_service_km': booking_details.get('last_service_km'),
+                    'additional_notes': additional_notes
+                }, join_waitlist=join_waitlist,
+                   vehicle={'brand': vehicle_brand, 'model': vehicle_model},
+                   items=service_items,
+                   actor=st.session_state['user']['username'],
+                   idempotency_key=submission_key)
                 
-                st.success("Service booked successfully!")
-                st.session_state.current_page = 'home'
-                st.rerun()
+                if success:
+                    st.success(message)
+                    st.session_state.current_page = 'home'
+                    st.rerun()
+                else:
+                    st.error(message)
                 
             except Exception as e:
                 st.error(f"Error booking service: {str(e)}")
@@ -1777,14 +3209,9 @@ def show_bike_service_form():
     # Auto-assist feature for service recommendations
     if st.button("Get AI Service Recommendations"):
         with st.spinner("Getting personalized recommendations..."):
-            # Get service history from database
-            conn = sqlite3.connect('vehicle_service.db')
-            service_history = pd.read_sql_query(
-                "SELECT * FROM bookings WHERE vehicle_type='Motorcycle' AND vehicle_number=?",
-                conn,
-                params=(booking_details.get('vehicle_number', ''),)
-            ).to_dict('records')
-            conn.close()
+            # Get the vehicle's precomputed service timeline
+            vehicle = get_vehicle(booking_details.get('vehicle_number', ''))
+            service_history = [vehicle] if vehicle else []
             
             recommendations = get_service_recommendations(
                 "Motorcycle",
@@ -1796,11 +3223,12 @@ def show_bike_service_form():
     
     # Service Items Selection based on service type
     service_items = []
+    kit_availability = get_kit_availability()
     if service_type == "Regular Maintenance":
         service_items = st.multiselect(
             "Select Maintenance Items",
-            ["Engine Oil Change", "Oil Filter Replacement", "Air Filter Cleaning",
-             "Chain Cleaning", "Brake Adjustment", "Battery Check", "Tire Pressure Check"]
+            get_service_items()["Motorcycle"]["Regular Maintenance"],
+            format_func=lambda x: format_service_item(x, kit_availability)
         )
     elif service_type == "Repair":
         # Add symptoms input for AI diagnosis
@@ -1820,21 +3248,32 @@ def show_bike_service_form():
         
         service_items = st.multiselect(
             "Select Repair Items",
-            ["Engine Work", "Chain & Sprocket Replacement", "Clutch Repair",
-             "Brake System Service", "Electrical Repairs", "Tire Services"]
+            get_service_items()["Motorcycle"]["Repair"],
+            format_func=lambda x: format_service_item(x, kit_availability)
         )
     elif service_type == "Washing":
         service_items = st.multiselect(
             "Select Washing Package",
-            ["Basic Wash", "Premium Wash", "Deep Cleaning"]
+            get_service_items()["Motorcycle"]["Washing"],
+            format_func=lambda x: format_service_item(x, kit_availability)
         )
     
-    # Time Slot Selection
-    time_slot = st.selectbox("Preferred Time Slot", 
-                           ["09:00 AM - 11:00 AM", 
-                            "11:00 AM - 01:00 PM",
-                            "02:00 PM - 04:00 PM",
-                            "04:00 PM - 06:00 PM"])
+    # Date and Time Slot Selection
+    with st.expander("View Availability Calendar"):
+        show_availability_calendar()
+    min_date, max_date = get_booking_dates()
+    booking_date = st.date_input("Preferred Date", min_value=min_date, max_value=max_date)
+    slot_availability = get_slot_availability(booking_date)
+    minutes_needed = get_booking_minutes(service_items, service_type)
+    time_slot = st.selectbox("Preferred Time Slot", TIME_SLOTS,
+                             format_func=lambda x: format_time_slot(x, slot_availability, minutes_needed))
+    st.caption(f"Estimated bay time for this service: {format_minutes(minutes_needed)}")
+    join_waitlist = False
+    if get_slot_span(time_slot, minutes_needed) is None:
+        st.warning("This service runs past the end of the day from this slot. Please choose an earlier slot.")
+    elif not slot_fits(time_slot, slot_availability, minutes_needed):
+        st.warning("This slot is fully booked.")
+        join_waitlist = st.checkbox("Join the waitlist for this slot")
     
     additional_notes = st.text_area("Additional Notes (Optional)")
     
@@ -1854,6 +3293,10 @@ def show_bike_service_form():
     # Booking form
     with st.form("bike_booking_form"):
         submit_booking = st.form_submit_button("Book Service")
+        submission_key = get_idempotency_key(
+            "bike_booking_form", booking_details.get('vehicle_number'), vehicle_brand, vehicle_model, service_type,
+            service_items, booking_date, time_slot, join_waitlist, additional_notes
+        )
         
         if submit_booking:
             try:
@@ -1866,38 +3309,33 @@ def show_bike_service_form():
                 if additional_notes:
                     service_description += f"Additional Notes: {additional_notes}"
                 
-                conn = sqlite3.connect('vehicle_service.db')
-                c = conn.cursor()
-                
-                # Insert booking into database
-                c.execute("""
-                    INSERT INTO bookings (
-                        booking_id, customer_name, vehicle_type, vehicle_number,
-                        service_type, booking_date, time_slot, status, description,
-                        last_service_date, last_service_km, service_items, additional_notes
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    str(uuid.uuid4()),
-                    booking_details['customer_name'],
-                    'Motorcycle',
-                    booking_details['vehicle_number'],
-                    service_type,
-                    datetime.now().date(),
-                    time_slot,
-                    'Pending',
-                    service_description,
-                    booking_details.get('last_service_date'),
-                    booking_details.get('last_service_km'),
-                    ','.join(service_items) if service_items else None,
-                    additional_notes
-                ))
-                
-                conn.commit()
-                conn.close()
+                # Reserve the slot and insert the booking together
+                success, message = create_booking({
+                    'booking_id': generate_booking_id(),
+                    'customer_name': booking_details['customer_name'],
+                    'user_id': st.session_state['user']['user_id'],
+                    'vehicle_type': 'Motorcycle',
+                    'vehicle_number': booking_details['vehicle_number'],
+                    'service_type': service_type,
+                    'booking_date': booking_date,
+                    'time_slot': time_slot,
+                    'status': 'Pending',
+                    'description': service_description,
+                    'last_service_date': booking_details.get('last_service_date'),
+                    'last_service_km': booking_details.get('last_service_km'),
+                    'additional_notes': additional_notes
+                }, join_waitlist=join_waitlist,
+                   vehicle={'brand': vehicle_brand, 'model': vehicle_model},
+                   items=service_items,
+                   actor=st.session_state['user']['username'],
+                   idempotency_key=submission_key)
                 
-                st.success("Service booked successfully!")
-                st.session_state.current_page = 'home'
-                st.rerun()
+                if success:
+                    st.success(message)
+                    st.session_state.current_page = 'home'
+                    st.rerun()
+                else:
+                    st.error(message)
                 
             except Exception as e:
                 st.error(f"Error booking service: {str(e)}")
@@ -2330,7 +3768,7 @@ def show_customer_dashboard():
         show_bike_service_form()
     
     elif st.session_state.current_page == 'booking_history':
-        show_booking_history(st.session_state.get('customer_name', None))
+        show_booking_history(st.session_state['user']['user_id'])
     
     elif st.session_state.current_page == 'service_status':
         show_service_status()
@@ -3316,7 +4754,7 @@ def get_inventory_data():
         inventory_df = pd.read_sql_query("""
             SELECT 
                 id, name, category, quantity, price, 
-                min_stock, description, status,
+                min_stock, description, status, sku,
                 COALESCE(last_updated, CURRENT_TIMESTAMP) as last_updated
             FROM inventory
         """, conn)
@@ -3336,6 +4774,7 @@ def apply_inventory_filters(df, search_query, category_filter, status_filter):
         search_query = search_query.lower()
         df = df[
             df['name'].str.lower().str.contains(search_query) |
+            df['sku'].fillna('').str.lower().str.contains(search_query) |
             df['category'].str.lower().str.contains(search_query) |
             df['description'].str.lower().str.contains(search_query)
         ]
@@ -3351,15 +4790,21 @@ def apply_inventory_filters(df, search_query, category_filter, status_filter):
     return df
 
 def clear_inventory():
-    """Clear all inventory items and their history"""
+    """Clear all inventory items, writing their stock off in the ledger"""
     try:
         conn = sqlite3.connect('inventory.db')
         c = conn.cursor()
         
-        # First clear the history table (due to foreign key constraint)
-        c.execute("DELETE FROM inventory_history")
-        # Then clear the inventory table
+        # Write off remaining stock; the ledger and history are kept for audits
+        c.execute("SELECT inventory_id, location, quantity FROM stock_locations WHERE quantity != 0")
+        record_stock_movements(c, [
+            (item_id, "DELETE", -quantity, "Inventory cleared", location)
+            for item_id, location, quantity in c.fetchall()
+        ])
+        c.execute("DELETE FROM stock_locations")
         c.execute("DELETE FROM inventory")
+        c.execute("DELETE FROM service_kit_parts")
+        c.execute("UPDATE data_versions SET version = version + 1 WHERE name = 'service_kits'")
         
         conn.commit()
         conn.close()
@@ -3367,97 +4812,140 @@ def clear_inventory():
     except Exception as e:
         return False, str(e)
 
+# Seconds between checks for booking status changes on the service status page
+STATUS_POLL_SECONDS = 5
+
+# Recent status changes listed for the customer
+STATUS_UPDATES_SHOWN = 5
+
+def get_service_status_bookings(lookup_column, lookup):
+    """Get a customer's bookings (by user_id or customer_name), newest first"""
+    conn = sqlite3.connect('vehicle_service.db')
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT * FROM bookings 
+        WHERE {lookup_column} = ? 
+        ORDER BY booking_date DESC
+    """, (lookup,))
+    bookings = c.fetchall()
+    conn.close()
+    return bookings
+
+def display_service_status_bookings(bookings):
+    # Separate active and completed bookings
+    active_bookings = [b for b in bookings if b[7] not in ['Completed', 'Cancelled']]
+    completed_bookings = [b for b in bookings if b[7] in ['Completed', 'Cancelled']]
+    
+    # Display active bookings
+    if active_bookings:
+        st.subheader("Active Bookings")
+        for booking in active_bookings:
+            with st.expander(f"Booking ID: {booking[0]} - {booking[4]} ({booking[6]})"):
+                st.write(f"**Vehicle Type:** {booking[2]}")
+                st.write(f"**Vehicle Number:** {booking[3]}")
+                st.write(f"**Service Type:** {booking[4]}")
+                st.write(f"**Booking Date:** {booking[5]}")
+                st.write(f"**Time Slot:** {booking[6]}")
+                st.write(f"**Status:** {booking[7]}")
+                if booking[8]:  # Description
+                    st.write(f"**Description:** {booking[8]}")
+    
+    # Display completed bookings
+    if completed_bookings:
+        st.subheader("Completed Bookings")
+        for booking in completed_bookings:
+            with st.expander(f"Booking ID: {booking[0]} - {booking[4]} ({booking[6]})"):
+                st.write(f"**Vehicle Type:** {booking[2]}")
+                st.write(f"**Vehicle Number:** {booking[3]}")
+                st.write(f"**Service Type:** {booking[4]}")
+                st.write(f"**Booking Date:** {booking[5]}")
+                st.write(f"**Time Slot:** {booking[6]}")
+                st.write(f"**Status:** {booking[7]}")
+                if booking[8]:  # Description
+                    st.write(f"**Description:** {booking[8]}")
+
+@st.fragment(run_every=STATUS_POLL_SECONDS)
+def show_live_service_status(user_id):
+    """Customer status view that refetches only when the customer's bookings changed"""
+    try:
+        # One indexed read per poll; bookings are refetched only on a new event
+        version = (user_id, get_user_bookings_version(user_id))
+        if st.session_state.get('status_version') != version:
+            # First load reads the newest events; later polls only those past the cursor
+            if st.session_state.get('status_version', (None,))[0] != user_id:
+                st.session_state.status_event_cursor = 0
+                st.session_state.status_updates = []
+            new_events, st.session_state.status_event_cursor = get_latest_booking_events(
+                user_id, STATUS_UPDATES_SHOWN, after=st.session_state.status_event_cursor
+            )
+            status_updates = st.session_state.status_updates
+            status_updates.extend(new_events.to_dict('records'))
+            del status_updates[:-STATUS_UPDATES_SHOWN]
+            st.session_state.status_bookings = get_service_status_bookings('user_id', user_id)
+            st.session_state.status_version = version
+        
+        if st.session_state.status_updates:
+            st.subheader("Recent Updates")
+            for event in reversed(st.session_state.status_updates):
+                change = f"{event['old_status']} → {event['new_status']}" if pd.notna(event['old_status']) else f"Booked ({event['new_status']})"
+                st.write(f"**{event['booking_id']}**: {change} at {event['created_at']}")
+        
+        if st.session_state.status_bookings:
+            display_service_status_bookings(st.session_state.status_bookings)
+        else:
+            st.info("No bookings found for this customer.")
+    except Exception as e:
+        st.error(f"Error retrieving booking information: {str(e)}")
+
 def show_service_status():
     st.header("Service Status")
     
-    # Get customer name from session state or prompt for input
-    customer_name = st.session_state.get('customer_name')
-    if not customer_name:
-        customer_name = st.text_input("Enter your name to view service status")
+    # Customers see their own bookings live; admins look a customer up by name
+    if st.session_state.get('current_view') != 'admin':
+        user_id = st.session_state.get('user', {}).get('user_id')
+        if user_id:
+            show_live_service_status(user_id)
+        else:
+            st.info("Please log in to view your service status.")
+        return
     
+    customer_name = st.text_input("Enter the customer's name to view service status")
     if customer_name:
         try:
-            # Connect to database
-            conn = sqlite3.connect('vehicle_service.db')
-            c = conn.cursor()
-            
-            # Get customer's bookings
-            c.execute("""
-                SELECT * FROM bookings 
-                WHERE customer_name = ? 
-                ORDER BY booking_date DESC
-            """, (customer_name,))
-            
-            bookings = c.fetchall()
-            conn.close()
+            bookings = get_service_status_bookings('customer_name', customer_name)
             
             if bookings:
-                # Separate active and completed bookings
-                active_bookings = [b for b in bookings if b[7] not in ['Completed', 'Cancelled']]
-                completed_bookings = [b for b in bookings if b[7] in ['Completed', 'Cancelled']]
-                
-                # Display active bookings
-                if active_bookings:
-                    st.subheader("Active Bookings")
-                    for booking in active_bookings:
-                        with st.expander(f"Booking ID: {booking[0]} - {booking[4]} ({booking[6]})"):
-                            st.write(f"**Vehicle Type:** {booking[2]}")
-                            st.write(f"**Vehicle Number:** {booking[3]}")
-                            st.write(f"**Service Type:** {booking[4]}")
-                            st.write(f"**Booking Date:** {booking[5]}")
-                            st.write(f"**Time Slot:** {booking[6]}")
-                            st.write(f"**Status:** {booking[7]}")
-                            if booking[8]:  # Description
-                                st.write(f"**Description:** {booking[8]}")
-                
-                # Display completed bookings
-                if completed_bookings:
-                    st.subheader("Completed Bookings")
-                    for booking in completed_bookings:
-                        with st.expander(f"Booking ID: {booking[0]} - {booking[4]} ({booking[6]})"):
-                            st.write(f"**Vehicle Type:** {booking[2]}")
-                            st.write(f"**Vehicle Number:** {booking[3]}")
-                            st.write(f"**Service Type:** {booking[4]}")
-                            st.write(f"**Booking Date:** {booking[5]}")
-                            st.write(f"**Time Slot:** {booking[6]}")
-                            st.write(f"**Status:** {booking[7]}")
-                            if booking[8]:  # Description
-                                st.write(f"**Description:** {booking[8]}")
+                display_service_status_bookings(bookings)
                 
                 # Admin interface for updating status
-                if st.session_state.get('current_view') == 'admin':
-                    st.subheader("Update Booking Status")
-                    booking_id = st.selectbox(
-                        "Select Booking",
-                        [b[0] for b in bookings],
-                        format_func=lambda x: f"Booking ID: {x}"
-                    )
-                    new_status = st.selectbox(
-                        "New Status",
-                        ["Pending", "In Progress", "Completed", "Cancelled"]
-                    )
-                    
-                    if st.button("Update Status"):
-                        try:
-                            conn = sqlite3.connect('vehicle_service.db')
-                            c = conn.cursor()
-                            c.execute(
-                                "UPDATE bookings SET status = ? WHERE booking_id = ?",
-                                (new_status, booking_id)
-                            )
-                            conn.commit()
-                            conn.close()
-                            st.success("Status updated successfully!")
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"Error updating status: {str(e)}")
+                st.subheader("Update Booking Status")
+                booking_id = st.selectbox(
+                    "Select Booking",
+                    [b[0] for b in bookings],
+                    format_func=lambda x: f"Booking ID: {x}"
+                )
+                current_status = next(b[7] for b in bookings if b[0] == booking_id)
+                status_options = ALLOWED_STATUS_TRANSITIONS.get(current_status, [])
+                if not status_options:
+                    st.info(f"This booking is {current_status} and cannot change status.")
+                    return
+                new_status = st.selectbox("New Status", status_options)
+                
+                if st.button("Update Status"):
+                    success, message = update_booking_status(booking_id, new_status,
+                                                             st.session_state['user']['username'])
+                    if success:
+                        st.success(message)
+                        st.rerun()
+                    else:
+                        st.error(f"Error updating status: {message}")
             else:
                 st.info("No bookings found for this customer.")
         
         except Exception as e:
             st.error(f"Error retrieving booking information: {str(e)}")
     else:
-        st.info("Please enter your name to view service status.")
+        st.info("Please enter a customer name to view service status.")
 
 def hash_password(password):
     """Hash a password using a secure algorithm"""
@@ -3598,6 +5086,7 @@ def show_login_page():
     
 def main():
     init_db()
+    start_notification_sender()
     
     # Initialize session state
     if 'authenticated' not in st.session_state:
@@ -0,0 +1,236 @@
+"""
+Service bay utilization tracking.
+
+Work on a booking is recorded as a job in a bay, started and stopped by
+the workshop. Each job's time span is also kept in an R*Tree index
+(minutes since INTERVAL_EPOCH), so "what was running at 14:30" and the
+jobs overlapping a day are index lookups rather than scans over every
+job ever recorded. Running jobs span to the end of the index range until
+they are stopped.
+
+Starting a job moves its booking to In Progress and stopping it as
+finished moves it to Completed, in the same transaction, so the real
+start and finish times reach the booking event log (and from there the
+duration model, the customer's status feed and their emails).
+
+Stopping a job adds its minutes within working hours to a per-day,
+per-bay rollup that the utilization dashboard reads directly.
+"""
+import sqlite3
+from datetime import datetime, timedelta
+import pandas as pd
+from booking_slots import SERVICE_BAYS, apply_status_change
+
+# Service bays, named like the bay stock locations
+BAYS = [f"Bay {number}" for number in range(1, SERVICE_BAYS + 1)]
+
+# Working hours used for idle gaps and utilization
+WORKDAY_START = "09:00"
+WORKDAY_END = "18:00"
+WORKDAY_BAY_MINUTES = int((datetime.strptime(WORKDAY_END, "%H:%M")
+                           - datetime.strptime(WORKDAY_START, "%H:%M")).total_seconds() // 60)
+
+# Interval index coordinates are whole minutes since this date
+INTERVAL_EPOCH = datetime(2000, 1, 1)
+OPEN_INTERVAL_END = 2 ** 31 - 1
+
+def to_interval_minute(timestamp):
+    """Convert a datetime to interval index minutes"""
+    return int((timestamp - INTERVAL_EPOCH).total_seconds() // 60)
+
+def get_workday(day):
+    """Get the start and end of working hours on a day"""
+    return (datetime.combine(day, datetime.strptime(WORKDAY_START, "%H:%M").time()),
+            datetime.combine(day, datetime.strptime(WORKDAY_END, "%H:%M").time()))
+
+def init_bay_db(c):
+    """Create the bay job, interval index and daily rollup tables"""
+    c.execute('''CREATE TABLE IF NOT EXISTS bay_jobs
+                 (job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  booking_id TEXT NOT NULL REFERENCES bookings(booking_id),
+                  bay TEXT NOT NULL,
+                  started_at TIMESTAMP NOT NULL,
+                  stopped_at TIMESTAMP,
+                  started_by TEXT,
+                  stopped_by TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bay_jobs_booking ON bay_jobs(booking_id)")
+    # At most one running job per bay and per booking
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_bay_jobs_running_bay
+                 ON bay_jobs(bay) WHERE stopped_at IS NULL''')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_bay_jobs_running_booking
+                 ON bay_jobs(booking_id) WHERE stopped_at IS NULL''')
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS bay_job_intervals
+                 USING rtree_i32(job_id, start_minute, end_minute)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS bay_usage_daily
+                 (usage_date DATE NOT NULL,
+                  bay TEXT NOT NULL,
+                  busy_minutes INTEGER NOT NULL DEFAULT 0,
+                  jobs INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (usage_date, bay))''')
+
+def start_bay_job(booking_id, bay, actor=None):
+    """
+    Start work on a Pending or In Progress booking in a bay.
+
+    A Pending booking moves to In Progress. Returns (success, message).
+    """
+    started_at = datetime.now().replace(microsecond=0)
+    conn = sqlite3.connect('vehicle_service.db')
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("SELECT status FROM bookings WHERE booking_id = ?", (booking_id,))
+        booking = c.fetchone()
+        if not booking:
+            conn.rollback()
+            return False, f"Booking {booking_id} does not exist"
+        if booking[0] not in ("Pending", "In Progress"):
+            conn.rollback()
+            return False, f"Booking {booking_id} is {booking[0]} and cannot be worked on"
+        c.execute("SELECT booking_id FROM bay_jobs WHERE bay = ? AND stopped_at IS NULL", (bay,))
+        running = c.fetchone()
+        if running:
+            conn.rollback()
+            return False, f"{bay} is busy with booking {running[0]}"
+        c.execute("SELECT bay FROM bay_jobs WHERE booking_id = ? AND stopped_at IS NULL", (booking_id,))
+        running = c.fetchone()
+        if running:
+            conn.rollback()
+            return False, f"Booking {booking_id} is already running in {running[0]}"
+
+        c.execute("""
+            INSERT INTO bay_jobs (booking_id, bay, started_at, started_by)
+            VALUES (?, ?, ?, ?)
+        """, (booking_id, bay, str(started_at), actor))
+        c.execute("""
+            INSERT INTO bay_job_intervals (job_id, start_minute, end_minute)
+            VALUES (?, ?, ?)
+        """, (c.lastrowid, to_interval_minute(started_at), OPEN_INTERVAL_END))
+        if booking[0] == "Pending":
+            apply_status_change(c, [booking_id], "In Progress", actor)
+        conn.commit()
+        return True, f"Started booking {booking_id} in {bay}"
+    except Exception as e:
+        conn.rollback()
+        return False, str(e)
+    finally:
+        conn.close()
+
+def stop_bay_job(booking_id, actor=None, completed=True):
+    """
+    Stop the running job of a booking and add it to the daily rollups.
+
+    If the work is completed, the booking moves to Completed; otherwise it
+    stays In Progress to be resumed later. Returns (success, message).
+    """
+    stopped_at = datetime.now().replace(microsecond=0)
+    conn = sqlite3.connect('vehicle_service.db')
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("""
+            SELECT job_id, bay, started_at FROM bay_jobs
+            WHERE booking_id = ? AND stopped_at IS NULL
+        """, (booking_id,))
+        job = c.fetchone()
+        if not job:
+            conn.rollback()
+            return False, f"Booking {booking_id} is not running in any bay"
+
+        job_id, bay, started_at = job
+        started_at = datetime.fromisoformat(started_at)
+        c.execute("UPDATE bay_jobs SET stopped_at = ?, stopped_by = ? WHERE job_id = ?",
+                  (str(stopped_at), actor, job_id))
+        c.execute("UPDATE bay_job_intervals SET end_minute = ? WHERE job_id = ?",
+                  (to_interval_minute(stopped_at), job_id))
+
+        # Count the job's minutes within working hours of each day it ran on
+        day = started_at.date()
+        rollups = []
+        while day <= stopped_at.date():
+            workday_start, workday_end = get_workday(day)
+            busy = min(stopped_at, workday_end) - max(started_at, workday_start)
+            rollups.append((str(day), bay, max(int(busy.total_seconds() // 60), 0),
+                            int(day == started_at.date())))
+            day += timedelta(days=1)
+        c.executemany("""
+            INSERT INTO bay_usage_daily (usage_date, bay, busy_minutes, jobs)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(usage_date, bay) DO UPDATE SET
+                busy_minutes = busy_minutes + excluded.busy_minutes,
+                jobs = jobs + excluded.jobs
+        """, rollups)
+        changed = []
+        if completed:
+            changed, _ = apply_status_change(c, [booking_id], "Completed", actor)
+            if not changed:
+                c.execute("SELECT status FROM bookings WHERE booking_id = ?", (booking_id,))
+                status = c.fetchone()[0]
+        conn.commit()
+        if changed:
+            return True, f"Completed booking {booking_id} in {bay}"
+        if completed:
+            return True, (f"Stopped booking {booking_id} in {bay}; the booking is "
+                          f"{status} and was not completed")
+        return True, f"Stopped booking {booking_id} in {bay}"
+    except Exception as e:
+        conn.rollback()
+        return False, str(e)
+    finally:
+        conn.close()
+
+def get_bay_jobs_between(start, end):
+    """Get the bay jobs overlapping a time range (from the interval index)"""
+    conn = sqlite3.connect('vehicle_service.db')
+    jobs_df = pd.read_sql_query("""
+        SELECT j.bay, j.booking_id, b.vehicle_number, b.service_type,
+               j.started_at, j.stopped_at
+        FROM bay_job_intervals i
+        JOIN bay_jobs j ON j.job_id = i.job_id
+        JOIN bookings b ON b.booking_id = j.booking_id
+        WHERE i.start_minute <= ? AND i.end_minute >= ?
+        ORDER BY j.bay, j.started_at
+    """, conn, params=(to_interval_minute(end), to_interval_minute(start)))
+    conn.close()
+    return jobs_df
+
+def get_jobs_running_at(timestamp):
+    """Get the jobs that were running in each bay at a point in time"""
+    return get_bay_jobs_between(timestamp, timestamp)
+
+def get_bay_idle_gaps(day):
+    """Get every bay's idle gaps within working hours on a day"""
+    workday_start, workday_end = get_workday(day)
+    now = datetime.now().replace(microsecond=0)
+    jobs_df = get_bay_jobs_between(workday_start, workday_end)
+
+    gaps = []
+    def add_gap(bay, idle_from, idle_until):
+        if idle_until > idle_from:
+            gaps.append((bay, str(idle_from.time()), str(idle_until.time()),
+                         int((idle_until - idle_from).total_seconds() // 60)))
+
+    for bay in BAYS:
+        idle_from = workday_start
+        for job in jobs_df[jobs_df['bay'] == bay].itertuples():
+            started_at = datetime.fromisoformat(job.started_at)
+            stopped_at = datetime.fromisoformat(job.stopped_at) if pd.notna(job.stopped_at) else now
+            add_gap(bay, idle_from, min(started_at, workday_end))
+            idle_from = max(idle_from, stopped_at)
+        # Only the part of the day that has already happened can be idle
+        add_gap(bay, idle_from, min(workday_end, now))
+
+    return pd.DataFrame(gaps, columns=['bay', 'idle_from', 'idle_until', 'idle_minutes'])
+
+def get_bay_utilization(start_date, end_date):
+    """Get busy minutes and utilization per day and bay from the daily rollups"""
+    conn = sqlite3.connect('vehicle_service.db')
+    usage_df = pd.read_sql_query("""
+        SELECT usage_date, bay, busy_minutes, jobs
+        FROM bay_usage_daily
+        WHERE usage_date BETWEEN ? AND ?
+        ORDER BY usage_date, bay
+    """, conn, params=(str(start_date), str(end_date)))
+    conn.close()
+    usage_df['utilization'] = (usage_df['busy_minutes'] / WORKDAY_BAY_MINUTES * 100).round(1)
+    return usage_df
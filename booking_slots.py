@@ -0,0 +1,743 @@
+"""
+Booking slot capacity shared by the booking forms.
+
+Every (date, time slot) pair has one row in slot_capacity holding the
+slot's bay minutes and how many of them bookings have reserved. A
+booking reserves its estimated duration (see durations.py) with a
+conditional UPDATE in the same transaction as the booking insert, so a
+slot can never be overbooked, and cancelling a booking releases its
+minutes again. A job longer than a slot also reserves bay time in the
+slots after it, and one that would run past the end of the day is
+refused. Availability for the whole booking window is read in one
+query and cached until bookings change.
+
+A booking form submission carries an idempotency key stored under a
+unique index, so a double click or rerun that submits the same form
+again returns the booking already made instead of inserting another.
+
+When a slot is full, bookings can join a per-slot waitlist; cancelling a
+booking promotes the head of that slot's waitlist in the same transaction.
+
+Every status change is appended to booking_events in the transaction that
+makes it, so status views can poll for changes since a cursor, and the
+customer's email about it is queued in the notification outbox.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+from notifications import queue_status_notifications
+from durations import estimate_job_minutes, load_duration_model, get_duration_model
+from vehicles import normalize_plate, upsert_vehicle, refresh_vehicle_timeline
+
+# Time slots offered to customers (shared by every booking form)
+TIME_SLOTS = [
+    "09:00 AM - 11:00 AM",
+    "11:00 AM - 01:00 PM",
+    "02:00 PM - 04:00 PM",
+    "04:00 PM - 06:00 PM"
+]
+
+# Service bays worked in parallel, and working minutes per bay in one slot
+SERVICE_BAYS = 3
+SLOT_MINUTES = 120
+SLOT_CAPACITY_MINUTES = SERVICE_BAYS * SLOT_MINUTES
+
+# How many days ahead customers can book
+BOOKING_WINDOW_DAYS = 30
+
+# Booking statuses that no longer hold a slot
+INACTIVE_BOOKING_STATUSES = ["Cancelled", "Waitlisted"]
+
+# Booking statuses, in the order admins work through them
+BOOKING_STATUSES = ["Pending", "In Progress", "Completed", "Cancelled", "Waitlisted"]
+
+# Status changes admins may make (Waitlisted bookings become Pending only by promotion)
+ALLOWED_STATUS_TRANSITIONS = {
+    "Pending": ["In Progress", "Cancelled"],
+    "In Progress": ["Completed", "Cancelled"],
+    "Waitlisted": ["Cancelled"],
+    "Completed": [],
+    "Cancelled": []
+}
+
+# Statuses admins can move bookings to, in workflow order
+STATUS_CHANGE_TARGETS = [status for status in BOOKING_STATUSES
+                         if any(status in targets for targets in ALLOWED_STATUS_TRANSITIONS.values())]
+
+# Rows per page in Booking Management
+BOOKING_PAGE_SIZE = 50
+
+# Completed bookings per loyalty tier (higher tiers are promoted first)
+LOYALTY_TIER_BOOKINGS = 5
+MAX_LOYALTY_TIER = 3
+
+# Crockford base32 alphabet used by booking IDs
+BOOKING_ID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+_booking_id_lock = threading.Lock()
+_last_booking_id = (0, 0)
+
+def _encode_base32(value, length):
+    """Encode an integer as fixed-width Crockford base32"""
+    chars = []
+    for _ in range(length):
+        chars.append(BOOKING_ID_ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+def generate_booking_id():
+    """
+    Generate a unique, time-ordered booking ID (ULID layout with a BK prefix).
+
+    48 bits of millisecond timestamp followed by 80 random bits. IDs made
+    in the same millisecond increment the random part, so IDs from one
+    process always sort in creation order and new bookings append to the
+    end of the primary key index.
+    """
+    global _last_booking_id
+    with _booking_id_lock:
+        timestamp = int(time.time() * 1000)
+        last_timestamp, last_random = _last_booking_id
+        if timestamp <= last_timestamp:
+            timestamp = last_timestamp
+            randomness = last_random + 1
+        else:
+            randomness = int.from_bytes(os.urandom(10), 'big') >> 1
+        _last_booking_id = (timestamp, randomness)
+    return f"BK{_encode_base32(timestamp, 10)}{_encode_base32(randomness, 16)}"
+
+def get_idempotency_key(form_name, *values):
+    """
+    Get the idempotency key of a form submission.
+
+    The key hashes a per-session nonce for the form with its values, so it
+    stays the same across reruns for as long as the values do: a double
+    click, or a retry after a lost response, repeats the key, while
+    changing any value gives a new one.
+    """
+    state_key = f"{form_name}_nonce"
+    if state_key not in st.session_state:
+        st.session_state[state_key] = uuid.uuid4().hex
+    return hashlib.sha256(repr((st.session_state[state_key], values)).encode()).hexdigest()
+
+def init_slot_db(c):
+    """Create the slot capacity table and backfill it from existing bookings"""
+    c.execute('''CREATE TABLE IF NOT EXISTS slot_capacity
+                 (slot_date DATE NOT NULL,
+                  time_slot TEXT NOT NULL,
+                  capacity_minutes INTEGER NOT NULL,
+                  reserved_minutes INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (slot_date, time_slot),
+                  CHECK (reserved_minutes >= 0 AND reserved_minutes <= capacity_minutes))''')
+
+    # Version counter bumped by every booking change, used as a cache key
+    c.execute('''CREATE TABLE IF NOT EXISTS data_versions
+                 (name TEXT PRIMARY KEY,
+                  version INTEGER NOT NULL DEFAULT 0)''')
+    c.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('bookings', 0)")
+
+    # Waitlisted bookings queued per slot, ordered by loyalty tier then arrival
+    c.execute('''CREATE TABLE IF NOT EXISTS slot_waitlist
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  booking_id TEXT UNIQUE NOT NULL,
+                  slot_date DATE NOT NULL,
+                  time_slot TEXT NOT NULL,
+                  priority INTEGER NOT NULL DEFAULT 0,
+                  queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (booking_id) REFERENCES bookings(booking_id))''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_slot_waitlist_queue
+                 ON slot_waitlist (slot_date, time_slot, priority DESC, id)''')
+
+    # Append-only log of booking status changes
+    c.execute('''CREATE TABLE IF NOT EXISTS booking_events
+                 (event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  booking_id TEXT NOT NULL REFERENCES bookings(booking_id),
+                  user_id TEXT,
+                  old_status TEXT,
+                  new_status TEXT NOT NULL,
+                  actor TEXT,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_booking_events_user ON booking_events(user_id, event_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_booking_events_booking ON booking_events(booking_id, event_id)")
+
+    # Count bookings made before slot capacity existed (first run only)
+    c.execute("SELECT COUNT(*) FROM slot_capacity")
+    if c.fetchone()[0] == 0:
+        c.execute(f"""
+            INSERT INTO slot_capacity (slot_date, time_slot, capacity_minutes, reserved_minutes)
+            SELECT booking_date, time_slot, MAX(SUM(slot_minutes), ?), SUM(slot_minutes)
+            FROM bookings
+            WHERE status NOT IN ({','.join('?' * len(INACTIVE_BOOKING_STATUSES))})
+            GROUP BY booking_date, time_slot
+        """, (SLOT_CAPACITY_MINUTES, *INACTIVE_BOOKING_STATUSES))
+
+def get_booking_dates():
+    """Get the first and last date customers can book"""
+    min_date = datetime.now().date()
+    return min_date, min_date + timedelta(days=BOOKING_WINDOW_DAYS)
+
+def bump_bookings_version(c):
+    """Mark bookings as changed (inside the transaction that changes them)"""
+    c.execute("UPDATE data_versions SET version = version + 1 WHERE name = 'bookings'")
+
+def get_bookings_version():
+    """Get the current bookings version"""
+    conn = sqlite3.connect('vehicle_service.db')
+    c = conn.cursor()
+    c.execute("SELECT version FROM data_versions WHERE name = 'bookings'")
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+@st.cache_data(max_entries=8)
+def load_availability_calendar(bookings_version, start_date, days):
+    """Get free bay minutes for every slot over the booking window, cached per bookings version"""
+    end_date = start_date + timedelta(days=days)
+    conn = sqlite3.connect('vehicle_service.db')
+    c = conn.cursor()
+    c.execute("""
+        SELECT slot_date, time_slot, capacity_minutes - reserved_minutes FROM slot_capacity
+        WHERE slot_date BETWEEN ? AND ?
+    """, (str(start_date), str(end_date)))
+    rows = c.fetchall()
+    conn.close()
+
+    dates = [str(start_date + timedelta(days=offset)) for offset in range(days + 1)]
+    calendar = pd.DataFrame(SLOT_CAPACITY_MINUTES, index=dates, columns=TIME_SLOTS)
+    for slot_date, time_slot, free in rows:
+        if time_slot in calendar.columns:
+            calendar.at[slot_date, time_slot] = free
+    return calendar
+
+def get_availability_calendar():
+    """Get the availability calendar (dates x time slots) for the booking window"""
+    min_date, _ = get_booking_dates()
+    return load_availability_calendar(get_bookings_version(), min_date, BOOKING_WINDOW_DAYS)
+
+def get_slot_availability(booking_date):
+    """Get {time_slot: free bay minutes} for one date"""
+    calendar = get_availability_calendar()
+    if str(booking_date) in calendar.index:
+        return calendar.loc[str(booking_date)].to_dict()
+
+    # Dates outside the booking window are read from the slot capacity directly
+    conn = sqlite3.connect('vehicle_service.db')
+    c = conn.cursor()
+    c.execute("""
+        SELECT time_slot, capacity_minutes - reserved_minutes FROM slot_capacity
+        WHERE slot_date = ?
+    """, (str(booking_date),))
+    reserved_slots = dict(c.fetchall())
+    conn.close()
+    return {slot: reserved_slots.get(slot, SLOT_CAPACITY_MINUTES) for slot in TIME_SLOTS}
+
+def show_availability_calendar():
+    """Render the booking window's free bay minutes as a heatmap"""
+    calendar = get_availability_calendar()
+    fig = px.imshow(
+        calendar.T,
+        labels=dict(x="Date", y="Time Slot", color="Free Bay Minutes"),
+        color_continuous_scale="RdYlGn",
+        zmin=0,
+        zmax=SLOT_CAPACITY_MINUTES,
+        aspect="auto",
+        title=f"Slot Availability (next {BOOKING_WINDOW_DAYS} days)"
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+def format_minutes(minutes):
+    """Format minutes as hours and minutes ("1h 30m")"""
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m"
+
+def get_slot_span(time_slot, minutes):
+    """
+    Split a job's bay minutes over its slot and the ones after it.
+
+    A job keeps one bay for up to SLOT_MINUTES per slot and carries on in
+    the next slots of the same day. Returns [(time_slot, minutes)], or
+    None if the job runs past the last slot of the day.
+    """
+    if time_slot not in TIME_SLOTS:
+        return [(time_slot, minutes)]
+    span = []
+    for slot in TIME_SLOTS[TIME_SLOTS.index(time_slot):]:
+        span.append((slot, min(minutes, SLOT_MINUTES)))
+        minutes -= SLOT_MINUTES
+        if minutes <= 0:
+            return span
+    return None
+
+def slot_fits(time_slot, availability, minutes_needed):
+    """Check whether a job starting in a slot fits the free bay time of every slot it spans"""
+    span = get_slot_span(time_slot, minutes_needed)
+    return span is not None and all(
+        availability.get(slot, SLOT_CAPACITY_MINUTES) >= minutes for slot, minutes in span
+    )
+
+def format_time_slot(time_slot, availability, minutes_needed=1):
+    """Label a time slot with its free bay time, or as full if the job does not fit"""
+    if get_slot_span(time_slot, minutes_needed) is None:
+        return f"{time_slot} (too late in the day for this job)"
+    if slot_fits(time_slot, availability, minutes_needed):
+        free = availability.get(time_slot, SLOT_CAPACITY_MINUTES)
+        return f"{time_slot} ({format_minutes(free)} free)"
+    return f"{time_slot} (fully booked)"
+
+def get_booking_minutes(items, service_type, model=None):
+    """
+    Get the bay minutes a booking reserves, starting in its slot.
+
+    That is the job's p90 duration; jobs longer than a slot carry on into
+    the following slots (see get_slot_span).
+    """
+    if model is None:
+        model = get_duration_model()
+    return estimate_job_minutes(model, items, service_type)[1]
+
+def reserve_slot(c, booking_date, time_slot, minutes):
+    """
+    Reserve a job's bay minutes in its slot and the slots it runs on into.
+
+    Returns False, reserving nothing, if they do not fit in every slot or
+    the job runs past the end of the day. Must run inside the transaction
+    that writes the booking.
+    """
+    span = get_slot_span(time_slot, minutes)
+    if span is None:
+        return False
+    reserved = []
+    for slot, slot_minutes in span:
+        c.execute("""
+            INSERT OR IGNORE INTO slot_capacity (slot_date, time_slot, capacity_minutes, reserved_minutes)
+            VALUES (?, ?, ?, 0)
+        """, (str(booking_date), slot, SLOT_CAPACITY_MINUTES))
+        c.execute("""
+            UPDATE slot_capacity SET reserved_minutes = reserved_minutes + ?
+            WHERE slot_date = ? AND time_slot = ? AND reserved_minutes + ? <= capacity_minutes
+        """, (slot_minutes, str(booking_date), slot, slot_minutes))
+        if c.rowcount != 1:
+            for reserved_slot, reserved_minutes in reserved:
+                release_slot(c, booking_date, reserved_slot, reserved_minutes)
+            return False
+        reserved.append((slot, slot_minutes))
+    return True
+
+def release_slot(c, booking_date, time_slot, minutes):
+    """
+    Give back a booking's bay minutes in every slot it spans.
+
+    Must run inside the transaction that frees them. Returns the slots freed.
+    """
+    span = get_slot_span(time_slot, minutes) or [(time_slot, minutes)]
+    c.executemany("""
+        UPDATE slot_capacity SET reserved_minutes = MAX(reserved_minutes - ?, 0)
+        WHERE slot_date = ? AND time_slot = ?
+    """, [(slot_minutes, str(booking_date), slot) for slot, slot_minutes in span])
+    return [slot for slot, _ in span]
+
+def record_booking_events(c, events):
+    """
+    Append status changes to the booking event log.
+
+    events are (booking_id, user_id, old_status, new_status, actor) tuples;
+    must run inside the transaction that changes the statuses. The
+    customer's email for each change is queued in the same transaction.
+    """
+    c.executemany("""
+        INSERT INTO booking_events (booking_id, user_id, old_status, new_status, actor)
+        VALUES (?, ?, ?, ?, ?)
+    """, events)
+    queue_status_notifications(c, events)
+
+def get_latest_booking_events(user_id, limit, after=0):
+    """
+    Get a customer's newest status changes after the event id cursor.
+
+    Reads at most limit events newest first from the (user_id, event_id)
+    index and returns them oldest first, so a first load or a long gap
+    between polls still shows the latest changes. Returns
+    (events_df, new cursor).
+    """
+    conn = sqlite3.connect('vehicle_service.db')
+    events_df = pd.read_sql_query("""
+        SELECT event_id, booking_id, old_status, new_status, actor, created_at
+        FROM booking_events
+        WHERE user_id = ? AND event_id > ?
+        ORDER BY event_id DESC
+        LIMIT ?
+    """, conn, params=(user_id, after, limit))
+    conn.close()
+    events_df = events_df.iloc[::-1].reset_index(drop=True)
+    new_cursor = int(events_df['event_id'].iloc[-1]) if not events_df.empty else after
+    return events_df, new_cursor
+
+def get_user_bookings_version(user_id):
+    """Get the id of a customer's latest booking event (changes whenever their bookings do)"""
+    conn = sqlite3.connect('vehicle_service.db')
+    c = conn.cursor()
+    c.execute("SELECT COALESCE(MAX(event_id), 0) FROM booking_events WHERE user_id = ?", (user_id,))
+    version = c.fetchone()[0]
+    conn.close()
+    return version
+
+def get_loyalty_tier(c, booking):
+    """Get a customer's loyalty tier from their completed bookings"""
+    if booking.get('user_id'):
+        c.execute("SELECT COUNT(*) FROM bookings WHERE user_id = ? AND status = 'Completed'",
+                  (booking['user_id'],))
+    else:
+        c.execute("SELECT COUNT(*) FROM bookings WHERE customer_name = ? AND status = 'Completed'",
+                  (booking['customer_name'],))
+    return min(c.fetchone()[0] // LOYALTY_TIER_BOOKINGS, MAX_LOYALTY_TIER)
+
+def get_waitlist_position(c, booking_id):
+    """Get a waitlisted booking's 1-based position in its slot's queue"""
+    c.execute("""
+        SELECT COUNT(*) FROM slot_waitlist w
+        JOIN slot_waitlist me ON me.booking_id = ?
+        WHERE w.slot_date = me.slot_date AND w.time_slot = me.time_slot
+          AND (w.priority > me.priority OR (w.priority = me.priority AND w.id <= me.id))
+    """, (booking_id,))
+    return c.fetchone()[0]
+
+def promote_waitlist(c, booking_date, time_slot):
+    """
+    Move bookings from the head of a slot's waitlist into the slot while they fit.
+
+    Must run inside the transaction that freed the minutes. Returns the
+    promoted booking ids.
+    """
+    promoted = []
+    while True:
+        c.execute("""
+            SELECT w.id, w.booking_id, b.slot_minutes, b.user_id
+            FROM slot_waitlist w
+            JOIN bookings b ON b.booking_id = w.booking_id
+            WHERE w.slot_date = ? AND w.time_slot = ?
+            ORDER BY w.priority DESC, w.id
+            LIMIT 1
+        """, (str(booking_date), time_slot))
+        head = c.fetchone()
+        if not head or not reserve_slot(c, booking_date, time_slot, head[2]):
+            return promoted
+
+        waitlist_id, booking_id, _, user_id = head
+        c.execute("DELETE FROM slot_waitlist WHERE id = ?", (waitlist_id,))
+        c.execute("UPDATE bookings SET status = 'Pending' WHERE booking_id = ?", (booking_id,))
+        record_booking_events(c, [(booking_id, user_id, 'Waitlisted', 'Pending', 'waitlist')])
+        promoted.append(booking_id)
+
+def get_waitlist():
+    """Get every waitlisted booking in promotion order"""
+    conn = sqlite3.connect('vehicle_service.db')
+    waitlist_df = pd.read_sql_query("""
+        SELECT w.slot_date, w.time_slot, w.priority AS loyalty_tier, w.queued_at,
+               b.booking_id, b.customer_name, b.vehicle_number
+        FROM slot_waitlist w
+        JOIN bookings b ON b.booking_id = w.booking_id
+        ORDER BY w.slot_date, w.time_slot, w.priority DESC, w.id
+    """, conn)
+    conn.close()
+    return waitlist_df
+
+def get_bookings_page(statuses=None, start_date=None, end_date=None, vehicle_type=None,
+                      search=None, after=None, page_size=BOOKING_PAGE_SIZE):
+    """
+    Get one page of bookings, newest first, filtered in SQL.
+
+    Pages use keyset pagination over (booking_date, booking_id): after is
+    the (booking_date, booking_id) of the last row of the previous page.
+    Returns (bookings_df, cursor for the next page or None).
+    """
+    conditions, params = [], []
+    if statuses:
+        conditions.append(f"status IN ({','.join('?' * len(statuses))})")
+        params.extend(statuses)
+    if start_date:
+        conditions.append("booking_date >= ?")
+        params.append(str(start_date))
+    if end_date:
+        conditions.append("booking_date <= ?")
+        params.append(str(end_date))
+    if vehicle_type:
+        conditions.append("vehicle_type = ?")
+        params.append(vehicle_type)
+    if search:
+        # Prefix ranges so each alternative is an index range scan; booking IDs
+        # are uppercase, but those made before generate_booking_id are lowercase uuids
+        booking_prefix, plate_prefix, name_prefix = search.strip(), normalize_plate(search), search.strip()
+        conditions.append("""(
+            (booking_id >= ? AND booking_id < ?)
+            OR (booking_id >= ? AND booking_id < ?)
+            OR (plate_number >= ? AND plate_number < ?)
+            OR (customer_name COLLATE NOCASE >= ? AND customer_name COLLATE NOCASE < ?)
+        )""")
+        params.extend([booking_prefix.upper(), booking_prefix.upper() + '\uffff',
+                       booking_prefix.lower(), booking_prefix.lower() + '\uffff',
+                       plate_prefix, plate_prefix + '\uffff',
+                       name_prefix, name_prefix + '\uffff'])
+    if after:
+        conditions.append("(booking_date, booking_id) < (?, ?)")
+        params.extend([str(after[0]), after[1]])
+
+    conn = sqlite3.connect('vehicle_service.db')
+    bookings_df = pd.read_sql_query(f"""
+        SELECT booking_id, customer_name, vehicle_type, vehicle_number, service_type,
+               booking_date, time_slot, status
+        FROM bookings
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY booking_date DESC, booking_id DESC
+        LIMIT ?
+    """, conn, params=[*params, page_size + 1])
+    conn.close()
+
+    next_cursor = None
+    if len(bookings_df) > page_size:
+        bookings_df = bookings_df.iloc[:page_size]
+        last = bookings_df.iloc[-1]
+        next_cursor = (last['booking_date'], last['booking_id'])
+    return bookings_df, next_cursor
+
+def search_bookings(query, limit=20):
+    """Find bookings whose ID or plate number starts with the query (index range scans)"""
+    booking_prefix = query.strip()
+    plate_prefix = normalize_plate(query)
+    if not plate_prefix:
+        return []
+    conn = sqlite3.connect('vehicle_service.db')
+    c = conn.cursor()
+    c.execute("""
+        SELECT booking_id, plate_number, booking_date, status FROM (
+            SELECT * FROM (
+                SELECT booking_id, plate_number, booking_date, status FROM bookings
+                WHERE (booking_id >= ? AND booking_id < ?)
+                   OR (booking_id >= ? AND booking_id < ?)
+                ORDER BY booking_id DESC LIMIT ?
+            )
+            UNION
+            SELECT * FROM (
+                SELECT booking_id, plate_number, booking_date, status FROM bookings
+                WHERE plate_number >= ? AND plate_number < ?
+                ORDER BY plate_number, booking_date DESC LIMIT ?
+            )
+        )
+        ORDER BY booking_date DESC
+        LIMIT ?
+    """, (booking_prefix.upper(), booking_prefix.upper() + '\uffff',
+          booking_prefix.lower(), booking_prefix.lower() + '\uffff', limit,
+          plate_prefix, plate_prefix + '\uffff', limit, limit))
+    results = c.fetchall()
+    conn.close()
+    return results
+
+def get_booking_items(booking_ids):
+    """Get {booking_id: [service items]} for the given bookings"""
+    if not booking_ids:
+        return {}
+    conn = sqlite3.connect('vehicle_service.db')
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT booking_id, item FROM booking_items
+        WHERE booking_id IN ({','.join('?' * len(booking_ids))})
+        ORDER BY booking_id, item
+    """, booking_ids)
+    items = {}
+    for booking_id, item in c.fetchall():
+        items.setdefault(booking_id, []).append(item)
+    conn.close()
+    return items
+
+def get_service_item_counts(start_date, end_date):
+    """Count bookings per service item between two dates (cancelled bookings excluded)"""
+    conn = sqlite3.connect('vehicle_service.db')
+    counts_df = pd.read_sql_query("""
+        SELECT bi.item, COUNT(*) AS bookings
+        FROM booking_items bi
+        JOIN bookings b ON b.booking_id = bi.booking_id
+        WHERE b.booking_date BETWEEN ? AND ? AND b.status != 'Cancelled'
+        GROUP BY bi.item
+        ORDER BY bookings DESC
+    """, conn, params=(str(start_date), str(end_date)))
+    conn.close()
+    return counts_df
+
+def create_booking(booking, join_waitlist=False, vehicle=None, items=None, actor=None,
+                   idempotency_key=None):
+    """
+    Reserve the booking's slot and insert it in one transaction.
+
+    booking is a dict of bookings columns and must include booking_date,
+    time_slot and service_type. The booking reserves its estimated bay
+    minutes in the slot. If they do not fit and join_waitlist is set, the
+    booking is stored as Waitlisted and queued for the slot instead.
+    vehicle optionally gives the brand and model for the vehicle registry,
+    and items the selected service items; actor is who made the booking.
+    If a booking that is not cancelled was already made with
+    idempotency_key, nothing is written and that booking is reported
+    instead.
+    Returns (success, message).
+    """
+    conn = sqlite3.connect('vehicle_service.db')
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        if idempotency_key:
+            c.execute("SELECT booking_id, status FROM bookings WHERE idempotency_key = ?",
+                      (idempotency_key,))
+            original = c.fetchone()
+            if original and original[1] != 'Cancelled':
+                conn.rollback()
+                return True, f"Booking {original[0]} was already submitted ({original[1]})."
+            if original:
+                # A cancelled booking no longer holds its submission; booking again is allowed
+                c.execute("UPDATE bookings SET idempotency_key = NULL WHERE booking_id = ?", (original[0],))
+        booking = {
+            **booking,
+            'idempotency_key': idempotency_key,
+            'slot_minutes': get_booking_minutes(items, booking['service_type'], load_duration_model(c))
+        }
+        if get_slot_span(booking['time_slot'], booking['slot_minutes']) is None:
+            conn.rollback()
+            return False, (f"This service needs about {format_minutes(booking['slot_minutes'])} of bay time, "
+                           "more than is left in the day from this slot. Please choose an earlier slot "
+                           "or contact the workshop.")
+        waitlisted = False
+        if not reserve_slot(c, booking['booking_date'], booking['time_slot'], booking['slot_minutes']):
+            if not join_waitlist:
+                conn.rollback()
+                return False, "This slot is fully booked. Please select another time."
+            waitlisted = True
+            booking = {**booking, 'status': 'Waitlisted'}
+
+        vehicle = vehicle or {}
+        booking = {
+            **booking,
+            'plate_number': normalize_plate(booking['vehicle_number']),
+            'vehicle_id': upsert_vehicle(
+                c, booking['vehicle_number'], booking['vehicle_type'], booking.get('user_id'),
+                vehicle.get('brand'), vehicle.get('model')
+            )
+        }
+
+        columns = list(booking)
+        c.execute(f"""
+            INSERT INTO bookings ({', '.join(columns)})
+            VALUES ({', '.join('?' * len(columns))})
+        """, [booking[column] for column in columns])
+        c.executemany("INSERT OR IGNORE INTO booking_items (booking_id, item) VALUES (?, ?)",
+                      [(booking['booking_id'], item) for item in items or []])
+        if waitlisted:
+            c.execute("""
+                INSERT INTO slot_waitlist (booking_id, slot_date, time_slot, priority)
+                VALUES (?, ?, ?, ?)
+            """, (booking['booking_id'], str(booking['booking_date']), booking['time_slot'],
+                  get_loyalty_tier(c, booking)))
+            position = get_waitlist_position(c, booking['booking_id'])
+        record_booking_events(c, [(booking['booking_id'], booking.get('user_id'), None,
+                                   booking['status'], actor)])
+        refresh_vehicle_timeline(c, booking['vehicle_id'])
+        bump_bookings_version(c)
+        conn.commit()
+        if waitlisted:
+            return True, (f"Added to the waitlist as number {position}. "
+                          "Your booking will be confirmed if a place frees up.")
+        return True, "Service booked successfully!"
+    except Exception as e:
+        conn.rollback()
+        return False, str(e)
+    finally:
+        conn.close()
+
+def apply_status_change(c, booking_ids, new_status, actor=None):
+    """
+    Move bookings to a new status inside the caller's transaction.
+
+    Only bookings whose current status may move to new_status (see
+    ALLOWED_STATUS_TRANSITIONS) are changed; the UPDATE itself is guarded
+    on those statuses. Cancelling frees the booking's slots and promotes
+    their waitlists. Each change is logged to booking_events with the
+    given actor. Returns (changed bookings, promoted booking ids).
+    """
+    from_statuses = [status for status, targets in ALLOWED_STATUS_TRANSITIONS.items()
+                     if new_status in targets]
+    if not booking_ids or not from_statuses:
+        return [], []
+
+    status_placeholders = ','.join('?' * len(from_statuses))
+    c.execute(f"""
+        SELECT booking_id, status, booking_date, time_slot, vehicle_id, user_id, slot_minutes
+        FROM bookings
+        WHERE booking_id IN ({','.join('?' * len(booking_ids))})
+          AND status IN ({status_placeholders})
+    """, (*booking_ids, *from_statuses))
+    bookings = c.fetchall()
+
+    c.executemany(f"""
+        UPDATE bookings SET status = ?
+        WHERE booking_id = ? AND status IN ({status_placeholders})
+    """, [(new_status, booking[0], *from_statuses) for booking in bookings])
+    record_booking_events(c, [(booking[0], booking[5], booking[1], new_status, actor)
+                              for booking in bookings])
+
+    promoted = []
+    if new_status in INACTIVE_BOOKING_STATUSES:
+        c.executemany("DELETE FROM slot_waitlist WHERE booking_id = ?",
+                      [(booking[0],) for booking in bookings])
+        for _, old_status, booking_date, time_slot, _, _, slot_minutes in bookings:
+            if old_status not in INACTIVE_BOOKING_STATUSES:
+                for freed_slot in release_slot(c, booking_date, time_slot, slot_minutes):
+                    promoted.extend(promote_waitlist(c, booking_date, freed_slot))
+    for vehicle_id in {booking[4] for booking in bookings if booking[4]}:
+        refresh_vehicle_timeline(c, vehicle_id)
+    bump_bookings_version(c)
+    return bookings, promoted
+
+def update_booking_statuses(booking_ids, new_status, actor=None):
+    """
+    Move several bookings to a new status in one transaction.
+
+    Bookings whose current status cannot move to new_status are left
+    alone and reported as skipped (see apply_status_change).
+    Returns (success, message).
+    """
+    if not booking_ids:
+        return False, "No bookings selected"
+    if not any(new_status in targets for targets in ALLOWED_STATUS_TRANSITIONS.values()):
+        return False, f"Bookings cannot be moved to {new_status}"
+
+    conn = sqlite3.connect('vehicle_service.db')
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        bookings, promoted = apply_status_change(c, booking_ids, new_status, actor)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return False, str(e)
+    finally:
+        conn.close()
+
+    if not bookings:
+        return False, f"None of the selected bookings can move to {new_status}"
+    message = f"{len(bookings)} booking(s) moved to {new_status}."
+    skipped = len(set(booking_ids)) - len(bookings)
+    if skipped:
+        message += f" {skipped} skipped (transition not allowed)."
+    if promoted:
+        message += f" Promoted from the waitlist: {', '.join(promoted)}."
+    return True, message
+
+def update_booking_status(booking_id, new_status, actor=None):
+    """Move one booking to a new status. Returns (success, message)."""
+    success, message = update_booking_statuses([booking_id], new_status, actor)
+    if not success and message.startswith("None of the selected"):
+        return False, f"A booking cannot move to {new_status} from its current status"
+    return success, message
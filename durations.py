@@ -0,0 +1,180 @@
+"""
+Job duration estimates per service item.
+
+Each booking's working time is measured from its status events (moved to
+In Progress, then to Completed) and shared equally between its service
+items; bookings without items count towards their service type. The
+median and 90th percentile per item are stored in job_durations and
+replace the configured defaults once an item has enough samples.
+
+Slot capacity reserves a booking's p90 estimate, so a slot is not
+overbooked by jobs that run long, and mechanic assignment balances load
+on the median.
+"""
+import math
+import sqlite3
+import pandas as pd
+
+# Configured (median, p90) minutes per service item, used until enough jobs are measured
+DEFAULT_ITEM_MINUTES = {
+    # Regular maintenance
+    "Engine Oil Change": (30, 45),
+    "Oil Filter Replacement": (20, 30),
+    "Air Filter Cleaning": (15, 25),
+    "Brake Check": (20, 30),
+    "Brake Adjustment": (20, 30),
+    "Wheel Alignment": (45, 60),
+    "Battery Check": (10, 15),
+    "Tire Rotation": (30, 45),
+    "Tire Pressure Check": (10, 15),
+    "Chain Cleaning": (20, 30),
+    # Repairs
+    "Engine Repair": (180, 300),
+    "Engine Work": (150, 240),
+    "Engine Overhaul": (480, 720),
+    "Transmission Service": (120, 180),
+    "Gearbox Repair": (300, 420),
+    "Clutch Replacement": (180, 240),
+    "Clutch Repair": (120, 180),
+    "Timing Belt Replacement": (180, 240),
+    "Brake System Repair": (90, 150),
+    "Brake System Service": (60, 90),
+    "Brake Pad Replacement": (60, 90),
+    "Suspension Work": (120, 180),
+    "Electrical Systems": (90, 150),
+    "Electrical Repairs": (60, 120),
+    "Battery Replacement": (20, 30),
+    "AC Service & Repair": (90, 150),
+    "AC Gas Refill": (45, 60),
+    "Chain & Sprocket Replacement": (60, 90),
+    "Tire Services": (30, 45),
+    "Dent Removal": (120, 180),
+    "Paint Work": (360, 480),
+    # Washing
+    "Basic Wash": (30, 40),
+    "Premium Wash": (60, 75),
+    "Deep Cleaning": (120, 150)
+}
+
+# Configured (median, p90) minutes for jobs without known items
+DEFAULT_SERVICE_TYPE_MINUTES = {
+    "Regular Maintenance": (60, 90),
+    "Repair": (120, 180),
+    "Washing": (45, 60)
+}
+FALLBACK_JOB_MINUTES = (60, 90)
+
+# Measured jobs needed before an item's learned durations replace its defaults
+MIN_DURATION_SAMPLES = 5
+
+def init_duration_db(c):
+    """Create the learned job durations table"""
+    c.execute('''CREATE TABLE IF NOT EXISTS job_durations
+                 (job_key TEXT PRIMARY KEY,
+                  samples INTEGER NOT NULL,
+                  median_minutes REAL NOT NULL,
+                  p90_minutes REAL NOT NULL,
+                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+def get_measured_durations(conn):
+    """Get (job_key, minutes) for every completed job with a recorded start and finish"""
+    jobs_df = pd.read_sql_query("""
+        SELECT b.booking_id, b.service_type,
+               (julianday(MAX(f.created_at)) - julianday(MAX(s.created_at))) * 1440 AS minutes
+        FROM booking_events s
+        JOIN booking_events f ON f.booking_id = s.booking_id AND f.new_status = 'Completed'
+        JOIN bookings b ON b.booking_id = s.booking_id
+        WHERE s.new_status = 'In Progress'
+        GROUP BY b.booking_id
+        HAVING minutes > 0
+    """, conn)
+    items_df = pd.read_sql_query("""
+        SELECT bi.booking_id, bi.item FROM booking_items bi
+        JOIN booking_events f ON f.booking_id = bi.booking_id AND f.new_status = 'Completed'
+        GROUP BY bi.booking_id, bi.item
+    """, conn)
+
+    # Share each job's time equally between its items
+    items_df['share'] = 1 / items_df.groupby('booking_id')['item'].transform('count')
+    with_items = jobs_df.merge(items_df, on='booking_id')
+    with_items = pd.DataFrame({
+        'job_key': with_items['item'],
+        'minutes': with_items['minutes'] * with_items['share']
+    })
+    without_items = jobs_df[~jobs_df['booking_id'].isin(items_df['booking_id'])]
+    without_items = pd.DataFrame({
+        'job_key': without_items['service_type'],
+        'minutes': without_items['minutes']
+    })
+    return pd.concat([with_items, without_items], ignore_index=True)
+
+def refresh_duration_model():
+    """Relearn median and p90 durations from measured jobs, returning the number of keys learned"""
+    conn = sqlite3.connect('vehicle_service.db')
+    try:
+        durations_df = get_measured_durations(conn)
+        model_df = durations_df.groupby('job_key')['minutes'].agg(
+            samples='count',
+            median_minutes='median',
+            p90_minutes=lambda minutes: minutes.quantile(0.9)
+        ).reset_index().round({'median_minutes': 1, 'p90_minutes': 1})
+
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("DELETE FROM job_durations")
+        c.executemany("""
+            INSERT INTO job_durations (job_key, samples, median_minutes, p90_minutes)
+            VALUES (?, ?, ?, ?)
+        """, model_df[['job_key', 'samples', 'median_minutes', 'p90_minutes']].itertuples(index=False))
+        conn.commit()
+        return len(model_df)
+    finally:
+        conn.close()
+
+def load_duration_model(c):
+    """Get {job_key: (median, p90)} learned from enough samples (with the caller's cursor)"""
+    c.execute("""
+        SELECT job_key, median_minutes, p90_minutes FROM job_durations
+        WHERE samples >= ?
+    """, (MIN_DURATION_SAMPLES,))
+    return {job_key: (median, p90) for job_key, median, p90 in c.fetchall()}
+
+def get_duration_model():
+    """Get the learned duration model"""
+    conn = sqlite3.connect('vehicle_service.db')
+    model = load_duration_model(conn.cursor())
+    conn.close()
+    return model
+
+def estimate_job_minutes(model, items, service_type):
+    """
+    Estimate a job's (median, p90) minutes from its items.
+
+    Learned durations win over configured defaults; a job without items
+    is estimated from its service type.
+    """
+    def lookup(job_key, defaults, fallback):
+        return model.get(job_key) or defaults.get(job_key, fallback)
+
+    if items:
+        service_default = lookup(service_type, DEFAULT_SERVICE_TYPE_MINUTES, FALLBACK_JOB_MINUTES)
+        estimates = [lookup(item, DEFAULT_ITEM_MINUTES, service_default) for item in items]
+    else:
+        estimates = [lookup(service_type, DEFAULT_SERVICE_TYPE_MINUTES, FALLBACK_JOB_MINUTES)]
+    return (math.ceil(sum(median for median, _ in estimates)),
+            math.ceil(sum(p90 for _, p90 in estimates)))
+
+def get_duration_table():
+    """Get the estimate in use for every configured or learned job key"""
+    model = get_duration_model()
+    conn = sqlite3.connect('vehicle_service.db')
+    samples = dict(conn.execute("SELECT job_key, samples FROM job_durations").fetchall())
+    conn.close()
+
+    rows = []
+    for job_key, defaults in {**DEFAULT_SERVICE_TYPE_MINUTES, **DEFAULT_ITEM_MINUTES}.items():
+        rows.append((job_key, *(model.get(job_key) or defaults), samples.get(job_key, 0),
+                     'Learned' if job_key in model else 'Default'))
+    for job_key in model.keys() - DEFAULT_SERVICE_TYPE_MINUTES.keys() - DEFAULT_ITEM_MINUTES.keys():
+        rows.append((job_key, *model[job_key], samples[job_key], 'Learned'))
+    return pd.DataFrame(rows, columns=['job', 'median_minutes', 'p90_minutes', 'samples', 'source'])
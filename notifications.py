@@ -0,0 +1,319 @@
+"""
+Customer email notifications through a transactional outbox.
+
+Notifications are written to notification_outbox inside the transaction
+that makes the booking or status change they describe, so a message is
+queued exactly when the change commits and the request never waits on
+mail delivery. A background sender thread drains the outbox in batches
+over one reused SMTP connection per batch, retrying failures with
+exponential backoff.
+
+The SMTP server is configured from api.env (or the environment) and
+defaults to a local debugging server on localhost:1025 (for example
+`python -m aiosmtpd -n -l localhost:1025`).
+"""
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+import pandas as pd
+from dotenv import load_dotenv
+from vehicles import mark_due_reminded
+
+load_dotenv('api.env')
+
+SMTP_HOST = os.getenv('SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '1025'))
+SMTP_USER = os.getenv('SMTP_USER')
+SMTP_PASSWORD = os.getenv('SMTP_PASSWORD')
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', '').lower() in ('1', 'true', 'yes')
+SMTP_FROM = os.getenv('SMTP_FROM', 'noreply@vehicleservice.local')
+
+# Messages sent per batch (over one SMTP connection)
+OUTBOX_BATCH_SIZE = 50
+
+# Seconds the sender sleeps when the outbox is empty
+OUTBOX_POLL_SECONDS = 5
+
+# Retry backoff: RETRY_BASE_SECONDS * 2 ** (attempts - 1), capped
+RETRY_BASE_SECONDS = 30
+MAX_RETRY_SECONDS = 3600
+MAX_SEND_ATTEMPTS = 6
+
+# Email subject and body per new booking status
+STATUS_MESSAGES = {
+    "Pending": ("Booking confirmed: {booking_id}",
+                "Your service booking {booking_id} for {vehicle_number} on {booking_date} "
+                "({time_slot}) is confirmed."),
+    "Waitlisted": ("Added to the waitlist: {booking_id}",
+                   "The slot you chose for {vehicle_number} on {booking_date} ({time_slot}) is full. "
+                   "Booking {booking_id} is on the waitlist and will be confirmed if a place frees up."),
+    "In Progress": ("Service started: {booking_id}",
+                    "Work on {vehicle_number} (booking {booking_id}) has started."),
+    "Completed": ("Service completed: {booking_id}",
+                  "Work on {vehicle_number} (booking {booking_id}) is complete and ready for pickup."),
+    "Cancelled": ("Booking cancelled: {booking_id}",
+                  "Your service booking {booking_id} for {vehicle_number} on {booking_date} "
+                  "has been cancelled.")
+}
+
+_sender_lock = threading.Lock()
+_sender_thread = None
+
+def init_outbox_db(c):
+    """Create the notification outbox table"""
+    c.execute('''CREATE TABLE IF NOT EXISTS notification_outbox
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  recipient TEXT NOT NULL,
+                  subject TEXT NOT NULL,
+                  body TEXT NOT NULL,
+                  booking_id TEXT,
+                  status TEXT NOT NULL DEFAULT 'pending',
+                  attempts INTEGER NOT NULL DEFAULT 0,
+                  next_attempt_at TIMESTAMP NOT NULL,
+                  last_error TEXT,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  sent_at TIMESTAMP)''')
+    # Only undelivered messages are indexed, so the sender's query stays small
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_notification_outbox_due
+                 ON notification_outbox (next_attempt_at, id) WHERE status = 'pending'""")
+
+def queue_notifications(c, messages):
+    """
+    Add messages to the outbox (inside the caller's transaction).
+
+    messages are (recipient, subject, body, booking_id) tuples; messages
+    without a recipient are skipped.
+    """
+    now = str(datetime.now().replace(microsecond=0))
+    c.executemany("""
+        INSERT INTO notification_outbox (recipient, subject, body, booking_id, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, [(*message, now) for message in messages if message[0]])
+
+def queue_status_notifications(c, events):
+    """
+    Queue an email to the customer for each booking status change.
+
+    events are (booking_id, user_id, old_status, new_status, actor)
+    tuples, as written to booking_events in the same transaction.
+    """
+    messages = []
+    for booking_id, _, _, new_status, _ in events:
+        if new_status not in STATUS_MESSAGES:
+            continue
+        c.execute("""
+            SELECT u.email, b.vehicle_number, b.booking_date, b.time_slot
+            FROM bookings b
+            JOIN users u ON u.user_id = b.user_id
+            WHERE b.booking_id = ?
+        """, (booking_id,))
+        row = c.fetchone()
+        if not row:
+            continue
+        email, vehicle_number, booking_date, time_slot = row
+        subject, body = STATUS_MESSAGES[new_status]
+        details = dict(booking_id=booking_id, vehicle_number=vehicle_number,
+                       booking_date=booking_date, time_slot=time_slot)
+        messages.append((email, subject.format(**details), body.format(**details), booking_id))
+    queue_notifications(c, messages)
+
+def queue_due_reminders(start_date, end_date):
+    """Queue service reminders for vehicles due between two dates that were not reminded yet"""
+    conn = sqlite3.connect('vehicle_service.db')
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("""
+            SELECT d.vehicle_id, u.email, v.plate_number, d.due_date, d.due_km
+            FROM vehicle_due_list d
+            JOIN vehicles v ON v.vehicle_id = d.vehicle_id
+            JOIN users u ON u.user_id = v.owner_user_id
+            WHERE d.due_date BETWEEN ? AND ? AND d.reminded_at IS NULL AND u.email IS NOT NULL
+        """, (str(start_date), str(end_date)))
+        due = c.fetchall()
+        queue_notifications(c, [
+            (email, f"Service due for {plate_number}",
+             f"{plate_number} is due for its routine service on {due_date}"
+             + (f" or at {due_km} KM" if due_km else "") + ". Book a slot any time in the app.",
+             None)
+            for _, email, plate_number, due_date, due_km in due
+        ])
+        mark_due_reminded(c, [vehicle_id for vehicle_id, *_ in due])
+        conn.commit()
+        return len(due)
+    finally:
+        conn.close()
+
+def claim_batch(conn, limit=OUTBOX_BATCH_SIZE):
+    """Mark a batch of due messages as being sent and return them"""
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    c.execute("""
+        SELECT id, recipient, subject, body, attempts FROM notification_outbox
+        WHERE status = 'pending' AND next_attempt_at <= ?
+        ORDER BY next_attempt_at, id
+        LIMIT ?
+    """, (str(datetime.now().replace(microsecond=0)), limit))
+    batch = c.fetchall()
+    c.executemany("UPDATE notification_outbox SET status = 'sending' WHERE id = ?",
+                  [(message[0],) for message in batch])
+    conn.commit()
+    return batch
+
+def open_smtp():
+    """Connect to the configured SMTP server"""
+    smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+    if SMTP_STARTTLS:
+        smtp.starttls()
+    if SMTP_USER:
+        smtp.login(SMTP_USER, SMTP_PASSWORD)
+    return smtp
+
+def build_email(recipient, subject, body):
+    """Build a plain-text email from the configured sender"""
+    email = EmailMessage()
+    email['From'] = SMTP_FROM
+    email['To'] = recipient
+    email['Subject'] = subject
+    email.set_content(body)
+    return email
+
+def record_send_result(conn, message, error=None):
+    """
+    Record one message's delivery attempt as soon as it is made.
+
+    A failed message is retried with exponential backoff, or marked
+    failed after MAX_SEND_ATTEMPTS.
+    """
+    message_id, _, _, _, attempts = message
+    now = datetime.now().replace(microsecond=0)
+    if error is None:
+        conn.execute("""
+            UPDATE notification_outbox SET status = 'sent', attempts = attempts + 1, sent_at = ?
+            WHERE id = ?
+        """, (str(now), message_id))
+    else:
+        conn.execute("""
+            UPDATE notification_outbox
+            SET status = ?, attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+            WHERE id = ?
+        """, ('failed' if attempts + 1 >= MAX_SEND_ATTEMPTS else 'pending',
+              str(now + timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** attempts, MAX_RETRY_SECONDS))),
+              error, message_id))
+    conn.commit()
+
+def send_batch(conn, batch):
+    """
+    Deliver a claimed batch over one SMTP connection. Returns (sent, failed).
+
+    Each message's outcome is committed right after its attempt, so a
+    sender that stops mid-batch never sends a delivered message again.
+    Messages not attempted because of an unexpected error go back in the
+    queue.
+    """
+    sent = failed = 0
+    remaining = [message[0] for message in batch]
+    try:
+        try:
+            smtp = open_smtp()
+        except Exception as e:
+            for message in batch:
+                record_send_result(conn, message, str(e))
+                remaining.remove(message[0])
+            return sent, len(batch)
+
+        with smtp:
+            for message in batch:
+                _, recipient, subject, body, _ = message
+                try:
+                    smtp.send_message(build_email(recipient, subject, body))
+                except Exception as e:
+                    record_send_result(conn, message, str(e))
+                    failed += 1
+                else:
+                    record_send_result(conn, message)
+                    sent += 1
+                remaining.remove(message[0])
+        return sent, failed
+    finally:
+        if remaining:
+            conn.rollback()
+            conn.executemany("UPDATE notification_outbox SET status = 'pending' WHERE id = ? AND status = 'sending'",
+                             [(message_id,) for message_id in remaining])
+            conn.commit()
+
+def drain_outbox():
+    """Send every message that is due now, batch by batch. Returns (sent, failed)."""
+    conn = sqlite3.connect('vehicle_service.db', timeout=30)
+    try:
+        total_sent = total_failed = 0
+        while True:
+            batch = claim_batch(conn)
+            if not batch:
+                return total_sent, total_failed
+            sent, failed = send_batch(conn, batch)
+            total_sent += sent
+            total_failed += failed
+            if not sent:
+                # The server is refusing everything; leave the rest for the next poll
+                return total_sent, total_failed
+    finally:
+        conn.close()
+
+def run_sender():
+    """Drain the outbox forever (the background sender thread's loop)"""
+    # Messages claimed by a sender that stopped mid-batch go back in the queue
+    conn = sqlite3.connect('vehicle_service.db', timeout=30)
+    conn.execute("UPDATE notification_outbox SET status = 'pending' WHERE status = 'sending'")
+    conn.commit()
+    conn.close()
+    while True:
+        try:
+            drain_outbox()
+        except Exception:
+            # Keep the sender alive; anything it had claimed was recorded or requeued
+            pass
+        time.sleep(OUTBOX_POLL_SECONDS)
+
+def start_notification_sender():
+    """Start the background sender once per process"""
+    global _sender_thread
+    with _sender_lock:
+        if _sender_thread is None or not _sender_thread.is_alive():
+            _sender_thread = threading.Thread(target=run_sender, name="notification-sender", daemon=True)
+            _sender_thread.start()
+
+def get_outbox_summary():
+    """Count outbox messages per status"""
+    conn = sqlite3.connect('vehicle_service.db')
+    summary = dict(conn.execute("SELECT status, COUNT(*) FROM notification_outbox GROUP BY status").fetchall())
+    conn.close()
+    return summary
+
+def get_failed_notifications(limit=20):
+    """Get the most recent messages that gave up after MAX_SEND_ATTEMPTS"""
+    conn = sqlite3.connect('vehicle_service.db')
+    failed_df = pd.read_sql_query("""
+        SELECT id, recipient, subject, attempts, last_error, created_at
+        FROM notification_outbox WHERE status = 'failed'
+        ORDER BY id DESC LIMIT ?
+    """, conn, params=(limit,))
+    conn.close()
+    return failed_df
+
+def retry_failed_notifications():
+    """Put failed messages back in the queue, returning how many"""
+    conn = sqlite3.connect('vehicle_service.db')
+    c = conn.cursor()
+    c.execute("""
+        UPDATE notification_outbox SET status = 'pending', attempts = 0, next_attempt_at = ?
+        WHERE status = 'failed'
+    """, (str(datetime.now().replace(microsecond=0)),))
+    retried = c.rowcount
+    conn.commit()
+    conn.close()
+    return retried
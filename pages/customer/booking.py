@@ -1,10 +1,14 @@
 import streamlit as st
 import sqlite3
 import pandas as pd
-from datetime import datetime, timedelta
 import google.generativeai as genai
 import os
 from dotenv import load_dotenv
+from booking_slots import (
+    TIME_SLOTS, get_booking_dates, get_slot_availability,
+    get_slot_span, slot_fits, format_time_slot, format_minutes, get_booking_minutes, create_booking,
+    show_availability_calendar, generate_booking_id, get_idempotency_key
+)
 
 load_dotenv()
 
@@ -52,6 +56,10 @@ def show_booking_form():
                 st.info("AI Analysis Result:")
                 st.json(recommendation)
     
+    # Free places for every slot over the booking window
+    with st.expander("📅 Availability Calendar"):
+        show_availability_calendar()
+    
     # Booking Form
     with st.form("service_booking_form"):
         st.subheader("Service Booking Details")
@@ -76,37 +84,31 @@ def show_booking_form():
             )
         
         with col2:
-            # Date selection (exclude past dates and next 30 days)
-            min_date = datetime.now().date()
-            max_date = min_date + timedelta(days=30)
+            # Date selection (exclude past dates, up to the booking window)
+            min_date, max_date = get_booking_dates()
             date = st.date_input(
                 "Preferred Date",
                 min_value=min_date,
                 max_value=max_date
             )
             
-            # Time slot selection
-            available_slots = [
-                "09:00 AM", "10:00 AM", "11:00 AM",
-                "12:00 PM", "02:00 PM", "03:00 PM",
-                "04:00 PM", "05:00 PM"
-            ]
-            time_slot = st.selectbox("Preferred Time", available_slots)
-            
-            # Check slot availability
-            conn = sqlite3.connect('vehicle_service.db')
-            c = conn.cursor()
-            c.execute("""
-                SELECT COUNT(*) FROM bookings 
-                WHERE booking_date=? AND time_slot=?
-            """, (date, time_slot))
-            slot_count = c.fetchone()[0]
-            conn.close()
+            # Time slot selection with free bay time from the slot capacity
+            slot_availability = get_slot_availability(date)
+            minutes_needed = get_booking_minutes(service_type, None)
+            time_slot = st.selectbox(
+                "Preferred Time",
+                TIME_SLOTS,
+                format_func=lambda x: format_time_slot(x, slot_availability, minutes_needed)
+            )
             
-            if slot_count >= 3:  # Assuming max 3 bookings per slot
+            if get_slot_span(time_slot, minutes_needed) is None:
+                st.error("⚠️ This service runs past the end of the day from this slot. Please select an earlier time.")
+            elif not slot_fits(time_slot, slot_availability, minutes_needed):
                 st.error("⚠️ This slot is fully booked. Please select another time.")
             else:
-                st.success(f"✅ {3 - slot_count} slots available")
+                st.success(f"✅ {format_minutes(slot_availability[time_slot])} of bay time available")
+            
+            join_waitlist = st.checkbox("Join the waitlist if this slot is full")
         
         # Additional details
         st.text_area(
@@ -121,33 +123,43 @@ def show_booking_form():
         )
         
         submitted = st.form_submit_button("Book Service")
+        submission_key = get_idempotency_key(
+            "service_booking_form", customer_name, vehicle_number, service_type,
+            date, time_slot, join_waitlist, problem_description
+        )
         
         if submitted:
             if not all([customer_name, vehicle_number, service_type, date, time_slot]):
                 st.error("Please fill in all required fields.")
             else:
-                try:
-                    conn = sqlite3.connect('vehicle_service.db')
-                    c = conn.cursor()
-                    
-                    # Generate booking ID
-                    booking_id = f"BK{datetime.now().strftime('%Y%m%d%H%M%S')}"
-                    
-                    c.execute("""
-                        INSERT INTO bookings 
-                        (booking_id, customer_name, vehicle_type, vehicle_number,
-                         service_type, booking_date, time_slot, status, description)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        booking_id, customer_name, vehicle_type, vehicle_number,
-                        ", ".join(service_type), date, time_slot, "Pending",
-                        problem_description
-                    ))
-                    
-                    conn.commit()
-                    
+                # Generate booking ID (a repeated submit keeps the original one)
+                last_submission = st.session_state.get('service_booking_form_last')
+                if last_submission and last_submission[0] == submission_key:
+                    booking_id = last_submission[1]
+                else:
+                    booking_id = generate_booking_id()
+                
+                # Reserve the slot and insert the booking in one transaction
+                success, message = create_booking({
+                    'booking_id': booking_id,
+                    'customer_name': customer_name,
+                    'user_id': st.session_state.get('user', {}).get('user_id'),
+                    'vehicle_type': vehicle_type,
+                    'vehicle_number': vehicle_number,
+                    'service_type': ", ".join(service_type),
+                    'booking_date': date,
+                    'time_slot': time_slot,
+                    'status': "Pending",
+                    'description': problem_description
+                }, join_waitlist=join_waitlist,
+                   items=service_type,
+                   actor=st.session_state.get('user', {}).get('username'),
+                   idempotency_key=submission_key)
+                
+                if success:
+                    st.session_state['service_booking_form_last'] = (submission_key, booking_id)
                     # Success message with booking details
-                    st.success("🎉 Service booked successfully!")
+                    st.success(f"🎉 {message}")
                     st.info(f"""
                         Booking Details:
                         - Booking ID: {booking_id}
@@ -156,17 +168,16 @@ def show_booking_form():
                         
                         We'll send you a confirmation email shortly.
                     """)
-                    
-                except Exception as e:
-                    st.error(f"An error occurred: {str(e)}")
-                finally:
-                    conn.close()
+                else:
+                    st.error(f"An error occurred: {message}")
 
 def show_my_bookings():
     st.header("My Bookings")
     
+    # Only the logged-in customer's bookings (indexed on user_id)
+    user_id = st.session_state.get('user', {}).get('user_id')
     conn = sqlite3.connect('vehicle_service.db')
-    df = pd.read_sql_query("SELECT * FROM bookings", conn)
+    df = pd.read_sql_query("SELECT * FROM bookings WHERE user_id = ?", conn, params=(user_id,))
     conn.close()
     
     if not df.empty:
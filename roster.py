@@ -0,0 +1,232 @@
+"""
+Staff shift roster generation from forecast demand.
+
+Demand per weekday and time slot is forecast from recent booking
+history: the average booked bay minutes (long jobs counting in every
+slot they span) and bookings for that weekday and slot. Each duty's
+staff requirement per slot follows from that forecast, and every day is
+covered greedily with the shift that covers the most still-uncovered
+slots per staff-hour. With shifts made of whole consecutive slots this
+uses the fewest staff-hours. Shifts go to the least-worked staff member
+of the duty who is free that day and under the weekly shift limit;
+shifts nobody can take are reported as shortfalls.
+"""
+import heapq
+import sqlite3
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from booking_slots import TIME_SLOTS, SLOT_MINUTES, INACTIVE_BOOKING_STATUSES, get_slot_span
+
+# Weeks of booking history used for the forecast
+FORECAST_WEEKS = 12
+
+# Duties that are rostered
+ROSTER_DUTIES = ["Mechanic", "Helper", "Receptionist"]
+
+# Shifts as (first slot, last slot + 1) into TIME_SLOTS
+SHIFTS = {
+    "Morning": (0, 2),
+    "Afternoon": (2, 4),
+    "Full Day": (0, 4)
+}
+
+# Coverage rules per slot
+HELPERS_PER_MECHANIC = 0.5
+BOOKINGS_PER_RECEPTIONIST = 6
+MIN_STAFF_PER_SLOT = {
+    "Mechanic": 1,
+    "Helper": 0,
+    "Receptionist": 1
+}
+
+# Most shifts one staff member works in a week (Monday to Sunday)
+MAX_SHIFTS_PER_WEEK = 6
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+def init_roster_db(c):
+    """Create the roster table"""
+    c.execute('''CREATE TABLE IF NOT EXISTS roster_shifts
+                 (shift_date DATE NOT NULL,
+                  staff_id TEXT NOT NULL REFERENCES staff(staff_id),
+                  duty TEXT NOT NULL,
+                  shift TEXT NOT NULL,
+                  hours REAL NOT NULL,
+                  PRIMARY KEY (shift_date, staff_id))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_roster_shifts_staff ON roster_shifts(staff_id, shift_date)")
+
+def get_shift_hours(shift):
+    """Get the working hours of a shift"""
+    first_slot, end_slot = SHIFTS[shift]
+    return (end_slot - first_slot) * SLOT_MINUTES / 60
+
+def forecast_slot_demand(as_of, weeks=FORECAST_WEEKS):
+    """
+    Forecast average bay minutes and bookings per weekday and slot.
+
+    Returns two (7 weekdays x len(TIME_SLOTS)) arrays, from the bookings
+    of the given number of weeks before as_of.
+    """
+    start_date = as_of - timedelta(weeks=weeks)
+    conn = sqlite3.connect('vehicle_service.db')
+    bookings_df = pd.read_sql_query(f"""
+        SELECT booking_date, time_slot, COALESCE(slot_minutes, ?) AS slot_minutes
+        FROM bookings
+        WHERE booking_date >= ? AND booking_date < ?
+          AND status NOT IN ({','.join('?' * len(INACTIVE_BOOKING_STATUSES))})
+    """, conn, params=(SLOT_MINUTES, str(start_date), str(as_of), *INACTIVE_BOOKING_STATUSES))
+    conn.close()
+
+    minutes = np.zeros((7, len(TIME_SLOTS)))
+    bookings = np.zeros((7, len(TIME_SLOTS)))
+    bookings_df = bookings_df[bookings_df['time_slot'].isin(TIME_SLOTS)]
+    if not bookings_df.empty:
+        slot_index = {slot: i for i, slot in enumerate(TIME_SLOTS)}
+        weekdays = pd.to_datetime(bookings_df['booking_date']).dt.weekday.to_numpy()
+        slots = bookings_df['time_slot'].map(slot_index).to_numpy()
+        np.add.at(bookings, (weekdays, slots), 1)
+        # Long jobs occupy the following slots too
+        spans = [(weekday, slot_index[slot], slot_minutes)
+                 for weekday, time_slot, job_minutes in zip(weekdays, bookings_df['time_slot'],
+                                                            bookings_df['slot_minutes'])
+                 for slot, slot_minutes in get_slot_span(time_slot, job_minutes) or [(time_slot, job_minutes)]]
+        span_weekdays, span_slots, span_minutes = (np.array(column) for column in zip(*spans))
+        np.add.at(minutes, (span_weekdays, span_slots), span_minutes)
+    return minutes / weeks, bookings / weeks
+
+def get_staff_requirements(minutes, bookings):
+    """Get {duty: staff needed per weekday and slot} from forecast demand"""
+    mechanics = np.maximum(np.ceil(minutes / SLOT_MINUTES), MIN_STAFF_PER_SLOT["Mechanic"])
+    return {
+        "Mechanic": mechanics.astype(int),
+        "Helper": np.maximum(np.ceil(mechanics * HELPERS_PER_MECHANIC),
+                             MIN_STAFF_PER_SLOT["Helper"]).astype(int),
+        "Receptionist": np.maximum(np.ceil(bookings / BOOKINGS_PER_RECEPTIONIST),
+                                   MIN_STAFF_PER_SLOT["Receptionist"]).astype(int)
+    }
+
+def plan_day_shifts(required):
+    """
+    Choose the shifts that cover one day's per-slot staff requirement.
+
+    Greedy: repeatedly take the shift covering the most uncovered slots
+    per hour (shorter shifts win ties). A Morning and an Afternoon shift
+    are then merged into one Full Day shift, which has the same hours but
+    needs one person instead of two. Returns a list of shift names.
+    """
+    remaining = np.array(required, dtype=int)
+    shifts = []
+    while remaining.any():
+        shift = max(SHIFTS, key=lambda name: (
+            np.count_nonzero(remaining[SHIFTS[name][0]:SHIFTS[name][1]]) / get_shift_hours(name),
+            -get_shift_hours(name)
+        ))
+        first_slot, end_slot = SHIFTS[shift]
+        remaining[first_slot:end_slot] = np.maximum(remaining[first_slot:end_slot] - 1, 0)
+        shifts.append(shift)
+
+    full_days = min(shifts.count("Morning"), shifts.count("Afternoon"))
+    for _ in range(full_days):
+        shifts.remove("Morning")
+        shifts.remove("Afternoon")
+    return ["Full Day"] * full_days + shifts
+
+def plan_roster(start_date, days, requirements, staff):
+    """
+    Build a roster for a date range.
+
+    requirements is {duty: (7 x slots) array} and staff {duty: [staff_id]}.
+    Returns (shifts as (date, staff_id, duty, shift, hours),
+    shortfalls as (date, duty, shift)).
+    """
+    shifts, shortfalls = [], []
+    for duty, required in requirements.items():
+        # Least-worked staff first; entries are (hours, staff_id)
+        heap = [(0.0, staff_id) for staff_id in staff.get(duty, [])]
+        heapq.heapify(heap)
+        week_shifts = {}
+        for offset in range(days):
+            day = start_date + timedelta(days=offset)
+            week = day.isocalendar()[:2]
+            working_today = set()
+            for shift in plan_day_shifts(required[day.weekday()]):
+                skipped, chosen = [], None
+                while heap:
+                    hours, staff_id = heapq.heappop(heap)
+                    if staff_id in working_today or week_shifts.get((staff_id, week), 0) >= MAX_SHIFTS_PER_WEEK:
+                        skipped.append((hours, staff_id))
+                        continue
+                    chosen = (hours, staff_id)
+                    break
+                for entry in skipped:
+                    heapq.heappush(heap, entry)
+                if chosen is None:
+                    shortfalls.append((day, duty, shift))
+                    continue
+                hours, staff_id = chosen
+                shift_hours = get_shift_hours(shift)
+                heapq.heappush(heap, (hours + shift_hours, staff_id))
+                working_today.add(staff_id)
+                week_shifts[(staff_id, week)] = week_shifts.get((staff_id, week), 0) + 1
+                shifts.append((day, staff_id, duty, shift, shift_hours))
+    return shifts, shortfalls
+
+def generate_roster(start_date, days):
+    """
+    Forecast demand and replace the roster for a date range in one transaction.
+
+    Returns (success, message, shortfalls dataframe).
+    """
+    minutes, bookings = forecast_slot_demand(start_date)
+    requirements = get_staff_requirements(minutes, bookings)
+
+    conn = sqlite3.connect('vehicle_service.db')
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute(f"SELECT duty, staff_id FROM staff WHERE duty IN ({','.join('?' * len(ROSTER_DUTIES))})",
+                  ROSTER_DUTIES)
+        staff = {}
+        for duty, staff_id in c.fetchall():
+            staff.setdefault(duty, []).append(staff_id)
+
+        shifts, shortfalls = plan_roster(start_date, days, requirements, staff)
+        end_date = start_date + timedelta(days=days - 1)
+        c.execute("DELETE FROM roster_shifts WHERE shift_date BETWEEN ? AND ?",
+                  (str(start_date), str(end_date)))
+        c.executemany("""
+            INSERT INTO roster_shifts (shift_date, staff_id, duty, shift, hours)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(str(day), staff_id, duty, shift, hours) for day, staff_id, duty, shift, hours in shifts])
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return False, str(e), pd.DataFrame()
+    finally:
+        conn.close()
+
+    shortfalls_df = pd.DataFrame(shortfalls, columns=['date', 'duty', 'shift'])
+    message = (f"Rostered {len(shifts)} shift(s), "
+               f"{sum(shift[4] for shift in shifts):.0f} staff-hours.")
+    if shortfalls:
+        message += f" {len(shortfalls)} shift(s) could not be filled."
+    return True, message, shortfalls_df
+
+def get_forecast_table(as_of):
+    """Get the forecast bay minutes per weekday and slot as a dataframe"""
+    minutes, _ = forecast_slot_demand(as_of)
+    return pd.DataFrame(minutes.round(0), index=WEEKDAYS, columns=TIME_SLOTS)
+
+def get_roster(start_date, end_date):
+    """Get the roster between two dates with staff names"""
+    conn = sqlite3.connect('vehicle_service.db')
+    roster_df = pd.read_sql_query("""
+        SELECT r.shift_date, s.name, r.duty, r.shift, r.hours
+        FROM roster_shifts r
+        JOIN staff s ON s.staff_id = r.staff_id
+        WHERE r.shift_date BETWEEN ? AND ?
+        ORDER BY r.shift_date, r.duty, s.name
+    """, conn, params=(str(start_date), str(end_date)))
+    conn.close()
+    return roster_df
@@ -0,0 +1,213 @@
+"""
+Automatic assignment of booked jobs to mechanics.
+
+Pending bookings for a day are handed out slot by slot. Mechanics sit in
+a min-heap keyed on the minutes of work already assigned to them that
+day, so each job goes to the least loaded mechanic who can fit it into
+the slot. Jobs are sized by their median duration estimate (see
+durations.py), and a mechanic who lacks the skill for a job's service
+type is expected to take longer on it, which is weighed against their
+load.
+
+Assignments are stored one row per booking and indexed by
+(staff_id, assignment_date), so a mechanic's schedule is a range read.
+"""
+import heapq
+import math
+import sqlite3
+import pandas as pd
+from booking_slots import TIME_SLOTS, SLOT_MINUTES, INACTIVE_BOOKING_STATUSES
+from durations import estimate_job_minutes, load_duration_model
+
+# Service types mechanics can be skilled in
+SERVICE_TYPES = ["Regular Maintenance", "Repair", "Washing"]
+
+# How much longer a job takes a mechanic without the matching skill
+UNSKILLED_DURATION_FACTOR = 1.5
+
+def init_assignment_db(c):
+    """Create the mechanic skills and job assignment tables"""
+    c.execute('''CREATE TABLE IF NOT EXISTS staff_skills
+                 (staff_id TEXT NOT NULL REFERENCES staff(staff_id),
+                  skill TEXT NOT NULL,
+                  PRIMARY KEY (staff_id, skill)) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS job_assignments
+                 (booking_id TEXT PRIMARY KEY REFERENCES bookings(booking_id),
+                  staff_id TEXT NOT NULL REFERENCES staff(staff_id),
+                  assignment_date DATE NOT NULL,
+                  time_slot TEXT NOT NULL,
+                  expected_minutes INTEGER NOT NULL,
+                  assigned_by TEXT,
+                  assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_job_assignments_staff
+                 ON job_assignments (staff_id, assignment_date)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_job_assignments_date
+                 ON job_assignments (assignment_date, time_slot)''')
+
+def set_staff_skills(c, staff_id, skills):
+    """Replace a staff member's skills (inside the caller's transaction)"""
+    c.execute("DELETE FROM staff_skills WHERE staff_id = ?", (staff_id,))
+    c.executemany("INSERT INTO staff_skills (staff_id, skill) VALUES (?, ?)",
+                  [(staff_id, skill) for skill in skills])
+
+def plan_assignments(jobs, mechanics, skills, day_load=None, slot_load=None):
+    """
+    Assign jobs to mechanics, balancing each mechanic's minutes for the day.
+
+    jobs are (booking_id, time_slot, service_type, minutes) tuples,
+    mechanics a list of staff ids and skills {staff_id: set of service
+    types}; mechanics with no recorded skills are treated as skilled in
+    everything. day_load {staff_id: minutes} and slot_load
+    {(staff_id, time_slot): minutes} hold work already assigned.
+    A mechanic takes jobs in a slot until it is full, but always takes at
+    least one, so jobs longer than a slot can still be assigned.
+    Returns (assignments as (booking_id, staff_id, time_slot, minutes),
+    booking ids that could not be assigned).
+    """
+    day_load = {staff_id: (day_load or {}).get(staff_id, 0) for staff_id in mechanics}
+    slot_load = dict(slot_load or {})
+    slot_order = {time_slot: index for index, time_slot in enumerate(TIME_SLOTS)}
+    slots = {}
+    for job in jobs:
+        slots.setdefault(job[1], []).append(job)
+
+    assignments, unassigned = [], []
+    for time_slot in sorted(slots, key=lambda slot: slot_order.get(slot, len(slot_order))):
+        heap = [(load, staff_id) for staff_id, load in day_load.items()]
+        heapq.heapify(heap)
+        # Longest jobs first, so short ones fill the gaps
+        for booking_id, _, service_type, job_minutes in sorted(slots[time_slot], key=lambda job: -job[3]):
+            popped, best = [], None
+            while heap:
+                load, staff_id = heap[0]
+                # Nobody further down the heap can finish this job sooner
+                if best and load + job_minutes >= best[0]:
+                    break
+                heapq.heappop(heap)
+                popped.append((load, staff_id))
+                skilled = not skills.get(staff_id) or service_type in skills[staff_id]
+                minutes = job_minutes if skilled else math.ceil(job_minutes * UNSKILLED_DURATION_FACTOR)
+                used = slot_load.get((staff_id, time_slot), 0)
+                if used and used + minutes > SLOT_MINUTES:
+                    continue
+                if best is None or load + minutes < best[0]:
+                    best = (load + minutes, minutes, staff_id)
+
+            for load, staff_id in popped:
+                if best and staff_id == best[2]:
+                    load = best[0]
+                heapq.heappush(heap, (load, staff_id))
+            if best is None:
+                unassigned.append(booking_id)
+                continue
+            finish, minutes, staff_id = best
+            day_load[staff_id] = finish
+            slot_load[(staff_id, time_slot)] = slot_load.get((staff_id, time_slot), 0) + minutes
+            assignments.append((booking_id, staff_id, time_slot, minutes))
+    return assignments, unassigned
+
+def assign_jobs(assignment_date, actor=None):
+    """
+    Assign a day's unassigned Pending bookings to mechanics in one transaction.
+
+    Work already assigned that day counts towards each mechanic's load.
+    Returns (success, message).
+    """
+    conn = sqlite3.connect('vehicle_service.db')
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("SELECT staff_id FROM staff WHERE duty = 'Mechanic'")
+        mechanics = [row[0] for row in c.fetchall()]
+        if not mechanics:
+            conn.rollback()
+            return False, "No mechanics on staff"
+
+        skills = {}
+        c.execute("SELECT staff_id, skill FROM staff_skills")
+        for staff_id, skill in c.fetchall():
+            skills.setdefault(staff_id, set()).add(skill)
+
+        day_load, slot_load = {}, {}
+        c.execute(f"""
+            SELECT a.staff_id, a.time_slot, SUM(a.expected_minutes)
+            FROM job_assignments a
+            JOIN bookings b ON b.booking_id = a.booking_id
+            WHERE a.assignment_date = ?
+              AND b.status NOT IN ({','.join('?' * len(INACTIVE_BOOKING_STATUSES))})
+            GROUP BY a.staff_id, a.time_slot
+        """, (str(assignment_date), *INACTIVE_BOOKING_STATUSES))
+        for staff_id, time_slot, minutes in c.fetchall():
+            day_load[staff_id] = day_load.get(staff_id, 0) + minutes
+            slot_load[(staff_id, time_slot)] = minutes
+
+        c.execute("""
+            SELECT b.booking_id, b.time_slot, b.service_type
+            FROM bookings b
+            LEFT JOIN job_assignments a ON a.booking_id = b.booking_id
+            WHERE b.booking_date = ? AND b.status = 'Pending' AND a.booking_id IS NULL
+        """, (str(assignment_date),))
+        pending = c.fetchall()
+        items = {}
+        c.execute("""
+            SELECT bi.booking_id, bi.item
+            FROM booking_items bi
+            JOIN bookings b ON b.booking_id = bi.booking_id
+            WHERE b.booking_date = ? AND b.status = 'Pending'
+        """, (str(assignment_date),))
+        for booking_id, item in c.fetchall():
+            items.setdefault(booking_id, []).append(item)
+        model = load_duration_model(c)
+        jobs = [(booking_id, time_slot, service_type,
+                 estimate_job_minutes(model, items.get(booking_id), service_type)[0])
+                for booking_id, time_slot, service_type in pending]
+
+        assignments, unassigned = plan_assignments(jobs, mechanics, skills, day_load, slot_load)
+        c.executemany("""
+            INSERT INTO job_assignments
+                (booking_id, staff_id, assignment_date, time_slot, expected_minutes, assigned_by)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(booking_id, staff_id, str(assignment_date), time_slot, minutes, actor)
+              for booking_id, staff_id, time_slot, minutes in assignments])
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return False, str(e)
+    finally:
+        conn.close()
+
+    if not jobs:
+        return True, "No unassigned pending bookings for this date."
+    message = f"{len(assignments)} job(s) assigned."
+    if unassigned:
+        message += f" {len(unassigned)} could not be fitted: {', '.join(unassigned)}."
+    return True, message
+
+def get_assignments(assignment_date):
+    """Get a day's job assignments with mechanic and booking details"""
+    conn = sqlite3.connect('vehicle_service.db')
+    assignments_df = pd.read_sql_query("""
+        SELECT a.time_slot, s.name AS mechanic, a.booking_id, b.vehicle_number,
+               b.service_type, b.status, a.expected_minutes
+        FROM job_assignments a
+        JOIN staff s ON s.staff_id = a.staff_id
+        JOIN bookings b ON b.booking_id = a.booking_id
+        WHERE a.assignment_date = ?
+        ORDER BY a.time_slot, s.name
+    """, conn, params=(str(assignment_date),))
+    conn.close()
+    return assignments_df
+
+def get_mechanic_schedule(staff_id, start_date, end_date):
+    """Get one mechanic's assigned jobs between two dates"""
+    conn = sqlite3.connect('vehicle_service.db')
+    schedule_df = pd.read_sql_query("""
+        SELECT a.assignment_date, a.time_slot, a.booking_id, b.vehicle_number,
+               b.service_type, b.status, a.expected_minutes
+        FROM job_assignments a
+        JOIN bookings b ON b.booking_id = a.booking_id
+        WHERE a.staff_id = ? AND a.assignment_date BETWEEN ? AND ?
+        ORDER BY a.assignment_date, a.time_slot
+    """, conn, params=(staff_id, str(start_date), str(end_date)))
+    conn.close()
+    return schedule_df
@@ -0,0 +1,434 @@
+"""
+Vehicle registry with a precomputed service timeline per vehicle.
+
+Each vehicle is stored once under its normalized plate number together
+with its owner, brand and model. The timeline columns (last service,
+services done, next due date) are refreshed inside the transaction of
+every booking change, so views read one indexed row instead of
+aggregating the vehicle's bookings.
+
+Plates are also indexed by trigram so the front desk can find a vehicle
+from a plate typed with one or two mistakes.
+
+A batch job computes when every vehicle is next due, by date or by
+odometer reading (projected from the vehicle's recorded readings), with
+per-model service intervals, and stores the result in an indexed due
+list for "due this week" lookups and reminder batches.
+"""
+import re
+import sqlite3
+import pandas as pd
+from datetime import datetime, timedelta
+
+# Days between routine services, per vehicle type
+SERVICE_INTERVAL_DAYS = {
+    "Car": 180,
+    "Motorcycle": 90
+}
+DEFAULT_SERVICE_INTERVAL_DAYS = 180
+
+# KM between routine services, per vehicle type
+SERVICE_INTERVAL_KM = {
+    "Car": 10000,
+    "Motorcycle": 3000
+}
+DEFAULT_SERVICE_INTERVAL_KM = 10000
+
+# (days, km) between routine services for models that differ from their type
+MODEL_SERVICE_INTERVALS = {
+    "Nexon EV": (365, 15000),
+    "Tigor EV": (365, 15000),
+    "Kona Electric": (365, 15000),
+    "ZS EV": (365, 15000),
+    "EV6": (365, 15000),
+    "Fortuner": (180, 10000),
+    "Land Cruiser": (365, 10000),
+    "Innova": (180, 10000),
+    "Bolero Pickup": (120, 7500),
+    "Jeeto": (120, 7500),
+    "Bolero Maxi Truck": (120, 7500),
+    "Chetak": (180, 5000),
+    "S1000RR": (180, 6000),
+    "M1000RR": (180, 6000),
+    "F850GS": (365, 10000),
+    "Interceptor 650": (180, 5000),
+    "Continental GT 650": (180, 5000),
+    "Super Meteor 650": (180, 5000)
+}
+
+# Assumed KM per day when a vehicle has too few odometer readings
+DEFAULT_DAILY_KM = {
+    "Car": 35,
+    "Motorcycle": 25
+}
+MIN_READING_SPAN_DAYS = 7
+
+# Typos tolerated by the fuzzy plate search
+MAX_PLATE_TYPOS = 2
+
+# Shorter (partial) plates are matched by prefix instead of fuzzily
+MIN_FUZZY_PLATE_LENGTH = 6
+
+# Trigrams a fuzzy match must share with the query, and candidates checked per search
+MIN_SHARED_TRIGRAMS = 3
+MAX_PLATE_CANDIDATES = 200
+
+def get_service_interval(vehicle_type, model=None):
+    """Get the (days, km) between routine services of a vehicle"""
+    if model in MODEL_SERVICE_INTERVALS:
+        return MODEL_SERVICE_INTERVALS[model]
+    return (SERVICE_INTERVAL_DAYS.get(vehicle_type, DEFAULT_SERVICE_INTERVAL_DAYS),
+            SERVICE_INTERVAL_KM.get(vehicle_type, DEFAULT_SERVICE_INTERVAL_KM))
+
+def normalize_plate(vehicle_number):
+    """Normalize a plate number ("ts 09-ab 1234" -> "TS09AB1234")"""
+    return re.sub(r'[^A-Z0-9]', '', str(vehicle_number or '').upper())
+
+def init_vehicle_db(c):
+    """Create the vehicles table and link existing bookings to it"""
+    c.execute('''CREATE TABLE IF NOT EXISTS vehicles
+                 (vehicle_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  plate_number TEXT UNIQUE NOT NULL,
+                  vehicle_type TEXT NOT NULL,
+                  brand TEXT,
+                  model TEXT,
+                  owner_user_id TEXT REFERENCES users(user_id),
+                  last_service_date DATE,
+                  last_service_km INTEGER,
+                  last_service_type TEXT,
+                  services_done INTEGER NOT NULL DEFAULT 0,
+                  next_due_date DATE,
+                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vehicles_owner ON vehicles(owner_user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bookings_vehicle ON bookings(vehicle_id, booking_date)")
+
+    # Trigram index over plate numbers for fuzzy search
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'plate_trigrams'")
+    index_existing_plates = c.fetchone() is None
+    c.execute('''CREATE TABLE IF NOT EXISTS plate_trigrams
+                 (trigram TEXT NOT NULL,
+                  vehicle_id INTEGER NOT NULL REFERENCES vehicles(vehicle_id),
+                  PRIMARY KEY (trigram, vehicle_id)) WITHOUT ROWID''')
+    if index_existing_plates:
+        c.execute("SELECT vehicle_id, plate_number FROM vehicles")
+        for vehicle_id, plate_number in c.fetchall():
+            index_plate_trigrams(c, vehicle_id, plate_number)
+
+    # Register vehicles for bookings made before the registry existed
+    c.execute("""
+        SELECT booking_id, vehicle_number, vehicle_type, user_id FROM bookings
+        WHERE vehicle_id IS NULL
+        ORDER BY booking_date, booking_id
+    """)
+    unlinked = c.fetchall()
+    vehicle_ids = set()
+    for booking_id, vehicle_number, vehicle_type, user_id in unlinked:
+        vehicle_id = upsert_vehicle(c, vehicle_number, vehicle_type, user_id)
+        c.execute("UPDATE bookings SET vehicle_id = ? WHERE booking_id = ?", (vehicle_id, booking_id))
+        vehicle_ids.add(vehicle_id)
+    for vehicle_id in vehicle_ids:
+        refresh_vehicle_timeline(c, vehicle_id)
+
+    # Next service due per vehicle, filled by refresh_due_list
+    c.execute('''CREATE TABLE IF NOT EXISTS vehicle_due_list
+                 (vehicle_id INTEGER PRIMARY KEY REFERENCES vehicles(vehicle_id),
+                  due_date DATE NOT NULL,
+                  due_km INTEGER,
+                  due_reason TEXT NOT NULL,
+                  computed_at TIMESTAMP NOT NULL,
+                  reminded_at TIMESTAMP)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vehicle_due_list_date ON vehicle_due_list(due_date)")
+
+def upsert_vehicle(c, vehicle_number, vehicle_type, owner_user_id=None, brand=None, model=None):
+    """
+    Register a vehicle or fill in its details, returning its vehicle_id.
+
+    The first customer to book a plate becomes its owner; later bookings of
+    the same plate by other customers do not take the vehicle over.
+    """
+    plate_number = normalize_plate(vehicle_number)
+    c.execute("""
+        INSERT INTO vehicles (plate_number, vehicle_type, brand, model, owner_user_id)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(plate_number) DO UPDATE SET
+            vehicle_type = excluded.vehicle_type,
+            brand = COALESCE(excluded.brand, brand),
+            model = COALESCE(excluded.model, model),
+            owner_user_id = COALESCE(owner_user_id, excluded.owner_user_id),
+            updated_at = CURRENT_TIMESTAMP
+    """, (plate_number, vehicle_type, brand, model, owner_user_id))
+    c.execute("SELECT vehicle_id FROM vehicles WHERE plate_number = ?", (plate_number,))
+    vehicle_id = c.fetchone()[0]
+    index_plate_trigrams(c, vehicle_id, plate_number)
+    return vehicle_id
+
+def get_plate_trigrams(plate_number):
+    """Split a normalized plate into trigrams, with start/end markers"""
+    padded = f"^{plate_number}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def index_plate_trigrams(c, vehicle_id, plate_number):
+    """Add a vehicle's plate to the trigram index"""
+    c.executemany("INSERT OR IGNORE INTO plate_trigrams (trigram, vehicle_id) VALUES (?, ?)",
+                  [(trigram, vehicle_id) for trigram in get_plate_trigrams(plate_number)])
+
+def plate_distance(a, b, max_distance):
+    """Levenshtein distance between two plates, or max_distance + 1 once exceeded"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+def search_vehicles(query, max_typos=MAX_PLATE_TYPOS, limit=10):
+    """
+    Find vehicles whose plate matches the query with at most max_typos edits.
+
+    Candidates come from the trigram index (each typo can break at most
+    three trigrams), then are ranked by edit distance. Short plates allow
+    fewer typos so a match still shares MIN_SHARED_TRIGRAMS trigrams, and
+    only the MAX_PLATE_CANDIDATES candidates sharing the most trigrams are
+    checked. Plates starting with the query count as exact matches, so
+    partial plates shorter than MIN_FUZZY_PLATE_LENGTH match by prefix only.
+    """
+    plate_number = normalize_plate(query)
+    if not plate_number:
+        return pd.DataFrame()
+
+    conn = sqlite3.connect('vehicle_service.db')
+    c = conn.cursor()
+    # Plates starting with the query, as typed
+    c.execute("""
+        SELECT vehicle_id FROM vehicles
+        WHERE plate_number >= ? AND plate_number < ?
+        ORDER BY plate_number
+        LIMIT ?
+    """, (plate_number, plate_number + '\uffff', limit))
+    matches = [(0, vehicle_id) for vehicle_id, in c.fetchall()]
+
+    if len(plate_number) >= MIN_FUZZY_PLATE_LENGTH:
+        trigrams = get_plate_trigrams(plate_number)
+        max_typos = max(0, min(max_typos, (len(trigrams) - MIN_SHARED_TRIGRAMS) // 3))
+        c.execute(f"""
+            SELECT v.vehicle_id, v.plate_number
+            FROM (
+                SELECT vehicle_id, COUNT(*) AS shared FROM plate_trigrams
+                WHERE trigram IN ({','.join('?' * len(trigrams))})
+                GROUP BY vehicle_id
+                HAVING COUNT(*) >= ?
+                ORDER BY COUNT(*) DESC
+                LIMIT ?
+            ) t
+            JOIN vehicles v ON v.vehicle_id = t.vehicle_id
+        """, (*trigrams, len(trigrams) - 3 * max_typos, MAX_PLATE_CANDIDATES))
+        found = {vehicle_id for _, vehicle_id in matches}
+        matches = sorted(matches + [
+            (distance, vehicle_id)
+            for vehicle_id, candidate in c.fetchall()
+            if vehicle_id not in found
+            for distance in [plate_distance(plate_number, candidate, max_typos)]
+            if distance <= max_typos
+        ])[:limit]
+
+    if not matches:
+        conn.close()
+        return pd.DataFrame()
+    vehicles_df = pd.read_sql_query(f"""
+        SELECT v.vehicle_id, v.plate_number, v.vehicle_type, v.brand, v.model,
+               u.username AS owner, v.last_service_date, v.services_done, v.next_due_date
+        FROM vehicles v
+        LEFT JOIN users u ON u.user_id = v.owner_user_id
+        WHERE v.vehicle_id IN ({','.join('?' * len(matches))})
+    """, conn, params=[vehicle_id for _, vehicle_id in matches])
+    conn.close()
+
+    distances = {vehicle_id: distance for distance, vehicle_id in matches}
+    vehicles_df['typos'] = vehicles_df['vehicle_id'].map(distances)
+    return vehicles_df.sort_values('typos')
+
+def refresh_vehicle_timeline(c, vehicle_id):
+    """
+    Recompute a vehicle's service timeline from its bookings.
+
+    Must run inside the transaction that changed the bookings.
+    """
+    # A completed booking's service date is the day it was completed; bookings
+    # completed before events were logged use their booking date, up to today
+    c.execute("""
+        SELECT
+            MAX(CASE WHEN status = 'Completed' THEN COALESCE(
+                (SELECT date(MAX(e.created_at), 'localtime') FROM booking_events e
+                 WHERE e.booking_id = bookings.booking_id AND e.new_status = 'Completed'),
+                MIN(booking_date, date('now', 'localtime'))) END),
+            MAX(last_service_date),
+            COUNT(CASE WHEN status = 'Completed' THEN 1 END),
+            (SELECT service_type FROM bookings
+             WHERE vehicle_id = ? AND status = 'Completed'
+             ORDER BY booking_date DESC LIMIT 1)
+        FROM bookings WHERE vehicle_id = ?
+    """, (vehicle_id, vehicle_id))
+    last_completed, last_reported, services_done, last_service_type = c.fetchone()
+
+    # The latest of a completed booking here and the service the customer reported
+    service_dates = [str(d) for d in (last_completed, last_reported) if d]
+    last_service_date = max(service_dates) if service_dates else None
+
+    # The odometer reading the customer gave for that service; a higher figure
+    # quoted for the same service on a later booking is their current mileage
+    last_service_km = None
+    if last_service_date:
+        c.execute("""
+            SELECT MIN(last_service_km) FROM bookings
+            WHERE vehicle_id = ? AND last_service_date = ? AND last_service_km > 0
+        """, (vehicle_id, last_service_date))
+        last_service_km = c.fetchone()[0]
+
+    next_due_date = None
+    if last_service_date:
+        c.execute("SELECT vehicle_type, model FROM vehicles WHERE vehicle_id = ?", (vehicle_id,))
+        interval = get_service_interval(*c.fetchone())[0]
+        next_due_date = str(datetime.strptime(last_service_date[:10], '%Y-%m-%d').date()
+                            + timedelta(days=interval))
+
+    c.execute("""
+        UPDATE vehicles SET
+            last_service_date = ?, last_service_km = ?, last_service_type = ?,
+            services_done = ?, next_due_date = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE vehicle_id = ?
+    """, (last_service_date, last_service_km, last_service_type, services_done,
+          next_due_date, vehicle_id))
+
+def get_vehicle(vehicle_number):
+    """Get a vehicle and its service timeline as a dict, or None"""
+    conn = sqlite3.connect('vehicle_service.db')
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute("SELECT * FROM vehicles WHERE plate_number = ?", (normalize_plate(vehicle_number),))
+    vehicle = c.fetchone()
+    conn.close()
+    return dict(vehicle) if vehicle else None
+
+def get_user_vehicles(user_id):
+    """Get the service timelines of every vehicle a customer owns"""
+    conn = sqlite3.connect('vehicle_service.db')
+    vehicles_df = pd.read_sql_query("""
+        SELECT v.plate_number, v.vehicle_type, v.brand, v.model, v.last_service_date,
+               v.last_service_km, v.services_done,
+               COALESCE(d.due_date, v.next_due_date) AS next_due_date, d.due_km AS next_due_km
+        FROM vehicles v
+        LEFT JOIN vehicle_due_list d ON d.vehicle_id = v.vehicle_id
+        WHERE v.owner_user_id = ?
+        ORDER BY next_due_date
+    """, conn, params=(user_id,))
+    conn.close()
+    return vehicles_df
+
+def refresh_due_list():
+    """
+    Recompute the next service due for every vehicle in one batch.
+
+    A vehicle is due at its interval after the last service, or when its
+    odometer is projected to pass its reading at the last service plus the
+    KM interval, whichever comes first. Odometer readings are the KM the
+    customer gave for a previous service, dated by that service (not by
+    the booking). The daily KM rate comes from the first and latest
+    readings, and when the last service was after the latest reading its
+    KM is projected forward at that rate.
+    Reminders already sent are kept unless the due date moved.
+    Returns the number of vehicles on the due list.
+    """
+    conn = sqlite3.connect('vehicle_service.db')
+    try:
+        vehicles_df = pd.read_sql_query("""
+            SELECT vehicle_id, vehicle_type, model, last_service_date
+            FROM vehicles
+            WHERE last_service_date IS NOT NULL
+        """, conn)
+        readings_df = pd.read_sql_query("""
+            SELECT vehicle_id, last_service_date AS reading_date, MIN(last_service_km) AS km
+            FROM bookings
+            WHERE vehicle_id IS NOT NULL AND last_service_date IS NOT NULL AND last_service_km > 0
+            GROUP BY vehicle_id, last_service_date
+        """, conn)
+
+        intervals = [get_service_interval(vehicle_type, model) for vehicle_type, model
+                     in zip(vehicles_df['vehicle_type'], vehicles_df['model'])]
+        interval_days = pd.Series([days for days, _ in intervals], index=vehicles_df.index)
+        interval_km = pd.Series([km for _, km in intervals], index=vehicles_df.index)
+        last_service = pd.to_datetime(vehicles_df['last_service_date'].str[:10])
+        due_by_date = last_service + pd.to_timedelta(interval_days, unit='D')
+
+        # Daily KM from the first and latest readings, with a default per type
+        readings_df['reading_date'] = pd.to_datetime(readings_df['reading_date'].str[:10])
+        readings = readings_df.sort_values('reading_date').groupby('vehicle_id').agg(
+            first_date=('reading_date', 'first'), first_km=('km', 'first'),
+            latest_date=('reading_date', 'last'), latest_km=('km', 'last')
+        ).reindex(vehicles_df['vehicle_id'])
+        readings.index = vehicles_df.index
+        span_days = (readings['latest_date'] - readings['first_date']).dt.days
+        daily_km = ((readings['latest_km'] - readings['first_km']) / span_days).where(
+            (span_days >= MIN_READING_SPAN_DAYS) & (readings['latest_km'] > readings['first_km']),
+            vehicles_df['vehicle_type'].map(DEFAULT_DAILY_KM).fillna(min(DEFAULT_DAILY_KM.values()))
+        )
+        # KM at the last service: the reading taken then, or projected from the latest reading
+        service_km = readings['latest_km'] + daily_km * (
+            (last_service - readings['latest_date']).dt.days.clip(lower=0)
+        )
+        due_km = (service_km + interval_km).round()
+        # Projections beyond ten years are capped; the date interval comes first anyway
+        days_to_km = ((due_km - readings['latest_km']) / daily_km).clip(lower=0, upper=3650)
+        due_by_km = readings['latest_date'] + pd.to_timedelta(days_to_km, unit='D')
+
+        by_km = due_by_km.notna() & (due_by_km < due_by_date)
+        due_date = due_by_date.where(~by_km, due_by_km).dt.date.astype(str)
+        due_reason = by_km.map({True: 'KM', False: 'Date'})
+        computed_at = str(datetime.now().replace(microsecond=0))
+
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.executemany("""
+            INSERT INTO vehicle_due_list (vehicle_id, due_date, due_km, due_reason, computed_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(vehicle_id) DO UPDATE SET
+                reminded_at = CASE WHEN due_date = excluded.due_date THEN reminded_at END,
+                due_date = excluded.due_date,
+                due_km = excluded.due_km,
+                due_reason = excluded.due_reason,
+                computed_at = excluded.computed_at
+        """, [(int(vehicle_id), date, None if pd.isna(km) else int(km), reason, computed_at)
+              for vehicle_id, date, km, reason
+              in zip(vehicles_df['vehicle_id'], due_date, due_km, due_reason)])
+        c.execute("DELETE FROM vehicle_due_list WHERE computed_at != ?", (computed_at,))
+        conn.commit()
+        return len(vehicles_df)
+    finally:
+        conn.close()
+
+def get_vehicles_due(start_date, end_date, unreminded_only=False):
+    """Get vehicles due for service between two dates, with their owner's contact details"""
+    conn = sqlite3.connect('vehicle_service.db')
+    vehicles_df = pd.read_sql_query(f"""
+        SELECT d.due_date, d.due_reason, d.due_km, v.plate_number, v.vehicle_type,
+               v.brand, v.model, v.last_service_date, u.username AS owner, u.email,
+               d.reminded_at, d.vehicle_id
+        FROM vehicle_due_list d
+        JOIN vehicles v ON v.vehicle_id = d.vehicle_id
+        LEFT JOIN users u ON u.user_id = v.owner_user_id
+        WHERE d.due_date BETWEEN ? AND ?
+          {'AND d.reminded_at IS NULL' if unreminded_only else ''}
+        ORDER BY d.due_date
+    """, conn, params=(str(start_date), str(end_date)))
+    conn.close()
+    return vehicles_df
+
+def mark_due_reminded(c, vehicle_ids):
+    """Record that due reminders were sent (inside the transaction that queues them)"""
+    c.executemany("UPDATE vehicle_due_list SET reminded_at = CURRENT_TIMESTAMP WHERE vehicle_id = ?",
+                  [(vehicle_id,) for vehicle_id in vehicle_ids])